@@ -14,6 +14,8 @@ import logging
 from pathlib import Path
 from flask_babel import Babel
 from config import AppConfig
+from utils.uploads import UploadRequest
+from utils.output_store import output_store
 
 
 os.environ['OMP_THREAD_LIMIT'] = '1'  # Limite les threads d'OCR
@@ -70,6 +72,11 @@ def _check_opencv():
 def create_app():
     logger.info("Initialisation Flask...")
     app = Flask(__name__)
+    # Fichiers reçus en un seul passage : empreinte, format, taille (utils/uploads.py)
+    app.request_class = UploadRequest
+    # Fichiers produits conservés pour reprendre un téléchargement (utils/output_store.py),
+    # capturés avant les nettoyages after_this_request des routes
+    app.before_request(output_store.register)
  
     # ── Configuration ──────────────────────────────────────────────────────
     app.config.from_object(AppConfig)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Benchmark des opérations du moteur PDF sur un corpus synthétique.
+
+Mesure merge, split, rotate, compress, preview et create_zip sur les
+documents de benchmarks/corpus.py (pages de texte, multi-polices, photos,
+xref endommagée) : temps (meilleur et médian sur --repeat exécutions),
+pages par seconde et pic de RSS. Les résultats sont écrits en JSON, avec
+le commit mesuré, pour être comparés par benchmarks/compare.py.
+
+Les caches (documents analysés, vignettes) sont vidés avant chaque
+exécution : les temps mesurés sont ceux d'un premier passage. --warm les
+conserve pour mesurer le chemin du cache.
+
+Usage :
+    python benchmarks/bench_engine.py --scale quick --output bench.json
+    python benchmarks/bench_engine.py --ops merge,compress --repeat 5
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from config import AppConfig
+from utils.memory import PeakRSSTracker
+from blueprints.pdf.engine import PDFEngine
+from blueprints.pdf.document_cache import clear_cache, document_scope
+from blueprints.pdf.thumbnails import thumbnail_cache
+from benchmarks.corpus import SCALES, build_pdf, default_cases
+
+# Nombre de copies du document assemblées par la fusion
+MERGE_COPIES = 3
+PREVIEW_PAGES = 3
+
+
+def _op_merge(pdf_bytes, pages):
+    output, _ = PDFEngine.merge([pdf_bytes] * MERGE_COPIES)
+    return len(output), pages * MERGE_COPIES
+
+
+def _op_split(pdf_bytes, pages):
+    outputs = PDFEngine.split(pdf_bytes, "all")
+    return sum(len(o) for o in outputs), pages
+
+
+def _op_rotate(pdf_bytes, pages):
+    output, _, rotated = PDFEngine.rotate(pdf_bytes, 90, "odd")
+    return len(output), rotated
+
+
+def _op_compress(pdf_bytes, pages):
+    output, _ = PDFEngine.compress(pdf_bytes, "balanced")
+    return len(output), pages
+
+
+def _op_preview(pdf_bytes, pages):
+    previews, _ = PDFEngine.preview(pdf_bytes, max_pages=PREVIEW_PAGES)
+    return sum(len(p) for p in previews), len(previews)
+
+
+def _prepare_zip(pdf_bytes):
+    return PDFEngine.split(pdf_bytes, "all")
+
+
+def _op_create_zip(split_outputs, pages):
+    archive, _ = PDFEngine.create_zip(split_outputs)
+    return len(archive), pages
+
+
+# Opération -> (fonction mesurée, préparation hors mesure)
+OPERATIONS = {
+    "merge": (_op_merge, None),
+    "split": (_op_split, None),
+    "rotate": (_op_rotate, None),
+    "compress": (_op_compress, None),
+    "preview": (_op_preview, None),
+    "create_zip": (_op_create_zip, _prepare_zip),
+}
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def environment() -> dict:
+    return {
+        "commit": _git("rev-parse", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "app_version": AppConfig.VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def run_case(case, pdf_bytes: bytes, operation: str, repeat: int, warm: bool) -> dict:
+    func, prepare = OPERATIONS[operation]
+    payload = prepare(pdf_bytes) if prepare else pdf_bytes
+
+    timings, peaks, deltas = [], [], []
+    output_bytes = pages_done = 0
+    for _ in range(repeat):
+        if not warm:
+            clear_cache()
+            thumbnail_cache.clear()
+        gc.collect()
+        # Hors requête, le cache des documents n'a de portée que fixée ici
+        with document_scope("benchmark" if warm else None), PeakRSSTracker(operation) as tracker:
+            output_bytes, pages_done = func(payload, case.pages)
+        timings.append(tracker.duration)
+        peaks.append(tracker.peak_rss_mb)
+        deltas.append(tracker.delta_mb)
+
+    best = min(timings)
+    return {
+        "case": case.name,
+        "family": case.family,
+        "operation": operation,
+        "pages": pages_done,
+        "input_bytes": len(pdf_bytes),
+        "output_bytes": output_bytes,
+        "wall_time_s": round(best, 4),
+        "median_time_s": round(statistics.median(timings), 4),
+        "pages_per_s": round(pages_done / best, 1) if best > 0 else None,
+        "peak_rss_mb": round(max(peaks), 1),
+        "delta_rss_mb": round(max(deltas), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="default")
+    parser.add_argument("--ops", default=",".join(OPERATIONS),
+                        help="opérations séparées par des virgules")
+    parser.add_argument("--cases", default="",
+                        help="familles à mesurer (text,fonts,images,damaged), toutes par défaut")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warm", action="store_true", help="conserver les caches entre exécutions")
+    parser.add_argument("--output", default="", help="fichier JSON de résultats")
+    args = parser.parse_args()
+    # Les avertissements de réparation (xref endommagée) sont attendus
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+
+    operations = [op.strip() for op in args.ops.split(",") if op.strip()]
+    unknown = [op for op in operations if op not in OPERATIONS]
+    if unknown:
+        parser.error(f"opération(s) inconnue(s) : {', '.join(unknown)}")
+    families = {f.strip() for f in args.cases.split(",") if f.strip()}
+    cases = [c for c in default_cases(args.scale) if not families or c.family in families]
+
+    results = []
+    print(f"{'cas':<18}{'opération':<12}{'pages':>7}{'temps (s)':>11}{'pages/s':>10}{'pic RSS':>10}")
+    for case in cases:
+        start = time.perf_counter()
+        pdf_bytes = build_pdf(case)
+        print(f"# {case.name} : {len(pdf_bytes):,} octets, généré en {time.perf_counter() - start:.1f}s")
+        for operation in operations:
+            result = run_case(case, pdf_bytes, operation, args.repeat, args.warm)
+            results.append(result)
+            print(f"{case.name:<18}{operation:<12}{result['pages']:>7}{result['wall_time_s']:>11.3f}"
+                  f"{result['pages_per_s'] or 0:>10.1f}{result['peak_rss_mb']:>8.1f}MB")
+
+    report = {
+        "environment": environment(),
+        "settings": {"scale": args.scale, "repeat": args.repeat, "warm": args.warm},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Résultats écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la division PDF : ressources élaguées vs copie complète.
+
+Génère un PDF dont toutes les pages partagent un unique dictionnaire
+/Resources (cas typique des exports bureautiques et des scanners), puis
+compare PDFEngine.split(mode="all") avec et sans élagage :
+taille totale des sorties et temps d'exécution.
+
+Usage :
+    python benchmarks/bench_split.py --pages 300 --images 40
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DictionaryObject, NameObject
+from reportlab.pdfgen import canvas
+from reportlab.lib.utils import ImageReader
+
+from blueprints.pdf.engine import PDFEngine
+
+
+def build_shared_resources_pdf(pages: int, images: int, seed: int = 0) -> bytes:
+    """PDF de `pages` pages dont le dictionnaire /Resources est commun à toutes"""
+    rnd = random.Random(seed)
+    pictures = [
+        Image.frombytes("RGB", (160, 160), bytes(rnd.getrandbits(8) for _ in range(160 * 160 * 3)))
+        for _ in range(images)
+    ]
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer)
+    for i in range(pages):
+        c.setFont(["Helvetica", "Times-Roman", "Courier"][i % 3], 12)
+        c.drawString(72, 760, f"Page {i + 1}")
+        c.drawImage(ImageReader(pictures[i % images]), 72, 500, 160, 160)
+        c.showPage()
+    c.save()
+
+    # Fusion de toutes les ressources dans un seul objet partagé
+    reader = PdfReader(io.BytesIO(buffer.getvalue()))
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+
+    shared = DictionaryObject()
+    for page in writer.pages:
+        for category, entries in page["/Resources"].items():
+            entries = entries.get_object()
+            if isinstance(entries, DictionaryObject):
+                target = shared.setdefault(NameObject(category), DictionaryObject())
+                for name in entries:
+                    target[NameObject(name)] = entries.raw_get(name)
+            else:
+                shared[NameObject(category)] = entries
+    shared_ref = writer._add_object(shared)
+    for page in writer.pages:
+        page[NameObject("/Resources")] = shared_ref
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def run(pdf_bytes: bytes, prune: bool, repeat: int) -> dict:
+    best = None
+    total_bytes = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = PDFEngine.split(pdf_bytes, "all", prune=prune)
+        elapsed = time.perf_counter() - start
+        total_bytes = sum(len(o) for o in outputs)
+        best = elapsed if best is None else min(best, elapsed)
+    return {"files": len(outputs), "total_bytes": total_bytes, "wall_time_s": round(best, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pdf_bytes = build_shared_resources_pdf(args.pages, args.images)
+    print(f"Source : {args.pages} pages, {args.images} images, {len(pdf_bytes):,} octets")
+
+    baseline = run(pdf_bytes, prune=False, repeat=args.repeat)
+    pruned = run(pdf_bytes, prune=True, repeat=args.repeat)
+
+    print(f"{'mode':<10}{'fichiers':>10}{'octets':>16}{'temps (s)':>12}")
+    for label, result in (("complet", baseline), ("élagué", pruned)):
+        print(f"{label:<10}{result['files']:>10}{result['total_bytes']:>16,}{result['wall_time_s']:>12}")
+    ratio = baseline["total_bytes"] / max(1, pruned["total_bytes"])
+    print(f"Réduction : x{ratio:.1f} sur la taille totale des sorties")
+
+
+if __name__ == "__main__":
+    main()
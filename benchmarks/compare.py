@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Comparaison de deux résultats de benchmarks/bench_engine.py.
+
+Affiche, pour chaque couple (cas, opération) présent dans les deux
+fichiers, l'évolution du temps et du pic de RSS. Une hausse au-delà du
+seuil (--threshold, 10 % par défaut) est signalée comme régression et
+le code de sortie vaut 1, pour un usage en intégration continue.
+
+Usage :
+    python benchmarks/compare.py avant.json apres.json --threshold 0.15
+"""
+
+import sys
+import json
+import argparse
+
+# En deçà, les écarts de temps relèvent du bruit de mesure
+MIN_SIGNIFICANT_S = 0.005
+# Idem pour la mémoire : écarts absolus inférieurs ignorés
+MIN_SIGNIFICANT_MB = 2.0
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    report["by_key"] = {(r["case"], r["operation"]): r for r in report["results"]}
+    return report
+
+
+def _change(before, after):
+    if not before:
+        return None
+    return (after - before) / before
+
+
+def _format_change(change) -> str:
+    return "n/a" if change is None else f"{change * 100:+.1f}%"
+
+
+def compare(before: dict, after: dict, threshold: float):
+    """Retourne les lignes de comparaison et la liste des régressions"""
+    rows, regressions = [], []
+    for key in sorted(before["by_key"].keys() & after["by_key"].keys()):
+        old, new = before["by_key"][key], after["by_key"][key]
+        time_change = _change(old["wall_time_s"], new["wall_time_s"])
+        rss_change = _change(old["delta_rss_mb"], new["delta_rss_mb"])
+
+        flags = []
+        if (time_change is not None and time_change > threshold
+                and new["wall_time_s"] - old["wall_time_s"] > MIN_SIGNIFICANT_S):
+            flags.append("temps")
+        if (rss_change is not None and rss_change > threshold
+                and new["delta_rss_mb"] - old["delta_rss_mb"] > MIN_SIGNIFICANT_MB):
+            flags.append("mémoire")
+        if flags:
+            regressions.append((key, flags))
+        rows.append((key, old, new, time_change, rss_change, flags))
+    return rows, regressions
+
+
+def _label(report: dict) -> str:
+    env = report.get("environment", {})
+    commit = (env.get("commit") or "?")[:10]
+    return f"{commit}{' (modifié)' if env.get('dirty') else ''}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="hausse relative tolérée (0.10 = 10 %%)")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    print(f"Avant : {_label(before)}    Après : {_label(after)}")
+    if before.get("settings") != after.get("settings"):
+        print(f"⚠️ Réglages différents : {before.get('settings')} / {after.get('settings')}")
+
+    rows, regressions = compare(before, after, args.threshold)
+    print(f"{'cas':<18}{'opération':<12}{'avant (s)':>11}{'après (s)':>11}{'écart':>9}"
+          f"{'Δ RSS avant':>13}{'après':>8}{'écart':>9}")
+    for (case, operation), old, new, time_change, rss_change, flags in rows:
+        marker = "  ◀ " + ", ".join(flags) if flags else ""
+        print(f"{case:<18}{operation:<12}{old['wall_time_s']:>11.3f}{new['wall_time_s']:>11.3f}"
+              f"{_format_change(time_change):>9}{old['delta_rss_mb']:>11.1f}MB"
+              f"{new['delta_rss_mb']:>6.1f}MB{_format_change(rss_change):>9}{marker}")
+
+    missing = before["by_key"].keys() ^ after["by_key"].keys()
+    if missing:
+        print(f"{len(missing)} mesure(s) présentes dans un seul fichier, ignorées")
+
+    if regressions:
+        print(f"❌ {len(regressions)} régression(s) au-delà de {args.threshold * 100:.0f} %")
+        sys.exit(1)
+    print("✅ Aucune régression")
+
+
+if __name__ == "__main__":
+    main()
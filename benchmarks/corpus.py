@@ -0,0 +1,133 @@
+"""
+Corpus synthétique pour les benchmarks, généré localement avec reportlab.
+
+Chaque document est décrit par un CorpusCase : nombre de pages, images par
+page, polices utilisées et, éventuellement, une table xref endommagée. Les
+documents sont déterministes (graine fixe) : deux exécutions sur deux
+commits mesurent exactement les mêmes octets.
+
+Familles disponibles :
+    text      texte seul, une police standard
+    fonts     texte multi-polices, dont des TrueType incorporées (Vera)
+    images    pages de photos (bruit + dégradé, incompressibles sans perte)
+    damaged   document texte dont le startxref ne désigne plus la table xref
+"""
+
+import io
+import re
+import random
+from dataclasses import dataclass
+from typing import Dict, List
+
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+STANDARD_FONTS = ["Helvetica", "Times-Roman", "Courier", "Helvetica-Bold", "Times-Italic"]
+# Polices TrueType livrées avec reportlab : incorporées (sous-ensembles) au PDF
+TRUETYPE_FONTS = {"Vera": "Vera.ttf", "VeraBd": "VeraBd.ttf", "VeraIt": "VeraIt.ttf", "VeraBI": "VeraBI.ttf"}
+
+LOREM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, "
+    "quis nostrud exercitation ullamco laboris nisi ut aliquip ex ea commodo."
+).split()
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+
+# Tailles prédéfinies : nombre de pages par famille
+SCALES = {
+    "quick": {"text": 20, "fonts": 20, "images": 5, "damaged": 20},
+    "default": {"text": 200, "fonts": 100, "images": 30, "damaged": 100},
+    "large": {"text": 2000, "fonts": 500, "images": 150, "damaged": 500},
+}
+
+
+@dataclass(frozen=True)
+class CorpusCase:
+    name: str
+    family: str
+    pages: int
+    images_per_page: int = 0
+    fonts: int = 1
+    damaged: bool = False
+
+
+def _register_truetype_fonts() -> List[str]:
+    registered = set(pdfmetrics.getRegisteredFontNames())
+    for name, filename in TRUETYPE_FONTS.items():
+        if name not in registered:
+            pdfmetrics.registerFont(TTFont(name, filename))
+    return list(TRUETYPE_FONTS)
+
+
+def _photo(rnd: random.Random, size: int) -> Image.Image:
+    """Image photographique : dégradé et bruit, plus de 256 couleurs"""
+    gradient = Image.linear_gradient("L").resize((size, size))
+    noise = Image.frombytes("RGB", (size, size), rnd.randbytes(size * size * 3))
+    base = Image.merge("RGB", (gradient, gradient.rotate(90), gradient.rotate(180)))
+    return Image.blend(base, noise, 0.25)
+
+
+def _paragraph(rnd: random.Random, words: int) -> str:
+    return " ".join(rnd.choice(LOREM) for _ in range(words))
+
+
+def _corrupt_startxref(data: bytes) -> bytes:
+    """Décale le dernier startxref : les lecteurs doivent reconstruire la table"""
+    match = list(_STARTXREF.finditer(data))[-1]
+    start, end = match.span(1)
+    wrong = str(int(match.group(1)) // 2).rjust(end - start, "0").encode()
+    return data[:start] + wrong + data[end:]
+
+
+def build_pdf(case: CorpusCase, seed: int = 0) -> bytes:
+    """Génère le document décrit par `case`"""
+    rnd = random.Random(f"{case.name}:{seed}")
+    fonts = STANDARD_FONTS[:max(1, min(case.fonts, len(STANDARD_FONTS)))]
+    if case.fonts > len(STANDARD_FONTS):
+        fonts = fonts + _register_truetype_fonts()[:case.fonts - len(STANDARD_FONTS)]
+
+    # Jeu de 8 photos au plus, partagées entre les pages (reportlab
+    # n'incorpore qu'une fois chaque ImageReader), comme un export bureautique
+    photos = [ImageReader(_photo(rnd, 600)) for _ in range(min(8, case.images_per_page * case.pages))]
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pageCompression=1)
+    width, height = c._pagesize
+    for i in range(case.pages):
+        y = height - 72
+        c.setFont(fonts[0], 14)
+        c.drawString(72, y, f"{case.name} — page {i + 1}/{case.pages}")
+        y -= 28
+        for line in range(40 if not case.images_per_page else 6):
+            c.setFont(fonts[(i + line) % len(fonts)], 9)
+            c.drawString(72, y, _paragraph(rnd, 14))
+            y -= 12
+        for k in range(case.images_per_page):
+            photo = photos[(i * case.images_per_page + k) % len(photos)]
+            side = (width - 144) / 2
+            x = 72 + (k % 2) * side
+            top = y - 10 - (k // 2) * side
+            c.drawImage(photo, x, top - side, side, side)
+        c.showPage()
+    c.save()
+
+    data = buffer.getvalue()
+    return _corrupt_startxref(data) if case.damaged else data
+
+
+def default_cases(scale: str = "default") -> List[CorpusCase]:
+    pages = SCALES[scale]
+    return [
+        CorpusCase(f"text_{pages['text']}p", "text", pages["text"]),
+        CorpusCase(f"fonts_{pages['fonts']}p", "fonts", pages["fonts"], fonts=9),
+        CorpusCase(f"images_{pages['images']}p", "images", pages["images"], images_per_page=4),
+        CorpusCase(f"damaged_{pages['damaged']}p", "damaged", pages["damaged"], damaged=True),
+    ]
+
+
+def build_corpus(cases: List[CorpusCase], seed: int = 0) -> Dict[CorpusCase, bytes]:
+    return {case: build_pdf(case, seed) for case in cases}
@@ -10,6 +10,8 @@ from datetime import datetime
 from flask import Blueprint, session, request, flash, redirect, url_for, render_template, current_app, jsonify
 
 from utils.cache import SimpleCache
+from utils.result_cache import result_cache
+from utils.model_cache import model_cache
 from managers.contact_manager import ContactManager
 from managers.rating_manager import RatingManager
 from managers.stats_manager import StatisticsManager
@@ -219,6 +221,11 @@ def admin_dashboard():
                 "total_splits": stats_manager.get_stat("splits", 0),
                 "total_rotations": stats_manager.get_stat("rotations", 0),
                 "total_compressions": stats_manager.get_stat("compressions", 0),
+
+                # Cache des résultats (processus courant)
+                "result_cache": result_cache.stats(),
+                # Cache des réponses du modèle de vision (processus courant)
+                "model_cache": model_cache.stats(),
             }
             
             # Mise en cache
@@ -318,7 +325,9 @@ def dashboard_api():
                 "rotations": stats_manager.get_stat("rotations", 0),
                 "compressions": stats_manager.get_stat("compressions", 0)
             }
-        }
+        },
+        "result_cache": result_cache.stats(),
+        "model_cache": model_cache.stats()
     }
     
     return jsonify(data)
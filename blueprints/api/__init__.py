@@ -10,4 +10,4 @@ api_bp = Blueprint(
     url_prefix='/api'
 )
 
-from . import routes
\ No newline at end of file
+from . import routes, jobs, uploads, outputs
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Routes API des tâches asynchrones : soumission, suivi, téléchargement.
+
+    POST /api/jobs                     operation=<type> + fichiers et options
+    GET  /api/jobs/<job_id>            état et progression
+    GET  /api/jobs/<job_id>/download   résultat
+"""
+
+from flask import jsonify, request, send_file, url_for
+
+from . import api_bp
+from managers.job_manager import DONE, FINISHED, enqueue_request, job_manager
+
+# Opérations du blueprint PDF acceptées par POST /api/jobs
+PDF_OPERATIONS = {
+    "merge": "pdf.merge",
+    "split": "pdf.split",
+    "rotate": "pdf.rotate",
+    "compress": "pdf.compress",
+}
+
+
+def _operation_path(operation: str):
+    """Route qui exécutera l'opération, None si elle est inconnue"""
+    if operation in PDF_OPERATIONS:
+        return url_for(PDF_OPERATIONS[operation])
+    from blueprints.conversion import CONVERSION_MAP
+    if operation in CONVERSION_MAP:
+        return url_for("conversion.universal_converter", conversion_type=operation)
+    return None
+
+
+def _job_payload(job: dict) -> dict:
+    payload = job_manager.public(job)
+    payload["status_url"] = url_for("api.job_status", job_id=job["id"])
+    if job["status"] == DONE:
+        payload["download_url"] = url_for("api.job_download", job_id=job["id"])
+    return payload
+
+
+@api_bp.route("/jobs", methods=["POST"])
+def job_submit():
+    """Met en file une opération, quelle que soit la taille des fichiers"""
+    operation = (request.form.get("operation") or "").strip()
+    path = _operation_path(operation)
+    if path is None:
+        return jsonify({"error": f"Opération inconnue : '{operation}'"}), 400
+    if not request.files:
+        return jsonify({"error": "Aucun fichier"}), 400
+    return enqueue_request(operation, path)
+
+
+@api_bp.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Tâche inconnue ou expirée"}), 404
+    response = jsonify(_job_payload(job))
+    response.headers["Cache-Control"] = "no-store"
+    if job["status"] not in FINISHED:
+        response.headers["Retry-After"] = "2"
+    return response
+
+
+@api_bp.route("/jobs/<job_id>/download", methods=["GET"])
+def job_download(job_id):
+    path = job_manager.result_path(job_id)
+    if path is None:
+        job = job_manager.get(job_id)
+        if job is None:
+            return jsonify({"error": "Tâche inconnue ou expirée"}), 404
+        return jsonify({"error": "Résultat non disponible", "status": job["status"]}), 409
+
+    result = job_manager.get(job_id)["result"]
+    return send_file(
+        path,
+        mimetype=result["mimetype"],
+        as_attachment=True,
+        download_name=result["filename"],
+        conditional=True,
+        max_age=0,
+    )
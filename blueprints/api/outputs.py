@@ -0,0 +1,39 @@
+"""
+Route API des fichiers produits, conservés AppConfig.OUTPUT_RETENTION secondes.
+
+    GET /api/outputs/<output_id>   fichier (Range, If-Range, If-None-Match)
+
+L'adresse figure dans l'en-tête Content-Location de la réponse d'origine :
+un téléchargement interrompu reprend sans refaire la conversion.
+"""
+
+from flask import jsonify, send_file
+
+from . import api_bp
+from utils.output_store import output_store
+
+
+@api_bp.route("/outputs/<output_id>", methods=["GET"])
+def output_download(output_id):
+    output = output_store.get(output_id)
+    if output is None:
+        return jsonify({"error": "Fichier inconnu ou expiré"}), 404
+    if output["path"] is None:
+        # Copie en cours d'écriture (client interrompu pendant l'envoi d'origine)
+        response = jsonify({"error": "Fichier en cours de préparation"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "2"
+        return response
+
+    response = send_file(
+        output["path"],
+        mimetype=output["mimetype"],
+        as_attachment=True,
+        download_name=output["filename"],
+        etag=output["etag"],
+        conditional=True,
+        max_age=0,
+    )
+    response.headers.update(output["headers"])
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
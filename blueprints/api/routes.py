@@ -2,7 +2,7 @@
 Routes API pour les opérations PDF
 """
 
-from flask import Blueprint, request, jsonify, current_app, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, request, jsonify, url_for
 from flask_babel import gettext as _
 from pathlib import Path
 import json
@@ -10,7 +10,7 @@ import os
 from datetime import datetime
 import base64
 from . import api_bp
-from blueprints.pdf.engine import PDFEngine
+from blueprints.pdf import thumbnails
 from config import AppConfig
 from managers import stats_manager
 from managers.stats_manager import StatisticsManager  # Importez l'instance
@@ -161,16 +161,40 @@ def api_preview():
         except (base64.binascii.Error, TypeError):
             return jsonify({"error": "Format Base64 invalide"}), 400
         
-        # Génération des aperçus
-        previews, total_pages = PDFEngine.preview(pdf_bytes)
+        if not pdf_bytes.startswith(b"%PDF"):
+            return jsonify({"error": "Fichier non-PDF"}), 400
+
+        width = thumbnails.thumbnail_width(data.get("width"))
+        fmt = thumbnails.thumbnail_format(data.get("format"))
+
+        # Vignettes des premières pages ; les autres à la demande
+        document_id, total_pages = thumbnails.register_document(pdf_bytes)
+        previews = [
+            base64.b64encode(thumbnails.render_thumbnail(document_id, i, width, fmt)).decode()
+            for i in range(min(3, total_pages))
+        ]
         stats_manager.increment("previews")
         
         return jsonify({
             "success": True,
+            "document_id": document_id,
+            "format": fmt,
+            "width": width,
             "previews": previews,
+            "pages": [
+                url_for("pdf.preview_page", document_id=document_id, page=i + 1,
+                        width=width, format=fmt)
+                for i in range(total_pages)
+            ],
             "total_pages": total_pages
         })
     
+    except thumbnails.PreviewUnavailable:
+        return jsonify({"error": "Aperçu indisponible"}), 503
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,121 @@
+"""
+Routes API des envois fractionnés reprenables.
+
+    POST   /api/uploads                          filename, size, sha256 (facultatif)
+    PUT    /api/uploads/<upload_id>/chunks/<n>   corps brut du morceau n, en-tête X-Chunk-SHA256
+    GET    /api/uploads/<upload_id>              morceaux reçus et manquants
+    POST   /api/uploads/<upload_id>/finalize     assemblage vérifié
+    DELETE /api/uploads/<upload_id>
+    HEAD   /api/blobs/<sha256>                   fichier déjà envoyé par ce client ? (GET : description)
+
+Un envoi finalisé s'utilise ensuite avec le champ upload_id à la place du
+fichier, un fichier déjà présent avec le champ blob=<sha256> :
+POST /pdf/compress, /conversion/<type>, /api/jobs...
+"""
+
+from flask import jsonify, request, url_for
+
+from . import api_bp
+from managers.upload_manager import UploadError, upload_manager
+from utils.blob_store import blob_store
+from utils.uploads import client_id
+
+
+def _error(error: UploadError):
+    payload = {"error": str(error)}
+    payload.update(error.details)
+    response = jsonify(payload)
+    response.status_code = error.status
+    if "retry_after" in error.details:
+        response.headers["Retry-After"] = str(error.details["retry_after"])
+    return response
+
+
+def _payload(upload: dict) -> dict:
+    upload["status_url"] = url_for("api.upload_status", upload_id=upload["upload_id"])
+    if not upload["finalized"]:
+        # Gabarit : {index} à remplacer par le numéro du morceau
+        upload["chunk_url"] = upload["status_url"] + "/chunks/{index}"
+        upload["finalize_url"] = url_for("api.upload_finalize", upload_id=upload["upload_id"])
+    return upload
+
+
+@api_bp.route("/uploads", methods=["POST"])
+def upload_create():
+    """Ouvre un envoi ; le client découpe le fichier en morceaux de `chunk_size` octets"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        size = int(data.get("size", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Taille invalide"}), 400
+    try:
+        upload = upload_manager.create((data.get("filename") or "").strip(), size, data.get("sha256") or None,
+                                       client=request.remote_addr)
+    except UploadError as e:
+        return _error(e)
+
+    response = jsonify(_payload(upload))
+    response.status_code = 201
+    response.headers["Location"] = upload["status_url"]
+    return response
+
+
+@api_bp.route("/uploads/<upload_id>/chunks/<int:index>", methods=["PUT"])
+def upload_chunk(upload_id, index):
+    """Morceau lu en flux depuis le corps de la requête, sans analyse multipart"""
+    try:
+        upload = upload_manager.write_chunk(upload_id, index, request.stream, request.headers.get("X-Chunk-SHA256"))
+    except UploadError as e:
+        return _error(e)
+    return jsonify(_payload(upload))
+
+
+@api_bp.route("/uploads/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    try:
+        upload = upload_manager.status(upload_id)
+    except UploadError as e:
+        return _error(e)
+    response = jsonify(_payload(upload))
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+@api_bp.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def upload_finalize(upload_id):
+    try:
+        upload = upload_manager.finalize(upload_id, client_id())
+    except UploadError as e:
+        return _error(e)
+    return jsonify(_payload(upload))
+
+
+@api_bp.route("/uploads/<upload_id>", methods=["DELETE"])
+def upload_delete(upload_id):
+    try:
+        upload_manager.delete(upload_id)
+    except UploadError as e:
+        return _error(e)
+    return "", 204
+
+
+@api_bp.route("/blobs/<digest>", methods=["GET"])
+def blob_status(digest):
+    """
+    200 si ce client a envoyé un fichier d'empreinte `digest`, encore
+    conservé (à désigner par blob=<sha256>), 404 sinon
+    """
+    digest = digest.lower()
+    owner = client_id(create=False)
+    entry = blob_store.lookup(digest, owner) if owner else None
+    if entry is None:
+        response = jsonify({"error": "Fichier inconnu ou expiré"})
+        response.status_code = 404
+    else:
+        response = jsonify({
+            "sha256": digest,
+            "size": entry["size"],
+            "format": entry.get("format"),
+        })
+    response.headers["Cache-Control"] = "no-store"
+    return response
@@ -15,19 +15,38 @@ import tempfile, os, traceback
 import logging
 import importlib
 import subprocess
+import uuid
 from io import BytesIO
+from contextlib import ExitStack
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
 from typing import Optional, Dict, List, Any, Tuple, Union
 from utils.json_utils import safe_json_loads
+from utils.zip_stream import iter_zip, zip_response
+from utils.page_ranges import PageSelection, compile_pages
+from utils.page_scheduler import map_pages
+from utils.text_layer import native_pages
+from managers.job_manager import enqueue_request, report_progress, should_enqueue
+from utils.admission import AdmissionRejected, admission, rejection_response
+from utils.uploads import spooled, upload_path, upload_stream
+from utils.result_cache import result_cache, result_key
+from utils.model_cache import model_cache, model_key
+from utils.page_encoder import encode_page
+from utils.singleflight import single_flight
+from utils.process_pool import WorkerCrashed, process_pool
+from utils.memory import PeakRSSTracker
 
 os.environ["OMP_THREAD_LIMIT"] = "1"
 
 # ── Flask ────────────────────────────────────────────────────────────────────
-from flask import (Blueprint, after_this_request, render_template, request,
-                   jsonify, make_response, send_file, flash, redirect, url_for, current_app)
+from flask import (Blueprint, Flask, after_this_request, render_template, request,
+                   jsonify, make_response, send_file, flash, redirect, url_for, current_app,
+                   Response, g, has_request_context)
+from werkzeug.datastructures import FileStorage, ImmutableMultiDict
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+from flask_babel import Babel, get_locale
 from flask_babel import gettext as _babel_gettext   # ✅ alias pour éviter écrasement par _
 
 # ── Alias global sûr — NE JAMAIS utiliser _ comme variable muette ────────────
@@ -153,7 +172,7 @@ except ImportError:
 
 # ✅ pdf2image
 try:
-    from pdf2image import convert_from_bytes, convert_from_path
+    from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_path
     HAS_PDF2IMAGE = True
 except ImportError:
     HAS_PDF2IMAGE = False
@@ -633,6 +652,19 @@ CONVERSION_MAP = {
         'deps': ['pandas']
     },
 }
+
+# Conversions page par page via Gemini, OCR ou LibreOffice : mises en file
+# dès que le client accepte une réponse asynchrone, quelle que soit la taille
+LONG_RUNNING_CONVERSIONS = {
+    'word-en-pdf', 'excel-en-pdf', 'powerpoint-en-pdf',
+    'pdf-en-word', 'pdf-en-doc', 'pdf-en-excel', 'pdf-en-ppt', 'pdf-en-html', 'pdf-en-txt',
+    'image-en-word', 'image-en-excel', 'redact-pdf', 'prepare-form',
+}
+# Résultats non reproductibles (réponse du modèle, horodatage de signature) :
+# jamais servis depuis le cache des résultats
+UNCACHED_CONVERSIONS = {
+    'pdf-en-excel', 'pdf-en-html', 'pdf-en-txt', 'image-en-word', 'image-en-excel', 'sign-pdf',
+}
 # =========================
 # ROUTES
 # =========================
@@ -804,6 +836,19 @@ def handle_conversion_request(conversion_type, request, config):
     current_app.logger.info(f"=== FORM KEYS: {list(request.form.keys())} ===")
     current_app.logger.info(f"=== CONTENT-TYPE: {request.content_type} ===")
 
+    # Clé du résultat : cache des résultats et regroupement des requêtes identiques
+    cache_key = None
+    uploaded = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if uploaded:
+        cache_key = result_key(conversion_type, uploaded, request.form)
+        if conversion_type not in UNCACHED_CONVERSIONS:
+            entry = result_cache.get(cache_key)
+            if entry:
+                return result_cache.send(cache_key, entry)
+
+    if should_enqueue(request, long_running=conversion_type in LONG_RUNNING_CONVERSIONS):
+        return enqueue_request(conversion_type)
+
     try:
         if config['max_files'] > 1:
             # ✅ Chercher 'files' ET 'file' pour couvrir les deux cas
@@ -822,7 +867,7 @@ def handle_conversion_request(conversion_type, request, config):
                 flash(error['error'], 'error')
                 return redirect(request.url)
 
-            result = process_conversion(conversion_type, files=files, form_data=request.form)
+            result = run_conversion(conversion_type, cache_key, files, multiple=True)
 
         else:
             # ✅ Chercher 'file' ET 'files' pour couvrir les deux cas
@@ -846,7 +891,7 @@ def handle_conversion_request(conversion_type, request, config):
                     flash(f"Type de fichier non supporté. Formats acceptés: {config['accept']}", 'error')
                     return redirect(request.url)
 
-            result = process_conversion(conversion_type, file=file, form_data=request.form)
+            result = run_conversion(conversion_type, cache_key, [file])
 
         if isinstance(result, dict) and 'error' in result:
             flash(result['error'], 'error')
@@ -854,11 +899,125 @@ def handle_conversion_request(conversion_type, request, config):
 
         return result
 
+    except AdmissionRejected as e:
+        current_app.logger.warning(f"Conversion {conversion_type} refusée : {e}")
+        return rejection_response(e)
+
+    except (WorkerCrashed, TimeoutError) as e:
+        current_app.logger.error(f"Conversion {conversion_type} interrompue : {e}")
+        return jsonify({'error': str(e)}), 503
+
     except Exception as e:
         current_app.logger.error(f"Erreur conversion {conversion_type}: {str(e)}\n{traceback.format_exc()}")
         flash(f'Erreur lors de la conversion: {str(e)}', 'error')
         return redirect(request.url)
 
+def run_conversion(conversion_type, cache_key, uploads, multiple=False):
+    """
+    Exécute la conversion dans un processus du pool, sous contrôle
+    d'admission, et envoie le fichier produit. Les requêtes identiques
+    (même clé) arrivées pendant l'exécution en attendent le résultat au lieu
+    de lancer leur propre conversion.
+    """
+    def convert():
+        inputs = [(str(upload_path(f)), f.filename, f.content_type) for f in uploads]
+        options = list(request.form.items(multi=True))
+        output_dir = AppConfig.get_conversion_temp_dir()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / f"{uuid.uuid4().hex}_{conversion_type}.out"
+        try:
+            estimate = admission.estimate_upload(conversion_type, uploads, request.form)
+            with admission.admit(conversion_type, estimate) as ticket:
+                outcome = process_pool.run(
+                    convert_paths, conversion_type, inputs, output_path, options,
+                    multiple=multiple, locale=str(get_locale() or "fr"),
+                    progress=report_progress,
+                )
+                ticket.record(outcome["delta_rss_mb"] if outcome["isolated"] else None)
+        except BaseException:
+            output_path.unlink(missing_ok=True)
+            raise
+        if "error" in outcome:
+            output_path.unlink(missing_ok=True)
+            return {'error': outcome["error"]}
+        result = _output_response(output_path, outcome)
+        if conversion_type not in UNCACHED_CONVERSIONS:
+            result = result_cache.capture(cache_key, result)
+        return result
+
+    return single_flight.run(cache_key, convert)
+
+def _output_response(output_path, outcome):
+    """Réponse envoyant le fichier écrit par convert_paths"""
+    stream = open(output_path, "rb")
+    # Fichier ouvert : il peut être supprimé, l'envoi lit le descripteur
+    output_path.unlink(missing_ok=True)
+    response = current_app.response_class(
+        wrap_file(request.environ, stream),
+        status=outcome["status"],
+        headers=outcome["headers"],
+        direct_passthrough=True,
+    )
+    response.content_length = os.fstat(stream.fileno()).st_size
+    return response
+
+_worker_app = None
+
+def _conversion_app():
+    """
+    Application minimale des processus du pool : les convertisseurs
+    s'appuient sur current_app (journal, send_file) et sur Babel
+    """
+    global _worker_app
+    if _worker_app is None:
+        app = Flask(__name__)
+        app.config['BABEL_DEFAULT_LOCALE'] = 'fr'
+        app.config['BABEL_TRANSLATION_DIRECTORIES'] = os.path.join(PROJECT_ROOT, 'translations')
+        Babel(app, locale_selector=lambda: g.get('locale', 'fr'))
+        _worker_app = app
+    return _worker_app
+
+def convert_paths(conversion_type, inputs, output_path, options=(), multiple=False, locale="fr"):
+    """
+    Point d'entrée chemin → chemin des conversions, exécuté dans un processus
+    du pool : `inputs` liste de (chemin, nom d'origine, type MIME), `options`
+    champs du formulaire. La réponse du convertisseur est écrite dans
+    `output_path`.
+
+    Retourne {"error": ...} ou le statut et les en-têtes de la réponse, avec
+    la mesure mémoire de la conversion (PeakRSSTracker.as_dict).
+    """
+    with ExitStack() as stack:
+        if not has_request_context():
+            stack.enter_context(_conversion_app().test_request_context())
+            g.locale = locale
+        files = [
+            FileStorage(stack.enter_context(open(path, "rb")), filename=filename, content_type=content_type)
+            for path, filename, content_type in inputs
+        ]
+        form_data = ImmutableMultiDict(options)
+        with PeakRSSTracker(conversion_type) as tracker:
+            if multiple:
+                result = process_conversion(conversion_type, files=files, form_data=form_data)
+            else:
+                result = process_conversion(conversion_type, file=files[0], form_data=form_data)
+            if isinstance(result, dict):
+                outcome = {'error': result.get('error') or 'Erreur de conversion'}
+            else:
+                response = make_response(result)
+                try:
+                    with open(output_path, "wb") as out:
+                        for chunk in response.iter_encoded():
+                            out.write(chunk)
+                finally:
+                    response.close()
+                outcome = {
+                    "status": response.status_code,
+                    "headers": [(k, v) for k, v in response.headers.items() if k != "Content-Length"],
+                }
+    outcome.update(tracker.as_dict())
+    return outcome
+
 def process_conversion(conversion_type, file=None, files=None, form_data=None):
     """Exécute la conversion appropriée selon le type."""
 
@@ -1795,27 +1954,22 @@ def convert_pdf_to_txt(file, form_data=None):
                 "=" * 80, "",
             ]
  
-        for page_num in range(1, total_pages + 1):
-            import gc
-            page_images = convert_from_path(
-                input_path, dpi=dpi,
-                first_page=page_num, last_page=page_num
-            )
-            if not page_images:
+        # Pages natives extraites sur place, les autres rendues en avance et
+        # envoyées à Gemini en parallèle ; une page en échec ou hors délai
+        # passe par l'extraction locale ci-dessous
+        for page_num, gemini_out, page_error in _map_pdf_pages(
+                input_path, total_pages, dpi,
+                lambda img: _gemini_extract_page_text(img, language), _native_sections):
+            if page_error is not None:
+                logger.warning(f"[PDF→TXT] page {page_num} : {page_error}")
+            elif gemini_out is None:
                 continue
  
-            pil_img = page_images[0]
-            del page_images
- 
             if add_markers:
                 lines_out.append(f"\n{'─' * 40}  PAGE {page_num}  {'─' * 40}\n")
  
-            gemini_out = _gemini_extract_page_text(_ensure_rgb(pil_img), language)
-            sections = gemini_out.get("sections", [])
- 
-            del pil_img
+            sections = (gemini_out or {}).get("sections", [])
             del gemini_out
-            gc.collect()
  
             if sections:
                 for section in sections:
@@ -1921,27 +2075,19 @@ footer { margin-top: 50px; border-top: 2px solid #1a3a6b; font-size: .8em; color
             f'<div style="font-size:.85em;color:#666">Converti le {datetime.now().strftime("%d/%m/%Y à %H:%M")} · {total_pages} page(s)</div></header>',
         ]
  
-        for page_num in range(1, total_pages + 1):
-            import gc
-            page_images = convert_from_path(
-                input_path, dpi=dpi,
-                first_page=page_num, last_page=page_num
-            )
-            if not page_images:
+        for page_num, gemini_out, page_error in _map_pdf_pages(
+                input_path, total_pages, dpi,
+                lambda img: _gemini_extract_page_html(img, language), _native_html_blocks):
+            if page_error is not None:
+                logger.warning(f"[PDF→HTML] page {page_num} : {page_error}")
+            elif gemini_out is None:
                 continue
  
-            pil_img = page_images[0]
-            del page_images
- 
             html_parts.append(f'<article class="page" id="page-{page_num}">')
             html_parts.append(f'<div style="margin-bottom:18px"><span class="page-number">Page {page_num} / {total_pages}</span></div>')
  
-            gemini_out = _gemini_extract_page_html(_ensure_rgb(pil_img), language)
-            blocks = gemini_out.get("html_blocks", [])
- 
-            del pil_img
+            blocks = (gemini_out or {}).get("html_blocks", [])
             del gemini_out
-            gc.collect()
  
             if blocks:
                 for block in blocks:
@@ -2097,22 +2243,19 @@ def convert_pdf_to_excel(file_input, original_filename="document.pdf", form_data
             total_pages = len(_pypdf.PdfReader(fh).pages)
  
         all_extracted_tables = []
- 
-        for page_num in range(1, total_pages + 1):
-            import gc
-            # Une seule page à la fois
-            imgs = convert_from_path(str(temp_pdf_path), dpi=150,
-                                     first_page=page_num, last_page=page_num)
-            if not imgs:
+        failed_pages = []
+ 
+        # Pages natives lues sur place ; les autres rendues en avance et
+        # envoyées à Gemini en parallèle, mémoire bornée à quelques pages
+        # (AppConfig.PAGE_INFLIGHT + AppConfig.PAGE_PREFETCH)
+        for page_num, gemini_output, page_error in _map_pdf_pages(
+                temp_pdf_path, total_pages, 150,
+                lambda img: get_table_from_gemini(img, language), _native_content):
+            if page_error is not None:
+                logger.warning(f"PDF→Excel : page {page_num} : {page_error}")
+                failed_pages.append(page_num)
                 continue
  
-            img = imgs[0]
-            del imgs
- 
-            gemini_output = get_table_from_gemini(img, language)
-            del img
-            gc.collect()
- 
             if gemini_output and "tables" in gemini_output and gemini_output["tables"]:
                 for table in gemini_output["tables"]:
                     all_extracted_tables.append({"page": page_num, "table_data": table})
@@ -2159,9 +2302,10 @@ def convert_pdf_to_excel(file_input, original_filename="document.pdf", form_data
                     worksheet.set_column(col_num, col_num, min(max_len, 50))
                 worksheet.freeze_panes(1, 0)
             pd.DataFrame({
-                "Propriété": ["Date", "Modèle", "Fichier", "Pages", "Tableaux"],
+                "Propriété": ["Date", "Modèle", "Fichier", "Pages", "Tableaux", "Pages non traitées"],
                 "Valeur": [now.strftime("%Y-%m-%d %H:%M:%S"), "Gemini 2.5 Flash",
-                           original_filename, total_pages, len(all_extracted_tables)]
+                           original_filename, total_pages, len(all_extracted_tables),
+                           ", ".join(map(str, failed_pages)) or "Aucune"]
             }).to_excel(writer, index=False, sheet_name="Résumé")
  
         del all_extracted_tables
@@ -2309,54 +2453,82 @@ def convert_pdf_to_images(file, form_data=None):
  
     try:
         input_path = secure_save(file, temp_dir)
-        pages = convert_from_path(input_path, dpi=dpi)
-        if not pages:
+        total_pages = int(pdfinfo_from_path(input_path).get("Pages", 0))
+        if not total_pages:
+            cleanup_temp_directory(temp_dir)
             return {"error": "Aucune page détectée"}
- 
-        zip_buf = BytesIO()
-        metadata = {"source": original, "pages": len(pages), "dpi": dpi, "format": fmt}
-        kept_imgs, kept_idx = [], []
-        pad = len(str(len(pages)))
- 
-        with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
-            for idx, img in enumerate(pages, 1):
-                work = _ensure_rgb(img)
-                # Détection page blanche
-                if rm_bk and _is_blank_page(work):
-                    continue
-                buf = BytesIO()
-                if fmt == "png":
-                    work.save(buf, "PNG", optimize=True)
-                elif fmt == "webp":
-                    work.save(buf, "WEBP", quality=qual)
+
+        metadata = {"source": original, "pages": total_pages, "dpi": dpi, "format": fmt}
+        pad = len(str(total_pages))
+
+        def _render(idx):
+            """Page idx encodée et sa vignette, None si vide ou blanche"""
+            rendered = convert_from_path(input_path, dpi=dpi, first_page=idx, last_page=idx)
+            if not rendered:
+                return None
+            work = _ensure_rgb(rendered[0])
+            # Détection page blanche
+            if rm_bk and _is_blank_page(work):
+                return None
+            buf = BytesIO()
+            if fmt == "png":
+                work.save(buf, "PNG", optimize=True)
+            elif fmt == "webp":
+                work.save(buf, "WEBP", quality=qual)
+            else:
+                work.save(buf, "JPEG", quality=qual, optimize=True)
+            thumb = None
+            if cs:
+                # Vignette seulement : la page pleine résolution est libérée
+                thumb = work.copy()
+                thumb.thumbnail((296, 380), Image.Resampling.LANCZOS)
+            return buf.getvalue(), thumb
+
+        # Première page rendue avant l'envoi de la réponse : un PDF que le
+        # moteur de rendu refuse produit une erreur, pas une archive tronquée
+        first = _render(1)
+
+        def _entries():
+            """Rend une page à la fois : chaque image part dans le ZIP dès qu'elle est prête"""
+            thumbs, kept_idx, failed = [], [], []
+            for idx in range(1, total_pages + 1):
+                if idx == 1:
+                    page = first
                 else:
-                    work.save(buf, "JPEG", quality=qual, optimize=True)
-                buf.seek(0)
-                zf.writestr(f"pages/page_{str(idx).zfill(pad)}.{fmt}", buf.getvalue())
-                kept_imgs.append(work)
+                    try:
+                        page = _render(idx)
+                    except Exception as e:
+                        # La réponse est partie : l'archive se termine normalement,
+                        # la page en échec est signalée dans les métadonnées
+                        logger.warning(f"PDF→Images : page {idx} non rendue : {e}")
+                        failed.append({"page": idx, "error": str(e)})
+                        continue
+                if page is None:
+                    continue
+                data, thumb = page
                 kept_idx.append(idx)
- 
-            # Contact sheet
-            if cs and kept_imgs:
-                cs_img = _build_contact_sheet(kept_imgs, kept_idx, cols=4)
-                cs_buf = BytesIO()
-                cs_img.save(cs_buf, "PNG", optimize=True)
-                cs_buf.seek(0)
-                zf.writestr("contact_sheet.png", cs_buf.getvalue())
- 
+                if thumb is not None:
+                    thumbs.append(thumb)
+                yield f"pages/page_{str(idx).zfill(pad)}.{fmt}", data
+
+            try:
+                # Contact sheet
+                if cs and thumbs:
+                    cs_img = _build_contact_sheet(thumbs, kept_idx, cols=4)
+                    cs_buf = BytesIO()
+                    cs_img.save(cs_buf, "PNG", optimize=True)
+                    yield "contact_sheet.png", cs_buf.getvalue()
+            except Exception as e:
+                logger.warning(f"PDF→Images : planche contact non produite : {e}")
+
             # Métadonnées JSON
             metadata["exported_pages"] = len(kept_idx)
-            zf.writestr("metadata.json", json.dumps(metadata, indent=2))
- 
-        zip_buf.seek(0)
- 
-        @after_this_request
-        def _cleanup(r):
-            cleanup_temp_directory(temp_dir); return r
- 
-        return send_file(zip_buf, mimetype="application/zip",
-                         as_attachment=True,
-                         download_name=Path(original).stem+"_images.zip")
+            if failed:
+                metadata["failed_pages"] = failed
+            yield "metadata.json", json.dumps(metadata, indent=2).encode()
+
+        return zip_response(iter_zip(_entries()), Path(original).stem + "_images.zip",
+                            on_close=lambda: cleanup_temp_directory(temp_dir))
  
     except Exception as e:
         cleanup_temp_directory(temp_dir)
@@ -2739,37 +2911,35 @@ def analyze_pdf_permissions_advanced(file, form_data=None):
     if not HAS_PYPDF:
         return {"error": "pypdf non installé"}
 
+    from blueprints.pdf.inspector import inspect_pdf
+
     try:
-        pdf_bytes = file.read()
-        pdf_stream = BytesIO(pdf_bytes)
-        pdf_stream.seek(0)
-        reader = pypdf.PdfReader(pdf_stream)
+        # Inspection rapide (en-tête, trailer) : version et chiffrement sans
+        # analyse complète ; le document n'est lu en entier que pour
+        # vérifier un mot de passe
+        info = inspect_pdf(upload_stream(file))
 
         report = {
             "filename": file.filename,
-            "encrypted": reader.is_encrypted,
+            "encrypted": info.encrypted,
             "requires_password": False,
             "password_valid": None,
             "encryption": {},
             "permissions": {},
-            "pdf_version": None
+            "pdf_version": f"%PDF-{info.version}" if info.version else "inconnue"
         }
 
-        # PDF version
-        try:
-            report["pdf_version"] = reader.pdf_header.decode("latin-1").strip()
-        except:
-            report["pdf_version"] = "inconnue"
-
         # -----------------------------
         # 1) Chiffrement
         # -----------------------------
-        if reader.is_encrypted:
+        if info.encrypted:
             password = form_data.get("password", "") if form_data else ""
             if not password:
                 report["requires_password"] = True
                 return report
 
+            reader = pypdf.PdfReader(upload_stream(file))
+
             # Essai user password
             res = reader.decrypt(password)
             if res not in (1, 2, True):
@@ -2820,8 +2990,7 @@ def analyze_pdf_permissions_advanced(file, form_data=None):
         # 2) Permissions
         # -----------------------------
         try:
-            encrypt_dict = reader.trailer.get("/Encrypt", {})
-            perms_raw = encrypt_dict.get("/P")
+            perms_raw = info.encryption.get("permissions")
             if perms_raw is None:
                 # PDF non protégé => toutes permissions
                 report["permissions"] = {k: True for k in [
@@ -2903,7 +3072,7 @@ def protect_pdf_advanced(file, form_data=None, return_report=False):
  
     original = file.filename
     try:
-        reader = pypdf.PdfReader(BytesIO(file.read()))
+        reader = pypdf.PdfReader(upload_stream(file))
         writer = pypdf.PdfWriter()
         for page in reader.pages:
             writer.add_page(page)
@@ -2942,8 +3111,7 @@ def unlock_pdf(file, form_data=None):
     password = form_data.get("password","")
  
     try:
-        pdf_bytes = file.read()
-        reader = pypdf.PdfReader(BytesIO(pdf_bytes))
+        reader = pypdf.PdfReader(upload_stream(file))
  
         if reader.is_encrypted:
             # Essai user password puis owner password
@@ -3096,13 +3264,15 @@ def cleanup_temp_directory(path: Optional[str]):
         shutil.rmtree(path, ignore_errors=True)
 
 def secure_save(file_obj, dest_dir: str) -> str:
-    """Sauvegarde sécurisée d'un FileStorage, retourne le chemin."""
+    """
+    Place un FileStorage dans dest_dir, retourne le chemin. Le fichier
+    reçu y est déplacé sans recopie (utils/uploads.py).
+    """
     name = secure_filename(file_obj.filename)
-    path = os.path.join(dest_dir, name)
-    file_obj.save(path)
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
+    upload = spooled(file_obj)
+    if upload.size == 0:
         raise ValueError(f"Fichier sauvegardé vide ou absent : {name}")
-    return path
+    return str(upload.claim(dest_dir, name))
 
 def _ensure_rgb(im: "Image.Image") -> "Image.Image":
     """
@@ -3121,6 +3291,104 @@ def _ensure_rgb(im: "Image.Image") -> "Image.Image":
         return bg
     return im.convert("RGB")
 
+
+def _pdf_page_renderer(input_path, dpi: int):
+    """Étage de rendu de map_pages : page n du PDF en RGB, None si vide"""
+    def render(page_num):
+        images = convert_from_path(str(input_path), dpi=dpi, first_page=page_num, last_page=page_num)
+        return _ensure_rgb(images[0]) if images else None
+    return render
+
+
+def _map_pdf_pages(input_path, total_pages: int, dpi: int, extract, local):
+    """
+    (page, résultat, erreur) pour chaque page du PDF, dans l'ordre. Les pages
+    à couche texte exploitable sont extraites sur place (local(blocs), voir
+    utils/text_layer.py) ; seules les autres sont rendues et confiées au
+    modèle (extract) via map_pages.
+    """
+    native = native_pages(input_path, range(1, total_pages + 1))
+    done_locally = len(native)
+    remote = map_pages(
+        extract, [n for n in range(1, total_pages + 1) if n not in native],
+        render=_pdf_page_renderer(input_path, dpi),
+        progress=lambda done, _: report_progress(done_locally + done, total_pages),
+    )
+    for page_num in range(1, total_pages + 1):
+        if page_num in native:
+            yield page_num, local(native.pop(page_num)), None
+        else:
+            yield next(remote)
+
+
+def _native_sections(blocks: list) -> dict:
+    """Blocs de la couche texte au format de _gemini_extract_page_text"""
+    sections = []
+    for block in blocks:
+        if block["type"] == "title":
+            sections.append({"type": "title", "text": block["text"]})
+        elif block["type"] == "paragraph":
+            sections.append({"type": "body", "text": block["text"]})
+        elif block["type"] == "list":
+            sections.append({"type": "list", "items": block["items"]})
+        elif block["type"] == "table":
+            lines = ["\t".join(row) for row in [block["header"]] + block["rows"]]
+            sections.append({"type": "table_text", "text": "\n".join(lines)})
+    return {"sections": sections}
+
+
+def _native_html_blocks(blocks: list) -> dict:
+    """Blocs de la couche texte au format de _gemini_extract_page_html"""
+    html_blocks = []
+    for block in blocks:
+        if block["type"] == "title":
+            html_blocks.append({"tag": f"h{block['level']}", "content": block["text"]})
+        elif block["type"] == "paragraph":
+            html_blocks.append({"tag": "p", "content": block["text"]})
+        elif block["type"] == "list":
+            html_blocks.append({"tag": "ol" if block["ordered"] else "ul", "items": block["items"]})
+        elif block["type"] == "table":
+            html_blocks.append({"tag": "table", "header": block["header"], "rows": block["rows"]})
+    return {"html_blocks": html_blocks}
+
+
+def _native_content(blocks: list) -> dict:
+    """Blocs de la couche texte au format "content" de get_table_from_gemini"""
+    content = []
+    for block in blocks:
+        if block["type"] == "table":
+            content.append({"type": "table", "header": block["header"], "rows": block["rows"]})
+        elif block["type"] == "list":
+            content += [{"type": "paragraph", "text": item} for item in block["items"]]
+        else:
+            content.append({"type": "paragraph", "text": block["text"]})
+    return {"content": content}
+
+
+def _map_image_frames(file_input, extract) -> list:
+    """
+    Applique extract(image) à chaque image d'un fichier (pages d'un TIFF
+    multipage), décodage et appels Gemini en pipeline (map_pages). Un
+    résultat par image, None si son traitement a échoué.
+    """
+    from utils.image_utils import encode_image_to_pil
+    image = encode_image_to_pil(file_input)
+    if image is None:
+        return [None]
+
+    def render(index):
+        image.seek(index)
+        # Copie : seek() remplace le contenu de l'image ouverte
+        return _ensure_rgb(image.copy())
+
+    outputs = []
+    for index, output, error in map_pages(extract, range(getattr(image, "n_frames", 1) or 1),
+                                          render=render, progress=report_progress):
+        if error is not None:
+            logger.warning(f"Image {index + 1} : {error}")
+        outputs.append(output)
+    return outputs
+
 def _auto_rotate_osd(im: Image.Image) -> Image.Image:
     """Corrige automatiquement l'orientation via Tesseract OSD."""
     try:
@@ -3438,27 +3706,37 @@ Tu es un moteur de restructuration OCR.
 
 
 # ================= FONCTIONS D'APPEL GEMINI AI =================
+GEMINI_VISION_MODEL = "gemini-2.5-flash"
+
+
 def call_gemini_vision(pil_image, prompt):
     try:
         if pil_image.mode != "RGB":
             pil_image = pil_image.convert("RGB")
 
-        # Convertir PIL en bytes
-        import io
-        img_bytes = io.BytesIO()
-        pil_image.save(img_bytes, format="JPEG")
-        img_bytes = img_bytes.getvalue()
+        # Résolution, couleur et format adaptés au contenu de la page
+        encoded = encode_page(pil_image)
+        img_bytes = encoded.data
 
+        # Même image, même prompt, même modèle : réponse déjà obtenue
+        cache_key = model_key(img_bytes, prompt, GEMINI_VISION_MODEL)
+        cached = model_cache.lookup(cache_key)
+        if cached is not None:
+            logger.info("Réponse Gemini en cache")
+            return cached
+
+        started = time.monotonic()
         response = client.models.generate_content(
-            model="gemini-2.5-flash",
+            model=GEMINI_VISION_MODEL,
             contents=[
                 types.Part.from_text(prompt),
-                types.Part.from_bytes(data=img_bytes, mime_type="image/jpeg")
+                types.Part.from_bytes(data=img_bytes, mime_type=encoded.mime_type)
             ],
             config=types.GenerateContentConfig(
                 response_mime_type="application/json"
             )
         )
+        logger.info(f"[gemini] envoi {encoded.describe()}, réponse en {time.monotonic() - started:.2f}s")
 
         content = response.text.strip()
         logger.info("Réponse brute : " + str(content))
@@ -3467,13 +3745,14 @@ def call_gemini_vision(pil_image, prompt):
         
         import gc
         del pil_image
-        del img_bytes
+        del img_bytes, encoded
         gc.collect()
 
         if data is None:
             logger.error("Impossible de parser le JSON Gemini")
             return None
 
+        model_cache.store(cache_key, data, GEMINI_VISION_MODEL)
         return data
 
     except Exception as e:
@@ -3730,8 +4009,11 @@ def convert_image_to_word(file_input, form_data: Optional[Dict] = None):
     language = form_data.get("language", "fra")
     add_orig_img = str(form_data.get("add_original_image", "true")).lower() == "true"
     
-    # 1. Extraction du contenu via Gemini
-    gemini_output = get_content_from_gemini(file_input, language)
+    # 1. Extraction du contenu via Gemini (chaque page d'un TIFF multipage)
+    outputs = _map_image_frames(file_input, lambda img: get_content_from_gemini(img, language))
+    extracted = [o for o in outputs if o and "error" not in o]
+    gemini_output = ({"content": [item for o in extracted for item in o.get("content", [])]}
+                     if extracted else outputs[0])
     
     # 2. Vérification du résultat
     if gemini_output is None:
@@ -3929,8 +4211,13 @@ def convert_image_to_excel(file_input, original_filename="document.png", form_da
     
     language = (form_data or {}).get("language", "fra")
     
-    # 1. Extraction via get_table_from_gemini (PAS get_content_from_gemini)
-    gemini_output = get_table_from_gemini(file_input, language)
+    # 1. Extraction via get_table_from_gemini (PAS get_content_from_gemini),
+    #    chaque page d'un TIFF multipage
+    outputs = _map_image_frames(file_input, lambda img: get_table_from_gemini(img, language))
+    extracted = [o for o in outputs if o and "error" not in o]
+    gemini_output = ({"tables": [t for o in extracted for t in o.get("tables", [])],
+                      "content": [item for o in extracted for item in o.get("content", [])]}
+                     if extracted else outputs[0])
     
     # 2. Vérification du résultat
     if gemini_output is None:
@@ -4340,20 +4627,11 @@ def _redact_with_overlay(input_path, filename, search_texts, redact_type,
                      download_name=Path(filename).stem+"_redacted.pdf")
  
  
-def _parse_page_range(pages_opt: str, page_range: str, total: int) -> Optional[set]:
+def _parse_page_range(pages_opt: str, page_range: str, total: int) -> Optional[PageSelection]:
     if pages_opt == "all": return None
-    if pages_opt == "first": return {0}
-    if pages_opt == "last": return {total-1}
+    if pages_opt in ("first", "last"): return compile_pages(pages_opt, total)
     if pages_opt == "range" and page_range:
-        result = set()
-        for part in page_range.split(","):
-            part = part.strip()
-            if "-" in part:
-                a, b = part.split("-",1)
-                result.update(range(int(a)-1, int(b)))
-            else:
-                result.add(int(part)-1)
-        return result
+        return compile_pages(page_range, total)
     return None
 
 def redact_pdf_with_pdfplumber(input_path, filename, search_texts, rgb, pages_to_process, redact_type):
@@ -4640,15 +4918,7 @@ def edit_pdf(file, form_data=None):
         y         = float(form_data.get("position_y",50))
  
         # Pages à supprimer
-        del_set = set()
-        for part in (form_data.get("pages_to_delete","") or "").split(","):
-            part = part.strip()
-            if not part: continue
-            if "-" in part:
-                a,b = part.split("-",1)
-                del_set.update(range(int(a)-1,int(b)))
-            else:
-                del_set.add(int(part)-1)
+        del_set = compile_pages(form_data.get("pages_to_delete",""), total, empty="none")
  
         # Ordre personnalisé
         order = None
@@ -4801,19 +5071,11 @@ def sign_pdf(file, form_data=None):
     max_h     = int(form_data.get("max_height",80))
  
     try:
-        reader  = pypdf.PdfReader(BytesIO(file.read()))
+        reader  = pypdf.PdfReader(upload_stream(file))
         writer  = pypdf.PdfWriter()
         total   = len(reader.pages)
  
-        pages_to_sign = set()
-        for part in pages_raw.split(","):
-            part = part.strip()
-            if "-" in part:
-                a,b = part.split("-",1)
-                pages_to_sign.update(range(int(a)-1, int(b)))
-            else:
-                try: pages_to_sign.add(int(part)-1)
-                except: pass
+        pages_to_sign = compile_pages(pages_raw, total, empty="none")
  
         for i, page in enumerate(reader.pages):
             pw = float(page.mediabox.width)
@@ -0,0 +1,405 @@
+"""
+Moteur de compression PDF à profils (lossless, balanced, aggressive).
+
+Les PDF scannés ou riches en images pèsent presque entièrement dans leurs
+images : recompresser les flux de contenu n'y change rien. Les techniques
+appliquées sur un PdfWriter, dans l'ordre :
+
+1. retrait des vignettes (/Thumb) et, selon le profil, des métadonnées XMP ;
+2. recompression Flate des flux de contenu ;
+3. rééchantillonnage des images à la résolution cible et recodage
+   JPEG (images photographiques) ou Flate (aplats, captures d'écran),
+   réparti sur plusieurs processus ;
+4. fusion des objets identiques (dedup.py) et retrait des objets
+   devenus inaccessibles ;
+5. à l'écriture, regroupement des objets en flux d'objets (/ObjStm) avec
+   table xref compressée, via PyMuPDF : pypdf ne sait pas les produire.
+"""
+
+import io
+import math
+import zlib
+import logging
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+from PIL import Image
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    NumberObject,
+    StreamObject,
+)
+
+from config import AppConfig
+from utils.process_pool import in_worker, process_pool, task_subpool
+from .dedup import deduplicate_objects
+
+try:
+    import fitz  # PyMuPDF
+    HAS_FITZ = True
+except ImportError:
+    HAS_FITZ = False
+
+logger = logging.getLogger(__name__)
+
+# Gain minimal exigé pour recoder une image sans la rééchantillonner :
+# en dessous, la perte de qualité ne vaut pas les octets gagnés
+MIN_RECODE_GAIN = 0.10
+# Marge avant rééchantillonnage (évite de toucher une image à 1 % de la cible)
+RESAMPLE_MARGIN = 1.1
+# Au-delà de 256 couleurs, une image est traitée comme une photographie
+PHOTO_MIN_COLORS = 256
+# Niveau zlib des images recodées en Flate (9 : bien plus lent pour ~1 %)
+FLATE_LEVEL = 6
+# Images en cours de traitement par processus (borne la mémoire)
+INFLIGHT_PER_WORKER = 2
+
+_DEVICE_MODES = {"/DeviceGray": "L", "/DeviceRGB": "RGB"}
+_CAL_MODES = {"/CalGray": "L", "/CalRGB": "RGB"}
+_ICC_MODES = {1: "L", 3: "RGB"}
+# Filtres génériques : décodés par pypdf, sans effet sur la nature de l'image
+_TRANSPORT_FILTERS = {
+    "/FlateDecode", "/LZWDecode", "/ASCII85Decode", "/ASCIIHexDecode", "/RunLengthDecode",
+}
+
+
+def resolve_profile(name: str) -> Tuple[str, dict]:
+    """Retourne (nom, réglages) du profil demandé ('medium' → 'balanced'...)"""
+    name = AppConfig.get_compression_profile(name)
+    return name, AppConfig.PDF_COMPRESSION_PROFILES[name]
+
+
+# ============================================================
+# IMAGES
+# ============================================================
+
+def _color_mode(colorspace) -> Optional[str]:
+    """Mode PIL équivalent à l'espace colorimétrique, None si non géré"""
+    if colorspace is None:
+        return None
+    colorspace = colorspace.get_object()
+    if isinstance(colorspace, ArrayObject) and colorspace:
+        family = colorspace[0]
+        if family == "/ICCBased" and len(colorspace) > 1:
+            return _ICC_MODES.get(colorspace[1].get_object().get("/N"))
+        return _CAL_MODES.get(family)
+    return _DEVICE_MODES.get(colorspace)
+
+
+def _filters(obj) -> list:
+    filters = obj.get("/Filter")
+    if filters is None:
+        return []
+    filters = filters.get_object()
+    return list(filters) if isinstance(filters, ArrayObject) else [filters]
+
+
+def _collect_images(writer: PdfWriter) -> Dict[int, Tuple[StreamObject, float]]:
+    """
+    Images XObject du document (formulaires imbriqués compris), chacune
+    associée au plus grand côté, en pouces, des pages qui l'affichent.
+    Une image partagée par plusieurs pages n'est traitée qu'une fois.
+    """
+    images: Dict[int, Tuple[StreamObject, float]] = {}
+    for page in writer.pages:
+        box = page.mediabox
+        page_inches = max(float(box.width), float(box.height)) / 72
+
+        pending = [page.get("/Resources")]
+        seen_forms = set()
+        while pending:
+            resources = pending.pop()
+            if resources is None:
+                continue
+            xobjects = resources.get_object().get("/XObject")
+            if xobjects is None:
+                continue
+            xobjects = xobjects.get_object()
+            for name in xobjects:
+                ref = xobjects.raw_get(name)
+                if not isinstance(ref, IndirectObject):
+                    continue
+                obj = ref.get_object()
+                subtype = obj.get("/Subtype")
+                if subtype == "/Image":
+                    known = images.get(ref.idnum)
+                    if known is None or known[1] < page_inches:
+                        images[ref.idnum] = (obj, page_inches)
+                elif subtype == "/Form" and ref.idnum not in seen_forms:
+                    seen_forms.add(ref.idnum)
+                    pending.append(obj.get("/Resources"))
+    return images
+
+
+def _build_job(obj: StreamObject, page_inches: float, settings: dict) -> Optional[dict]:
+    """
+    Prépare le recodage d'une image, ou None si elle doit rester telle quelle
+    (masques 1 bit, CMYK, palettes, JPEG 2000, CCITT/JBIG2...).
+    Les images non JPEG sont traitées comme des pixels bruts : "filter"
+    vaut alors /FlateDecode quels que soient les filtres d'origine.
+    La taille cible suppose l'image affichée sur toute la page : c'est un
+    majorant de la surface réelle, l'image n'est donc jamais réduite en
+    dessous de la résolution demandée.
+    """
+    if obj.get("/ImageMask") or obj.get("/BitsPerComponent", 8) != 8:
+        return None
+    filters = _filters(obj)
+    codec = filters[-1] if filters else None
+    if any(f not in _TRANSPORT_FILTERS for f in filters[:-1]):
+        return None
+    mode = _color_mode(obj.get("/ColorSpace"))
+    if mode is None:
+        return None
+
+    width, height = int(obj["/Width"]), int(obj["/Height"])
+    # Un masque par clé de couleur exige des valeurs exactes : pas de JPEG
+    jpeg_quality = settings["jpeg_quality"] if "/Mask" not in obj else None
+
+    if codec == "/DCTDecode":
+        if jpeg_quality is None:
+            return None
+        data = obj.get_data()  # flux JPEG, filtres de transport retirés
+    elif codec is None or codec in _TRANSPORT_FILTERS:
+        data = obj.get_data()  # pixels bruts, prédicteurs PNG décodés
+        if len(data) != width * height * len(mode):
+            return None
+        codec = "/FlateDecode"
+    else:
+        return None
+
+    max_side = None
+    if settings["image_dpi"]:
+        target = math.ceil(page_inches * settings["image_dpi"])
+        if max(width, height) > target * RESAMPLE_MARGIN:
+            max_side = target
+
+    return {
+        "filter": codec,
+        "data": data,
+        "mode": mode,
+        "size": (width, height),
+        "max_side": max_side,
+        "jpeg_quality": jpeg_quality,
+        "encoded_size": len(obj._data),
+    }
+
+
+def _recode_image(job: dict) -> Optional[Tuple[str, bytes, Tuple[int, int]]]:
+    """
+    Recode une image (exécuté dans un processus de travail).
+    Retourne (filtre, données, (largeur, hauteur)) ou None si le résultat
+    n'est pas plus petit que l'original.
+    """
+    if job["filter"] == "/DCTDecode":
+        img = Image.open(io.BytesIO(job["data"]))
+        img.load()
+        if img.mode != job["mode"]:
+            return None
+    else:
+        img = Image.frombytes(job["mode"], job["size"], job["data"])
+
+    resized = job["max_side"] is not None
+    if resized:
+        scale = job["max_side"] / max(img.size)
+        img = img.resize(
+            (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+            Image.LANCZOS,
+        )
+
+    if job["jpeg_quality"] is not None and img.getcolors(PHOTO_MIN_COLORS) is None:
+        buffer = io.BytesIO()
+        img.save(buffer, "JPEG", quality=job["jpeg_quality"], optimize=True)
+        result = ("/DCTDecode", buffer.getvalue())
+    else:
+        result = ("/FlateDecode", zlib.compress(img.tobytes(), FLATE_LEVEL))
+
+    limit = job["encoded_size"] if resized else job["encoded_size"] * (1 - MIN_RECODE_GAIN)
+    if len(result[1]) >= limit:
+        return None
+    return result[0], result[1], img.size
+
+
+def _apply_recoded(obj: StreamObject, recoded: Tuple[str, bytes, Tuple[int, int]]):
+    """Remplace le contenu d'une image par sa version recodée"""
+    filter_name, data, (width, height) = recoded
+    obj._data = data
+    obj[NameObject("/Filter")] = NameObject(filter_name)
+    obj[NameObject("/Width")] = NumberObject(width)
+    obj[NameObject("/Height")] = NumberObject(height)
+    obj[NameObject("/BitsPerComponent")] = NumberObject(8)
+    obj.pop("/DecodeParms", None)
+    if hasattr(obj, "decoded_self"):
+        obj.decoded_self = None
+
+
+def _iter_recoded(jobs: Iterator[Tuple[StreamObject, dict]], workers: int):
+    """
+    Recode les images, dans le processus courant ou réparties sur `workers`
+    processus : via le pool partagé depuis le processus web, via un pool
+    local à la tâche depuis un processus du pool (cas de /pdf/compress).
+    Les travaux sont préparés à la demande et leur nombre en vol est borné :
+    seules quelques images décodées sont en mémoire à la fois.
+    """
+    if workers > 1 and process_pool.enabled:
+        for obj, future in process_pool.imap_unordered(_recode_image, jobs, workers * INFLIGHT_PER_WORKER):
+            try:
+                yield obj, future.result()
+            except Exception as e:
+                logger.debug(f"[compress] image ignorée : {e}")
+        return
+
+    if workers > 1 and in_worker():
+        with task_subpool(workers) as pool:
+            pending = deque()
+            for obj, job in jobs:
+                pending.append((obj, pool.apply_async(_recode_image, (job,))))
+                if len(pending) >= workers * INFLIGHT_PER_WORKER:
+                    yield _recoded_result(*pending.popleft())
+            while pending:
+                yield _recoded_result(*pending.popleft())
+        return
+
+    for obj, job in jobs:
+        try:
+            yield obj, _recode_image(job)
+        except Exception as e:
+            logger.debug(f"[compress] image ignorée : {e}")
+
+
+def _recoded_result(obj: StreamObject, result) -> Tuple[StreamObject, Optional[tuple]]:
+    try:
+        return obj, result.get()
+    except Exception as e:
+        logger.debug(f"[compress] image ignorée : {e}")
+        return obj, None
+
+
+def recompress_images(writer: PdfWriter, settings: dict, workers: int = 1) -> dict:
+    """
+    Rééchantillonne et recode les images du writer selon le profil.
+    Retourne {"images_recompressed": int, "image_bytes_saved": int}.
+    """
+    images = _collect_images(writer)
+
+    def _jobs():
+        for obj, page_inches in images.values():
+            try:
+                job = _build_job(obj, page_inches, settings)
+            except Exception as e:
+                logger.debug(f"[compress] image non décodable : {e}")
+                continue
+            if job is not None:
+                yield obj, job
+
+    recompressed = 0
+    saved = 0
+    workers = workers if len(images) > 1 else 1
+    for obj, recoded in _iter_recoded(_jobs(), workers):
+        if recoded is None:
+            continue
+        saved += len(obj._data) - len(recoded[1])
+        _apply_recoded(obj, recoded)
+        recompressed += 1
+    return {"images_recompressed": recompressed, "image_bytes_saved": saved}
+
+
+# ============================================================
+# STRUCTURE
+# ============================================================
+
+def _strip_page_extras(writer: PdfWriter, strip_metadata: bool):
+    """Retire vignettes et, selon le profil, métadonnées XMP et /PieceInfo"""
+    keys = ["/Thumb"]
+    if strip_metadata:
+        keys += ["/Metadata", "/PieceInfo"]
+    for page in writer.pages:
+        for key in keys:
+            page.pop(key, None)
+    if strip_metadata:
+        for obj in writer._objects:
+            if isinstance(obj, StreamObject) and obj.get("/Subtype") in ("/Image", "/Form"):
+                obj.pop("/Metadata", None)
+                obj.pop("/PieceInfo", None)
+
+
+def _compress_contents(writer: PdfWriter):
+    for page in writer.pages:
+        try:
+            page.compress_content_streams()
+        except Exception as e:
+            logger.debug(f"[compress] flux de contenu conservé : {e}")
+
+
+def drop_unreachable_objects(writer: PdfWriter) -> int:
+    """
+    Remplace par `null` les objets qu'aucune référence n'atteint depuis le
+    catalogue, /Info ou /Encrypt (vignettes et ressources retirées...).
+    pypdf écrit tous les objets qu'il détient, accessibles ou non.
+    """
+    roots = [writer._root, writer._info]
+    if writer._encrypt_entry is not None:
+        roots.append(writer._encrypt_entry.indirect_reference)
+
+    reachable = set()
+    stack = [ref for ref in roots if isinstance(ref, IndirectObject)]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, IndirectObject):
+            if value.pdf is not writer or value.idnum in reachable:
+                continue
+            reachable.add(value.idnum)
+            stack.append(writer._objects[value.idnum - 1])
+        elif isinstance(value, DictionaryObject):
+            stack.extend(value.values())
+        elif isinstance(value, ArrayObject):
+            stack.extend(value)
+
+    removed = 0
+    for index, obj in enumerate(writer._objects):
+        if obj is None or isinstance(obj, NullObject) or index + 1 in reachable:
+            continue
+        writer._objects[index] = NullObject()
+        removed += 1
+    return removed
+
+
+def compress_writer(writer: PdfWriter, settings: dict, workers: int = 1) -> dict:
+    """
+    Applique au writer les passes du profil (hors flux d'objets, appliqués
+    à l'écriture par pack_object_streams). Retourne les statistiques.
+    """
+    _strip_page_extras(writer, settings["strip_metadata"])
+    _compress_contents(writer)
+    stats = recompress_images(writer, settings, workers)
+    dedup_stats = deduplicate_objects(writer)
+    stats["dedup_objects"] = dedup_stats["objects_removed"]
+    stats["dedup_bytes_saved"] = dedup_stats["bytes_saved"]
+    stats["unused_objects_removed"] = drop_unreachable_objects(writer)
+    return stats
+
+
+def pack_object_streams(pdf_bytes: bytes) -> Optional[bytes]:
+    """
+    Réécrit le PDF avec flux d'objets et table xref compressée (PDF 1.5).
+    Retourne None si PyMuPDF est absent ou si le résultat n'est pas plus petit.
+    """
+    if not HAS_FITZ:
+        return None
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            if doc.needs_pass:
+                return None
+            try:
+                packed = doc.tobytes(garbage=3, deflate=True, use_objstms=1)
+            except TypeError:
+                # PyMuPDF antérieur à use_objstms : compactage seul
+                packed = doc.tobytes(garbage=3, deflate=True)
+    except Exception as e:
+        logger.warning(f"[compress] passe PyMuPDF ignorée : {e}")
+        return None
+    return packed if len(packed) < len(pdf_bytes) else None
@@ -0,0 +1,155 @@
+"""
+Déduplication des objets d'un PdfWriter par empreinte de contenu.
+
+Lors d'une fusion de documents issus du même générateur (factures,
+rapports), chaque source apporte sa propre copie des polices, profils ICC
+et logos. Cette passe calcule une empreinte SHA-256 de chaque objet
+partageable, fusionne les doublons en un seul objet et redirige toutes
+les références vers l'exemplaire conservé.
+
+Les passes sont répétées jusqu'à stabilité : une fois les flux de police
+(/FontFile2) fusionnés, les /FontDescriptor qui les référencent deviennent
+identiques, puis les /Font eux-mêmes.
+"""
+
+import hashlib
+import logging
+from typing import Dict, Optional
+
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NullObject,
+    StreamObject,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_PASSES = 6
+
+# Objets liés à une position dans l'arbre du document : jamais partagés
+_EXCLUDED_TYPES = {
+    "/Catalog", "/Pages", "/Page", "/Annot", "/Outlines",
+    "/StructTreeRoot", "/StructElem", "/Sig", "/XRef", "/ObjStm",
+}
+_EXCLUDED_KEYS = ("/Parent", "/Kids", "/P", "/Rect", "/Next", "/Prev", "/First", "/Last")
+
+
+class _HashSink:
+    """Flux en écriture seule qui calcule une empreinte sans copier les données"""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def digest(self) -> bytes:
+        return self._hash.digest()
+
+
+def _is_candidate(obj) -> bool:
+    """Indique si un objet peut être partagé entre plusieurs pages"""
+    if isinstance(obj, ArrayObject):
+        return True
+    if not isinstance(obj, DictionaryObject):
+        return False
+    if obj.get("/Type") in _EXCLUDED_TYPES:
+        return False
+    return not any(key in obj for key in _EXCLUDED_KEYS)
+
+
+def _fingerprint(obj, data_digests: Dict[int, bytes], idnum: int):
+    """Retourne (empreinte, taille sérialisée) d'un objet"""
+    sink = _HashSink()
+    sink.write(type(obj).__name__.encode())
+    if isinstance(obj, StreamObject):
+        # Le contenu d'un flux ne change pas entre deux passes : son
+        # empreinte est calculée une seule fois
+        if idnum not in data_digests:
+            data_digests[idnum] = hashlib.sha256(obj._data).digest()
+        DictionaryObject.write_to_stream(obj, sink)
+        sink.write(data_digests[idnum])
+        return sink.digest(), sink.size + len(obj._data)
+    obj.write_to_stream(sink)
+    return sink.digest(), sink.size
+
+
+def _rewrite_references(writer: PdfWriter, remap: Dict[int, IndirectObject]):
+    """Redirige toutes les références vers les objets conservés"""
+    for obj in writer._objects:
+        if obj is None:
+            continue
+        stack = [obj]
+        while stack:
+            container = stack.pop()
+            if isinstance(container, DictionaryObject):
+                items = list(container.items())
+            elif isinstance(container, ArrayObject):
+                items = list(enumerate(container))
+            else:
+                continue
+            for key, value in items:
+                if isinstance(value, IndirectObject):
+                    if value.pdf is writer and value.idnum in remap:
+                        container[key] = remap[value.idnum]
+                elif isinstance(value, (DictionaryObject, ArrayObject)):
+                    stack.append(value)
+
+
+def deduplicate_objects(writer: PdfWriter, max_passes: int = MAX_PASSES) -> dict:
+    """
+    Fusionne les objets identiques d'un PdfWriter.
+    Les doublons sont remplacés par `null` dans la table des objets, ce qui
+    préserve la numérotation de la table xref écrite par pypdf.
+    Retourne {"objects_removed": int, "bytes_saved": int, "passes": int}.
+    """
+    protected = set()
+    for ref in (writer._root, writer._info, writer._pages):
+        if isinstance(ref, IndirectObject):
+            protected.add(ref.idnum)
+    if writer._encrypt_entry is not None:
+        protected.add(writer._encrypt_entry.indirect_reference.idnum)
+
+    data_digests: Dict[int, bytes] = {}
+    removed = set()
+    objects_removed = 0
+    bytes_saved = 0
+    passes = 0
+
+    for passes in range(1, max_passes + 1):
+        canonical: Dict[bytes, IndirectObject] = {}
+        remap: Dict[int, IndirectObject] = {}
+
+        for index, obj in enumerate(writer._objects):
+            idnum = index + 1
+            if idnum in protected or idnum in removed or not _is_candidate(obj):
+                continue
+            key, size = _fingerprint(obj, data_digests, idnum)
+            kept: Optional[IndirectObject] = canonical.get(key)
+            if kept is None:
+                canonical[key] = IndirectObject(idnum, 0, writer)
+                continue
+            remap[idnum] = kept
+            bytes_saved += size
+
+        if not remap:
+            break
+
+        _rewrite_references(writer, remap)
+        for idnum in remap:
+            writer._objects[idnum - 1] = NullObject()
+            data_digests.pop(idnum, None)
+            removed.add(idnum)
+        objects_removed += len(remap)
+
+    result = {"objects_removed": objects_removed, "bytes_saved": bytes_saved, "passes": passes}
+    if objects_removed:
+        logger.info(f"[dedup] {objects_removed} objets fusionnés, {bytes_saved} octets économisés "
+                    f"en {passes} passe(s)")
+    return result
@@ -0,0 +1,227 @@
+"""
+Cache des documents PDF analysés, indexé par session et empreinte SHA-256.
+
+Un parcours typique (aperçu → rotation → compression → téléchargement)
+soumet plusieurs fois le même fichier. Le PdfReader gardé en cache
+conserve la table xref et l'arbre des pages déjà chargés : les étapes
+suivantes ne relisent plus le document.
+
+- clé : la session du client (utils/uploads.client_id, à défaut son
+  adresse) et l'empreinte calculée pendant la réception, portées par un
+  DocumentSource ; les contenus en mémoire sont indexés sous la portée fixée par
+  document_scope() (mesures, scripts) ; sans clé, rien n'est mis en cache ;
+- le cache vit là où le document est analysé : dans le processus du pool
+  qui exécute l'opération (les tâches d'un même document y sont dirigées
+  en priorité, voir ProcessPool.run(affinity=...)), ou dans le processus
+  web si le pool est désactivé ;
+- un fichier sur disque reste lu à la demande via son descripteur, gardé
+  ouvert par l'entrée et fermé à son éviction : seul l'arbre des pages
+  occupe la mémoire ;
+- éviction LRU sous un budget mémoire (AppConfig.DOCUMENT_CACHE_MB), pris
+  sur AppConfig.MEMORY_BUDGET_MB ;
+- un verrou par document : un PdfReader partage un seul flux et ne se
+  prête pas aux accès concurrents ;
+- les documents qui n'ont pu être lus qu'en mode tolérant (réparation)
+  sont mémorisés, même après éviction : leur réouverture passe
+  directement par ce mode.
+
+Les opérations ne doivent pas modifier les pages du reader (elles
+travaillent sur les copies du PdfWriter) : il est partagé entre requêtes
+d'une même session.
+"""
+
+import io
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple, Union
+
+from pypdf import PdfReader
+
+from config import AppConfig
+from utils.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Estimation de la mémoire occupée par page analysée (dictionnaires, arbre)
+PAGE_OVERHEAD = 4 * 1024
+
+_scope = threading.local()
+
+
+class _Entry:
+    __slots__ = ("reader", "lock", "size", "handle")
+
+    def __init__(self, reader: PdfReader, size: int, handle: Optional[BinaryIO] = None):
+        self.reader = reader
+        self.lock = threading.RLock()
+        self.size = size
+        # Descripteur du fichier lu à la demande, fermé avec l'entrée
+        self.handle = handle
+
+    def close(self):
+        # Attend la fin de l'opération en cours sur ce document
+        with self.lock:
+            if self.handle is not None:
+                self.handle.close()
+                self.handle = None
+
+
+class DocumentSource:
+    """
+    Fichier reçu et sa clé de cache (portée et empreinte SHA-256 déjà
+    calculée) ; utilisable comme un chemin et transmissible au pool.
+    """
+
+    __slots__ = ("path", "key")
+
+    def __init__(self, path: Union[str, Path], key: Optional[str] = None):
+        self.path = Path(path)
+        self.key = key
+
+    def __fspath__(self) -> str:
+        return str(self.path)
+
+    def __repr__(self) -> str:
+        return f"DocumentSource({str(self.path)!r})"
+
+
+_documents = LRUCache(
+    max_entries=16,
+    max_bytes=AppConfig.DOCUMENT_CACHE_MB * 1024 * 1024,
+    sizeof=lambda entry: entry.size,
+    on_evict=_Entry.close,
+)
+_repaired = LRUCache(max_entries=4096, sizeof=lambda value: 0)
+
+
+def document_key(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def parse_document(source: Union[bytes, BinaryIO], known_damaged: bool = False) -> Tuple[PdfReader, bool]:
+    """
+    Analyse un PDF (contenu ou flux repositionnable) et charge son arbre
+    des pages. Lecture stricte d'abord, puis tolérante (réparation) en cas
+    d'échec ; `known_damaged` saute directement à la seconde.
+    Retourne (reader, réparé).
+    """
+    def stream():
+        if isinstance(source, (bytes, bytearray)):
+            return io.BytesIO(source)
+        source.seek(0)
+        return source
+
+    if not known_damaged:
+        try:
+            reader = PdfReader(stream(), strict=True)
+            len(reader.pages)
+            return reader, False
+        except Exception as e:
+            logger.debug(f"[document_cache] lecture stricte impossible : {e}")
+    reader = PdfReader(stream(), strict=False)
+    len(reader.pages)
+    return reader, True
+
+
+@contextmanager
+def document_scope(scope: Optional[str]):
+    """Portée du cache pour le thread courant hors requête (mesures, scripts)"""
+    previous = getattr(_scope, "value", None)
+    _scope.value = scope
+    try:
+        yield
+    finally:
+        _scope.value = previous
+
+
+def _current_scope() -> Optional[str]:
+    scope = getattr(_scope, "value", None)
+    if scope is not None:
+        return scope
+    from flask import has_request_context
+    if has_request_context():
+        # Sans session existante (aucun cookie posé pour le cache) : le client
+        # est désigné par son adresse
+        from flask import request
+        from utils.uploads import client_id
+        return client_id(create=False) or f"addr:{request.remote_addr}"
+    return None
+
+
+def upload_source(path: Union[str, Path], sha256: Optional[str]) -> DocumentSource:
+    """
+    DocumentSource d'un fichier reçu, indexé sous la session courante et
+    l'empreinte relevée à la réception (aucune relecture du fichier).
+    """
+    scope = _current_scope()
+    key = f"{scope}:{sha256}" if scope is not None and sha256 else None
+    return DocumentSource(path, key)
+
+
+def _parse(source: Union[bytes, BinaryIO], key: Optional[str]) -> PdfReader:
+    reader, repaired = parse_document(source, key is not None and _repaired.get(key) is not None)
+    if repaired and key is not None:
+        _repaired.set(key, True)
+    return reader
+
+
+@contextmanager
+def open_document(source: Union[bytes, str, Path, DocumentSource]) -> Iterator[PdfReader]:
+    """
+    Fournit le PdfReader d'un contenu PDF ou d'un fichier, depuis le cache
+    si possible. Le document est verrouillé pour le thread courant jusqu'à
+    la sortie du bloc `with`.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+        scope = _current_scope()
+        key = document_key(data)
+        entry = _documents.get((scope, key)) if scope is not None else None
+        if entry is None:
+            reader = _parse(data, key)
+            entry = _Entry(reader, len(data) + len(reader.pages) * PAGE_OVERHEAD)
+            if scope is not None and entry.size <= AppConfig.DOCUMENT_CACHE_MAX_ENTRY_MB * 1024 * 1024:
+                _documents.set((scope, key), entry)
+        with entry.lock:
+            yield entry.reader
+        return
+
+    key = source.key if isinstance(source, DocumentSource) else None
+    entry = _documents.get(key) if key is not None else None
+    if entry is not None:
+        with entry.lock:
+            # Entrée évincée entre-temps : descripteur fermé, document relu
+            if entry.handle is not None:
+                yield entry.reader
+                return
+
+    handle = open(source, "rb")
+    owned = False
+    try:
+        entry = _Entry(_parse(handle, key), 0, handle)
+        entry.size = len(entry.reader.pages) * PAGE_OVERHEAD
+        # Verrou pris avant l'insertion : une éviction concurrente attend la
+        # fin de l'opération pour fermer le descripteur
+        with entry.lock:
+            if key is not None and entry.size <= AppConfig.DOCUMENT_CACHE_MAX_ENTRY_MB * 1024 * 1024:
+                _documents.set(key, entry)
+                # Descripteur confié à l'entrée, fermé à son éviction
+                owned = True
+            yield entry.reader
+    finally:
+        if not owned:
+            handle.close()
+
+
+def clear_cache():
+    """Oublie les documents analysés (mesures à froid, tests)"""
+    _documents.clear()
+
+
+def cache_stats() -> dict:
+    stats = _documents.stats()
+    stats["repaired_known"] = len(_repaired.data)
+    return stats
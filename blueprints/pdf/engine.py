@@ -3,16 +3,91 @@ Moteur de traitement PDF (PDFEngine) - Version finale
 """
 
 import io
+import os
 import base64
-import zipfile
-from typing import List, Tuple, Optional
+import logging
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+from typing import List, Tuple, Optional, Iterable, Iterator, Union, BinaryIO
+import pypdf
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import NameObject
+
+from config import AppConfig
+from utils.memory import PeakRSSTracker
+from utils.page_ranges import PageSelection, compile_pages
+from utils.zip_stream import iter_zip
+from .compression import compress_writer, pack_object_streams, resolve_profile
+from .dedup import deduplicate_objects
+from .document_cache import open_document, parse_document
+from .incremental import IncrementalUnsupported, IncrementalUpdate, metadata_update, rotate_pages
+from .resources import prune_page_resources
+from .thumbnails import register_document, render_thumbnail
 
 try:
     from pypdf import Transformation
 except ImportError:
     Transformation = None
 
+logger = logging.getLogger(__name__)
+
+# Une source PDF : contenu en mémoire, chemin sur disque ou flux binaire
+PDFSource = Union[bytes, bytearray, str, Path, BinaryIO]
+
+# Taille des morceaux émis par les générateurs de sortie
+STREAM_CHUNK_SIZE = 64 * 1024
+# Sortie gardée en mémoire avant passage sur disque (écriture sans les
+# méthodes internes de PdfWriter)
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Méthodes internes de PdfWriter utilisées par _iter_writer_chunks, vérifiées
+# sur pypdf 4.x (requirements.txt)
+_WRITER_INTERNALS = pypdf.__version__.split(".")[0] == "4" and all(
+    hasattr(PdfWriter, name) for name in (
+        "_add_object", "_sweep_indirect_references", "_write_xref_table", "_write_trailer",
+    )
+)
+
+
+class PageLimitExceeded(ValueError):
+    """Un fichier source dépasse le nombre de pages autorisé"""
+
+    def __init__(self, index: int, page_count: int, limit: int):
+        super().__init__(f"Source {index} : {page_count} pages (max {limit})")
+        self.index = index
+        self.page_count = page_count
+        self.limit = limit
+
+    def __reduce__(self):
+        # Relancée depuis un processus du pool : arguments du constructeur
+        return type(self), (self.index, self.page_count, self.limit)
+
+
+class _ChunkSink:
+    """Flux en écriture seule : compte les octets et se vide par morceaux"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+
 class PDFEngine:
     """Moteur de traitement PDF avec méthodes statiques"""
 
@@ -20,34 +95,81 @@ class PDFEngine:
     # UTILITAIRES INTERNES
     # ==========================
     @staticmethod
-    def _normalize_pages_input(pages_input: str, total_pages: int) -> Optional[List[int]]:
-        """Normalise l'entrée des pages (all, range, selected)"""
-        pages_input = (pages_input or "all").lower().strip()
-        if pages_input == "all":
-            return list(range(total_pages))
-        try:
-            pages_set = set()
-            for part in pages_input.split(","):
-                part = part.strip()
-                if not part:
-                    continue
-                if "-" in part:
-                    start, end = map(int, part.split("-", 1))
-                    start = max(1, start)
-                    end = min(end, total_pages)
-                    pages_set.update(range(start, end+1))
-                else:
-                    page_num = int(part)
-                    if 1 <= page_num <= total_pages:
-                        pages_set.add(page_num)
-            return sorted([p-1 for p in pages_set])
-        except Exception:
-            return None
+    def _normalize_pages_input(pages_input: str, total_pages: int) -> PageSelection:
+        """
+        Compile l'entrée des pages ("all", "1-3,7", "odd", "last-2"...).
+        Lève PageRangeError (ValueError) si l'expression est invalide.
+        """
+        return compile_pages(pages_input, total_pages)
 
     @staticmethod
     def _repair_pdf(pdf_bytes: bytes) -> PdfReader:
         """Tente de récupérer un PDF corrompu"""
-        return PdfReader(io.BytesIO(pdf_bytes), strict=False)
+        return parse_document(pdf_bytes, known_damaged=True)[0]
+
+    @staticmethod
+    def _open_reader(source: PDFSource, stack: ExitStack) -> PdfReader:
+        """
+        Ouvre un PdfReader depuis des bytes, un chemin ou un flux.
+        Les contenus et les fichiers passent par le cache des documents
+        analysés (verrouillé jusqu'à la fermeture de `stack`) ; un fichier
+        est lu à la demande via un descripteur, fermé avec `stack` ou son
+        entrée de cache, au lieu d'être chargé entièrement en mémoire.
+        """
+        if isinstance(source, (bytes, bytearray)):
+            return stack.enter_context(open_document(bytes(source)))
+        if isinstance(source, (str, os.PathLike)):
+            return stack.enter_context(open_document(source))
+
+        # Flux fourni par l'appelant, qui en garde la charge
+        try:
+            return PdfReader(source)
+        except Exception:
+            source.seek(0)
+            return PdfReader(source, strict=False)
+
+    @staticmethod
+    def _iter_writer_chunks(writer: PdfWriter, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Sérialise un PdfWriter morceau par morceau.
+        Reprend la boucle de PdfWriter.write_stream() en émettant la sortie
+        tous les `chunk_size` octets : seul un morceau est gardé en mémoire.
+        Cette boucle s'appuie sur des méthodes internes de pypdf 4 : avec une
+        autre version, writer.write() passe par un fichier temporaire
+        (en mémoire jusqu'à SPOOL_MAX_SIZE) relu par morceaux.
+        """
+        if not _WRITER_INTERNALS:
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+                writer.write(spool)
+                spool.seek(0)
+                yield from iter(lambda: spool.read(chunk_size), b"")
+            return
+
+        if not writer._root:
+            writer._root = writer._add_object(writer._root_object)
+        writer._sweep_indirect_references(writer._root)
+
+        sink = _ChunkSink()
+        sink.write(writer.pdf_header + b"\n")
+        sink.write(b"%\xE2\xE3\xCF\xD3\n")
+
+        object_positions = []
+        for i, obj in enumerate(writer._objects):
+            if obj is None:
+                continue
+            idnum = i + 1
+            object_positions.append(sink.tell())
+            sink.write(f"{idnum} 0 obj\n".encode())
+            if writer._encryption and obj != writer._encrypt_entry:
+                obj = writer._encryption.encrypt_object(obj, idnum, 0)
+            obj.write_to_stream(sink)
+            sink.write(b"\nendobj\n")
+            if len(sink) >= chunk_size:
+                yield sink.drain()
+
+        xref_location = writer._write_xref_table(sink, object_positions)
+        writer._write_trailer(sink, xref_location)
+        yield sink.drain()
 
     @staticmethod
     def _writer_to_bytes(writer: PdfWriter) -> bytes:
@@ -57,10 +179,31 @@ class PDFEngine:
         return buffer.getvalue()
 
     @staticmethod
-    def _create_single_page_pdf(page) -> bytes:
+    def add_page_pruned(writer: PdfWriter, page):
+        """
+        Ajoute une page au writer en ne clonant que les ressources
+        (polices, images, XObjects...) réellement utilisées par son contenu
+        """
+        resources = prune_page_resources(page)
+        if resources is None:
+            return writer.add_page(page)
+        # [1, "/Resources"] : clé ignorée au premier niveau seulement,
+        # les formulaires XObject gardent leurs propres ressources
+        new_page = writer.add_page(page, excluded_keys=[1, "/Resources"])
+        new_page[NameObject("/Resources")] = resources.clone(writer)
+        return new_page
+
+    @staticmethod
+    def _add_split_page(writer: PdfWriter, page, prune: bool):
+        if prune:
+            return PDFEngine.add_page_pruned(writer, page)
+        return writer.add_page(page)
+
+    @staticmethod
+    def _create_single_page_pdf(page, prune: bool = True) -> bytes:
         """Crée un PDF à partir d'une seule page"""
         writer = PdfWriter()
-        writer.add_page(page)
+        PDFEngine._add_split_page(writer, page, prune)
         return PDFEngine._writer_to_bytes(writer)
 
     @staticmethod
@@ -97,113 +240,384 @@ class PDFEngine:
     # FONCTIONS PRINCIPALES
     # ==========================
     @staticmethod
-    def merge(files_data: List[bytes]) -> Tuple[bytes, int]:
-        """Fusionne plusieurs fichiers PDF en un seul"""
+    def _build_merge_writer(sources: Iterable[PDFSource], stack: ExitStack,
+                            max_pages: Optional[int] = None,
+                            dedup: bool = True) -> Tuple[PdfWriter, int, dict]:
+        """
+        Ajoute les pages de toutes les sources dans un nouveau PdfWriter,
+        puis fusionne les objets identiques (polices, images, profils ICC)
+        """
         writer = PdfWriter()
         total_pages = 0
-        for pdf_data in files_data:
-            try:
-                reader = PdfReader(io.BytesIO(pdf_data))
-            except Exception:
-                reader = PDFEngine._repair_pdf(pdf_data)
+        for index, source in enumerate(sources):
+            reader = PDFEngine._open_reader(source, stack)
+            page_count = len(reader.pages)
+            if max_pages is not None and page_count > max_pages:
+                raise PageLimitExceeded(index, page_count, max_pages)
             for page in reader.pages:
                 writer.add_page(page)
                 total_pages += 1
-        return PDFEngine._writer_to_bytes(writer), total_pages
+        dedup_stats = deduplicate_objects(writer) if dedup else {"objects_removed": 0, "bytes_saved": 0}
+        return writer, total_pages, dedup_stats
 
     @staticmethod
-    def split(pdf_bytes: bytes, mode: str, arg: str = "") -> List[bytes]:
-        """Divise un PDF selon différents modes"""
-        try:
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-        except Exception:
-            reader = PDFEngine._repair_pdf(pdf_bytes)
+    def merge(files_data: List[bytes], dedup: bool = True) -> Tuple[bytes, int]:
+        """Fusionne plusieurs fichiers PDF en un seul"""
+        with ExitStack() as stack:
+            writer, total_pages, _ = PDFEngine._build_merge_writer(files_data, stack, dedup=dedup)
+            return PDFEngine._writer_to_bytes(writer), total_pages
+
+    @staticmethod
+    def merge_to_stream(sources: Iterable[PDFSource], output: Union[str, Path, BinaryIO],
+                        max_pages: Optional[int] = None, dedup: bool = True) -> dict:
+        """
+        Fusionne des PDF en écrivant directement dans un fichier ou un flux,
+        sans matérialiser le résultat en mémoire.
+        Retourne les statistiques : pages, octets écrits, octets économisés
+        par la déduplication, pic de RSS, durée.
+        """
+        with PeakRSSTracker("merge") as tracker, ExitStack() as stack:
+            writer, total_pages, dedup_stats = PDFEngine._build_merge_writer(
+                sources, stack, max_pages, dedup
+            )
+            if isinstance(output, (str, Path)):
+                output = stack.enter_context(open(output, "wb"))
+            bytes_written = 0
+            for chunk in PDFEngine._iter_writer_chunks(writer):
+                output.write(chunk)
+                bytes_written += len(chunk)
+            del writer
+
+        stats = {
+            "pages": total_pages,
+            "bytes_written": bytes_written,
+            "dedup_objects": dedup_stats["objects_removed"],
+            "dedup_bytes_saved": dedup_stats["bytes_saved"],
+            **tracker.as_dict(),
+        }
+        logger.info(f"[merge] {total_pages} pages, {bytes_written} octets "
+                    f"({stats['dedup_bytes_saved']} économisés), "
+                    f"pic RSS {stats['peak_rss_mb']} MB en {stats['duration_s']}s")
+        return stats
+
+    @staticmethod
+    def iter_merge(sources: Iterable[PDFSource], chunk_size: int = STREAM_CHUNK_SIZE,
+                   stats: Optional[dict] = None, dedup: bool = True) -> Iterator[bytes]:
+        """
+        Générateur de fusion pour une réponse WSGI en morceaux.
+        Le dictionnaire `stats`, s'il est fourni, est complété à la fin du flux.
+        """
+        with PeakRSSTracker("merge") as tracker, ExitStack() as stack:
+            writer, total_pages, dedup_stats = PDFEngine._build_merge_writer(
+                sources, stack, dedup=dedup
+            )
+            bytes_written = 0
+            for chunk in PDFEngine._iter_writer_chunks(writer, chunk_size):
+                bytes_written += len(chunk)
+                yield chunk
+            del writer
+
+        if stats is not None:
+            stats.update({
+                "pages": total_pages,
+                "bytes_written": bytes_written,
+                "dedup_objects": dedup_stats["objects_removed"],
+                "dedup_bytes_saved": dedup_stats["bytes_saved"],
+                **tracker.as_dict(),
+            })
+        logger.info(f"[merge] flux terminé : {total_pages} pages, {bytes_written} octets, "
+                    f"pic RSS {tracker.as_dict()['peak_rss_mb']} MB")
+
+    @staticmethod
+    def split(pdf_bytes: bytes, mode: str, arg: str = "", prune: bool = True) -> List[bytes]:
+        """
+        Divise un PDF selon différents modes.
+        Avec `prune`, chaque sortie ne contient que les ressources de ses pages.
+        """
+        with ExitStack() as stack:
+            reader = PDFEngine._open_reader(pdf_bytes, stack)
+            return PDFEngine._split_reader(reader, mode, arg, prune)
+
+    @staticmethod
+    def _split_reader(reader: PdfReader, mode: str, arg: str, prune: bool) -> List[bytes]:
         total_pages = len(reader.pages)
         if mode == "all":
-            return [PDFEngine._create_single_page_pdf(reader.pages[i]) for i in range(total_pages)]
+            return [PDFEngine._create_single_page_pdf(reader.pages[i], prune) for i in range(total_pages)]
         elif mode == "range":
+            # Un fichier par terme : "1-3,5,8-" → trois fichiers
             output_files = []
-            ranges = [r.strip() for r in arg.split(",") if r.strip()]
-            for r in ranges:
-                if "-" not in r:
-                    continue
-                try:
-                    start, end = map(int, r.split("-", 1))
-                    start = max(1, start) - 1
-                    end = min(end, total_pages)
-                    writer = PdfWriter()
-                    for i in range(start, end):
-                        writer.add_page(reader.pages[i])
-                    output_files.append(PDFEngine._writer_to_bytes(writer))
-                except Exception:
-                    continue
+            for group in compile_pages(arg, total_pages, empty="none").groups():
+                writer = PdfWriter()
+                for i in group:
+                    PDFEngine._add_split_page(writer, reader.pages[i], prune)
+                output_files.append(PDFEngine._writer_to_bytes(writer))
             return output_files
         elif mode == "selected":
+            # Pages dans l'ordre saisi, en un seul fichier
             writer = PdfWriter()
-            for page_num in [n.strip() for n in arg.split(",") if n.strip()]:
-                try:
-                    idx = int(page_num) - 1
-                    if 0 <= idx < total_pages:
-                        writer.add_page(reader.pages[idx])
-                except Exception:
-                    continue
+            for i in compile_pages(arg, total_pages, empty="none").ordered():
+                PDFEngine._add_split_page(writer, reader.pages[i], prune)
             return [PDFEngine._writer_to_bytes(writer)]
         return []
 
     @staticmethod
     def create_zip(files: List[bytes], zip_name: str = "pdf_split_results.zip") -> Tuple[bytes, str]:
         """Crée une archive ZIP contenant les fichiers PDF"""
-        buffer = io.BytesIO()
-        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            for i, pdf_data in enumerate(files):
-                filename = f"pdf_page_{i+1:03d}.pdf"
-                zip_file.writestr(filename, pdf_data)
-        return buffer.getvalue(), zip_name
+        entries = ((f"pdf_page_{i+1:03d}.pdf", pdf_data) for i, pdf_data in enumerate(files))
+        return b"".join(iter_zip(entries)), zip_name
+
+    @staticmethod
+    def create_zip_from_paths(paths: List[Union[str, Path]],
+                              zip_name: str = "pdf_split_results.zip") -> Tuple[Iterator[bytes], str]:
+        """
+        Archive ZIP en flux à partir de fichiers sur disque.
+        Retourne un générateur de morceaux : les fichiers doivent exister
+        jusqu'à la fin de l'itération.
+        """
+        entries = ((f"pdf_page_{i+1:03d}.pdf", path) for i, path in enumerate(paths))
+        return iter_zip(entries), zip_name
+
+    @staticmethod
+    def iter_split_zip(reader: PdfReader, prune: bool = True) -> Iterator[bytes]:
+        """
+        Divise un PDF page par page directement dans une archive ZIP en flux.
+        Chaque page n'est extraite qu'au moment d'être écrite dans l'archive.
+        """
+        entries = (
+            (f"pdf_page_{i+1:03d}.pdf", PDFEngine._create_single_page_pdf(page, prune))
+            for i, page in enumerate(reader.pages)
+        )
+        return iter_zip(entries)
+
+    @staticmethod
+    def split_to_stream(source: PDFSource, output: Union[str, Path, BinaryIO],
+                        max_pages: Optional[int] = None, prune: bool = True) -> dict:
+        """
+        Divise un PDF page par page dans un fichier ou un flux : archive ZIP
+        d'un PDF par page, ou le PDF de l'unique page s'il n'en a qu'une.
+        Retourne les statistiques : pages, archive ou non, octets écrits.
+        """
+        with PeakRSSTracker("split") as tracker, ExitStack() as stack:
+            reader = PDFEngine._open_reader(source, stack)
+            total_pages = len(reader.pages)
+            if max_pages is not None and total_pages > max_pages:
+                raise PageLimitExceeded(0, total_pages, max_pages)
+            if isinstance(output, (str, Path)):
+                output = stack.enter_context(open(output, "wb"))
+
+            if total_pages > 1:
+                chunks = PDFEngine.iter_split_zip(reader, prune)
+            else:
+                writer = PdfWriter()
+                PDFEngine._add_split_page(writer, reader.pages[0], prune)
+                chunks = PDFEngine._iter_writer_chunks(writer)
+            bytes_written = 0
+            for chunk in chunks:
+                output.write(chunk)
+                bytes_written += len(chunk)
+
+        stats = {
+            "pages": total_pages,
+            "archive": total_pages > 1,
+            "bytes_written": bytes_written,
+            **tracker.as_dict(),
+        }
+        logger.info(f"[split] {total_pages} pages, {bytes_written} octets en {stats['duration_s']}s")
+        return stats
+
+    @staticmethod
+    def rotate_to_stream(source: PDFSource, output: Union[str, Path, BinaryIO], angle: int,
+                         pages_input: str = "all", max_pages: Optional[int] = None,
+                         incremental: bool = True) -> dict:
+        """
+        Tourne les pages spécifiées d'un PDF.
+        Par défaut, seuls les dictionnaires des pages tournées sont ajoutés
+        au fichier d'origine (mise à jour incrémentale) ; réécriture
+        complète si le document est chiffré ou sa table xref endommagée.
+        Retourne les statistiques : pages, pages tournées, mode, octets écrits.
+        """
+        angle = int(angle)
+        if angle % 90:
+            raise ValueError("L'angle de rotation doit être un multiple de 90")
+
+        with PeakRSSTracker("rotate") as tracker, ExitStack() as stack:
+            reader = PDFEngine._open_reader(source, stack)
+            total_pages = len(reader.pages)
+            if max_pages is not None and total_pages > max_pages:
+                raise PageLimitExceeded(0, total_pages, max_pages)
+            pages_to_rotate = PDFEngine._normalize_pages_input(pages_input, total_pages)
+
+            if isinstance(output, (str, Path)):
+                output = stack.enter_context(open(output, "wb"))
+
+            update = None
+            if incremental:
+                try:
+                    update = IncrementalUpdate(reader)
+                    rotated_count = rotate_pages(update, pages_to_rotate, angle)
+                except IncrementalUnsupported as e:
+                    logger.info(f"[rotate] réécriture complète : {e}")
+                    update = None
+
+            if update is not None:
+                bytes_written = update.write(output)
+            else:
+                writer = PdfWriter()
+                rotated_count = 0
+                for i, page in enumerate(reader.pages):
+                    new_page = writer.add_page(page)
+                    if i in pages_to_rotate:
+                        PDFEngine.rotate_page(new_page, angle)
+                        rotated_count += 1
+                bytes_written = 0
+                for chunk in PDFEngine._iter_writer_chunks(writer):
+                    output.write(chunk)
+                    bytes_written += len(chunk)
+
+        stats = {
+            "pages": total_pages,
+            "rotated": rotated_count,
+            "incremental": update is not None,
+            "bytes_written": bytes_written,
+            **tracker.as_dict(),
+        }
+        logger.info(f"[rotate] {rotated_count}/{total_pages} pages "
+                    f"({'incrémental' if stats['incremental'] else 'réécriture'}), "
+                    f"{bytes_written} octets en {stats['duration_s']}s")
+        return stats
 
     @staticmethod
     def rotate(pdf_bytes: bytes, angle: int, pages_input: str) -> Tuple[bytes, int, int]:
         """Tourne les pages spécifiées d'un PDF"""
-        try:
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-        except Exception:
-            reader = PDFEngine._repair_pdf(pdf_bytes)
-        total_pages = len(reader.pages)
-        pages_to_rotate = PDFEngine._normalize_pages_input(pages_input, total_pages)
-        rotated_count = 0
-        writer = PdfWriter()
-        for i, page in enumerate(reader.pages):
-            if pages_to_rotate is None or i in pages_to_rotate:
-                PDFEngine.rotate_page(page, angle)
-                rotated_count += 1
-            writer.add_page(page)
-        return PDFEngine._writer_to_bytes(writer), total_pages, rotated_count
+        output = io.BytesIO()
+        stats = PDFEngine.rotate_to_stream(pdf_bytes, output, angle, pages_input)
+        return output.getvalue(), stats["pages"], stats["rotated"]
 
     @staticmethod
-    def compress(pdf_bytes: bytes) -> Tuple[bytes, int]:
-        """Compresse un PDF"""
-        try:
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-        except Exception:
-            reader = PDFEngine._repair_pdf(pdf_bytes)
-        writer = PdfWriter()
-        for page in reader.pages:
+    def update_metadata(source: PDFSource, output: Union[str, Path, BinaryIO],
+                        metadata: dict) -> dict:
+        """
+        Modifie les métadonnées (/Title, /Author...) par mise à jour
+        incrémentale, ou par réécriture complète si elle est impossible.
+        """
+        with ExitStack() as stack:
+            reader = PDFEngine._open_reader(source, stack)
+            if isinstance(output, (str, Path)):
+                output = stack.enter_context(open(output, "wb"))
             try:
-                page.compress_content_streams()
-            except AttributeError:
-                pass
-            writer.add_page(page)
-        return PDFEngine._writer_to_bytes(writer), len(reader.pages)
+                bytes_written = metadata_update(reader, metadata).write(output)
+                incremental = True
+            except IncrementalUnsupported as e:
+                logger.info(f"[metadata] réécriture complète : {e}")
+                writer = PdfWriter(clone_from=reader)
+                writer.add_metadata(metadata)
+                bytes_written = 0
+                for chunk in PDFEngine._iter_writer_chunks(writer):
+                    output.write(chunk)
+                    bytes_written += len(chunk)
+                incremental = False
+        return {"incremental": incremental, "bytes_written": bytes_written}
 
     @staticmethod
-    def preview(pdf_bytes: bytes, max_pages: int = 3) -> Tuple[List[str], int]:
-        """Génère des aperçus Base64 des premières pages"""
-        try:
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-        except Exception:
-            reader = PDFEngine._repair_pdf(pdf_bytes)
-        total_pages = len(reader.pages)
-        previews = []
-        for i in range(min(max_pages, total_pages)):
-            single_page_pdf = PDFEngine._create_single_page_pdf(reader.pages[i])
-            previews.append(base64.b64encode(single_page_pdf).decode())
+    def _source_size(source: PDFSource) -> int:
+        if isinstance(source, (bytes, bytearray)):
+            return len(source)
+        if isinstance(source, (str, os.PathLike)):
+            return os.path.getsize(source)
+        position = source.tell()
+        size = source.seek(0, io.SEEK_END)
+        source.seek(position)
+        return size
+
+    @staticmethod
+    def _source_bytes(source: PDFSource) -> bytes:
+        if isinstance(source, (bytes, bytearray)):
+            return bytes(source)
+        if isinstance(source, (str, os.PathLike)):
+            return Path(source).read_bytes()
+        source.seek(0)
+        return source.read()
+
+    @staticmethod
+    def compress_to_stream(source: PDFSource, output: Union[str, Path, BinaryIO],
+                           profile: str = "balanced", max_pages: Optional[int] = None,
+                           workers: Optional[int] = None) -> dict:
+        """
+        Compresse un PDF selon un profil (lossless, balanced, aggressive ;
+        les niveaux low/medium/high du formulaire sont acceptés).
+        Si le résultat n'est pas plus petit que la source, la source est
+        recopiée telle quelle.
+        Retourne les statistiques : tailles, réduction, images recodées,
+        objets fusionnés ou retirés, pic de RSS, durée.
+        """
+        profile, settings = resolve_profile(profile)
+        if workers is None:
+            workers = AppConfig.PDF_COMPRESSION_WORKERS
+
+        with PeakRSSTracker("compress") as tracker, ExitStack() as stack:
+            input_bytes = PDFEngine._source_size(source)
+            reader = PDFEngine._open_reader(source, stack)
+            page_count = len(reader.pages)
+            if max_pages is not None and page_count > max_pages:
+                raise PageLimitExceeded(0, page_count, max_pages)
+
+            writer = PdfWriter()
+            for page in reader.pages:
+                PDFEngine.add_page_pruned(writer, page)
+            if not settings["strip_metadata"] and reader.metadata:
+                writer.add_metadata(reader.metadata)
+
+            compression_stats = compress_writer(writer, settings, workers)
+            data = PDFEngine._writer_to_bytes(writer)
+            del writer
+
+            packed = pack_object_streams(data)
+            if packed is not None:
+                data = packed
+
+            kept_original = len(data) >= input_bytes
+            if kept_original:
+                data = PDFEngine._source_bytes(source)
+
+            if isinstance(output, (str, Path)):
+                output = stack.enter_context(open(output, "wb"))
+            output.write(data)
+
+        output_bytes = len(data)
+        stats = {
+            "profile": profile,
+            "pages": page_count,
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "reduction_pct": round(100 * (1 - output_bytes / input_bytes), 1) if input_bytes else 0.0,
+            "object_streams": packed is not None and not kept_original,
+            "kept_original": kept_original,
+            **compression_stats,
+            **tracker.as_dict(),
+        }
+        logger.info(f"[compress] profil {profile} : {input_bytes} → {output_bytes} octets "
+                    f"(-{stats['reduction_pct']} %), {stats['images_recompressed']} images recodées, "
+                    f"pic RSS {stats['peak_rss_mb']} MB en {stats['duration_s']}s")
+        return stats
+
+    @staticmethod
+    def compress(pdf_bytes: bytes, profile: str = "balanced") -> Tuple[bytes, int]:
+        """Compresse un PDF"""
+        output = io.BytesIO()
+        stats = PDFEngine.compress_to_stream(pdf_bytes, output, profile)
+        return output.getvalue(), stats["pages"]
+
+    @staticmethod
+    def preview(pdf_bytes: bytes, max_pages: int = 3, width: Optional[int] = None,
+                fmt: str = "png") -> Tuple[List[str], int]:
+        """
+        Génère des vignettes Base64 (PNG ou WebP) des premières pages.
+        Les pages suivantes restent disponibles à la demande via
+        thumbnails.render_thumbnail() (document enregistré sous son empreinte).
+        """
+        document_id, total_pages = register_document(pdf_bytes)
+        previews = [
+            base64.b64encode(render_thumbnail(document_id, i, width, fmt)).decode()
+            for i in range(min(max_pages, total_pages))
+        ]
         return previews, total_pages
@@ -0,0 +1,259 @@
+"""
+Mise à jour incrémentale de PDF (ISO 32000-1, § 7.5.6).
+
+Au lieu de réécrire tout le document, les objets modifiés sont ajoutés à
+la fin du fichier d'origine, suivis d'une nouvelle section xref dont le
+/Prev pointe vers l'ancienne. Les octets d'origine restent intacts : le
+coût dépend du nombre d'objets modifiés, pas de la taille du fichier.
+
+La section ajoutée reprend la forme de l'original : table xref classique,
+ou flux xref (/Type /XRef) si le document en utilise un.
+
+Non pris en charge (l'appelant se rabat sur une réécriture complète) :
+documents chiffrés et documents dont la table xref d'origine est
+endommagée, pour lesquels /Prev ne désignerait rien de valide.
+"""
+
+import io
+import re
+import shutil
+import struct
+import zlib
+import logging
+from datetime import datetime
+from typing import BinaryIO, Dict, Tuple
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    PdfObject,
+    TextStringObject,
+)
+
+logger = logging.getLogger(__name__)
+
+# Fin de fichier examinée pour trouver le dernier "startxref"
+_TAIL_SIZE = 4096
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_OBJECT_HEADER = re.compile(rb"\s*\d+\s+\d+\s+obj")
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class IncrementalUnsupported(Exception):
+    """Le document ne se prête pas à une mise à jour incrémentale"""
+
+
+def _locate_xref(stream: BinaryIO) -> Tuple[int, bool, int]:
+    """
+    Retourne (offset de la dernière section xref, flux xref ?, taille).
+    Vérifie que "startxref" désigne bien une table ou un flux xref.
+    """
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(max(0, size - _TAIL_SIZE))
+    matches = list(_STARTXREF.finditer(stream.read()))
+    if not matches:
+        raise IncrementalUnsupported("startxref introuvable")
+    offset = int(matches[-1].group(1))
+    if offset >= size:
+        raise IncrementalUnsupported("startxref hors du fichier")
+
+    stream.seek(offset)
+    head = stream.read(32)
+    if head.lstrip().startswith(b"xref"):
+        return offset, False, size
+    if _OBJECT_HEADER.match(head):
+        return offset, True, size
+    raise IncrementalUnsupported("startxref ne désigne pas une section xref")
+
+
+class IncrementalUpdate:
+    """
+    Section de mise à jour à ajouter à un PDF ouvert par `reader`.
+    Les objets remplacés gardent leur numéro ; les nouveaux prennent les
+    numéros suivants (/Size du trailer d'origine).
+    """
+
+    def __init__(self, reader: PdfReader):
+        if reader.is_encrypted:
+            raise IncrementalUnsupported("document chiffré")
+        self.reader = reader
+        self.prev_xref, self.xref_stream, self.original_size = _locate_xref(reader.stream)
+        self.trailer = reader.trailer
+        self._next_number = int(self.trailer.get("/Size", 0))
+        self._objects: Dict[int, Tuple[int, PdfObject]] = {}
+        self._info = self.trailer.raw_get("/Info") if "/Info" in self.trailer else None
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def update(self, reference: IndirectObject, obj: PdfObject):
+        """Remplace un objet existant (même numéro, même génération)"""
+        self._objects[reference.idnum] = (reference.generation, obj)
+
+    def add(self, obj: PdfObject) -> IndirectObject:
+        """Ajoute un nouvel objet et retourne sa référence"""
+        number = self._next_number
+        self._next_number += 1
+        self._objects[number] = (0, obj)
+        return IndirectObject(number, 0, self.reader)
+
+    def set_info(self, metadata: Dict[str, str]):
+        """Fusionne des entrées dans le dictionnaire /Info (métadonnées)"""
+        info = DictionaryObject()
+        if self._info is not None:
+            info.update(self._info.get_object())
+        for key, value in metadata.items():
+            info[NameObject(key)] = TextStringObject(value)
+        if isinstance(self._info, IndirectObject):
+            self.update(self._info, info)
+        else:
+            self._info = self.add(info)
+
+    # ------------------------------------------------------------
+
+    def _trailer_entries(self, size: int) -> DictionaryObject:
+        trailer = DictionaryObject()
+        trailer[NameObject("/Size")] = NumberObject(size)
+        trailer[NameObject("/Root")] = self.trailer.raw_get("/Root")
+        if self._info is not None:
+            trailer[NameObject("/Info")] = self._info
+        if "/ID" in self.trailer:
+            trailer[NameObject("/ID")] = self.trailer.raw_get("/ID")
+        trailer[NameObject("/Prev")] = NumberObject(self.prev_xref)
+        return trailer
+
+    def _write_objects(self, out: io.BytesIO, base: int) -> Dict[int, Tuple[int, int]]:
+        offsets: Dict[int, Tuple[int, int]] = {}
+        for number in sorted(self._objects):
+            generation, obj = self._objects[number]
+            offsets[number] = (base + out.tell(), generation)
+            out.write(f"{number} {generation} obj\n".encode())
+            obj.write_to_stream(out)
+            out.write(b"\nendobj\n")
+        return offsets
+
+    @staticmethod
+    def _subsections(numbers):
+        """Regroupe des numéros triés en plages contiguës [(début, nombre)]"""
+        ranges = []
+        for number in numbers:
+            if ranges and ranges[-1][0] + ranges[-1][1] == number:
+                ranges[-1][1] += 1
+            else:
+                ranges.append([number, 1])
+        return ranges
+
+    def _write_xref_table(self, out: io.BytesIO, base: int, offsets) -> int:
+        xref_offset = base + out.tell()
+        # Entrée 0 (tête de la liste des objets libres) en premier : certains
+        # lecteurs, dont pypdf, supposent une table indexée à partir de 0
+        out.write(b"xref\n0 1\n0000000000 65535 f \n")
+        for start, count in self._subsections(sorted(offsets)):
+            out.write(f"{start} {count}\n".encode())
+            for number in range(start, start + count):
+                offset, generation = offsets[number]
+                out.write(f"{offset:010d} {generation:05d} n \n".encode())
+        out.write(b"trailer\n")
+        self._trailer_entries(self._next_number).write_to_stream(out)
+        out.write(b"\n")
+        return xref_offset
+
+    def _write_xref_stream(self, out: io.BytesIO, base: int, offsets) -> int:
+        # Le flux xref est lui-même un objet : il se référence
+        number = self._next_number
+        xref_offset = base + out.tell()
+        offsets = dict(offsets)
+        offsets[number] = (xref_offset, 0)
+
+        # Offsets sur 4 octets, 8 au-delà de 4 Go
+        offset_width = 4 if xref_offset < 2 ** 32 else 8
+        row_format = ">BIH" if offset_width == 4 else ">BQH"
+
+        rows = bytearray()
+        index = []
+        for start, count in self._subsections(sorted(offsets)):
+            index += [start, count]
+            for n in range(start, start + count):
+                offset, generation = offsets[n]
+                rows += struct.pack(row_format, 1, offset, generation)
+        data = zlib.compress(bytes(rows))
+
+        xref = self._trailer_entries(number + 1)
+        xref[NameObject("/Type")] = NameObject("/XRef")
+        xref[NameObject("/W")] = _array(1, offset_width, 2)
+        xref[NameObject("/Index")] = _array(*index)
+        xref[NameObject("/Filter")] = NameObject("/FlateDecode")
+        xref[NameObject("/Length")] = NumberObject(len(data))
+
+        out.write(f"{number} 0 obj\n".encode())
+        xref.write_to_stream(out)
+        out.write(b"\nstream\n")
+        out.write(data)
+        out.write(b"\nendstream\nendobj\n")
+        return xref_offset
+
+    def build(self) -> bytes:
+        """Octets de la section à ajouter à la fin du fichier d'origine"""
+        out = io.BytesIO()
+        # Le fichier d'origine ne se termine pas forcément par une fin de ligne
+        out.write(b"\n")
+        base = self.original_size
+        offsets = self._write_objects(out, base)
+        if self.xref_stream:
+            xref_offset = self._write_xref_stream(out, base, offsets)
+        else:
+            xref_offset = self._write_xref_table(out, base, offsets)
+        out.write(f"startxref\n{xref_offset}\n%%EOF\n".encode())
+        return out.getvalue()
+
+    def write(self, output: BinaryIO) -> int:
+        """
+        Écrit le document mis à jour : octets d'origine recopiés par blocs,
+        puis la section incrémentale. Retourne le nombre d'octets écrits.
+        """
+        update = self.build()
+        source = self.reader.stream
+        source.seek(0)
+        shutil.copyfileobj(source, output, _COPY_CHUNK_SIZE)
+        output.write(update)
+        return self.original_size + len(update)
+
+
+def _array(*values) -> ArrayObject:
+    return ArrayObject(NumberObject(v) for v in values)
+
+
+def rotate_pages(update: IncrementalUpdate, page_indexes, angle: int) -> int:
+    """
+    Ajoute à la mise à jour les dictionnaires des pages tournées.
+    Les attributs hérités (/Rotate, /MediaBox...) ont été recopiés dans
+    chaque page par pypdf : la copie écrite est donc autonome.
+    Retourne le nombre de pages modifiées.
+    """
+    if angle % 90:
+        raise ValueError("L'angle de rotation doit être un multiple de 90")
+    pages = update.reader.pages
+    rotated = 0
+    for index in page_indexes:
+        page = pages[index]
+        reference = page.indirect_reference
+        if reference is None:
+            raise IncrementalUnsupported("page sans référence indirecte")
+        copy = DictionaryObject(page)
+        copy[NameObject("/Rotate")] = NumberObject((page.rotation + angle) % 360)
+        update.update(reference, copy)
+        rotated += 1
+    return rotated
+
+
+def metadata_update(reader: PdfReader, metadata: Dict[str, str]) -> IncrementalUpdate:
+    """Mise à jour incrémentale des métadonnées (/Info), /ModDate compris"""
+    update = IncrementalUpdate(reader)
+    metadata = dict(metadata)
+    metadata.setdefault("/ModDate", datetime.now().strftime("D:%Y%m%d%H%M%S"))
+    update.set_info(metadata)
+    return update
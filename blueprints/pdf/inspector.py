@@ -0,0 +1,437 @@
+"""
+Inspection rapide d'un PDF sans analyse complète.
+
+Lit uniquement l'en-tête, la fin du fichier (startxref), les sections
+xref et le trailer, puis la racine de l'arbre des pages : nombre de pages
+(/Count), version, dictionnaire de chiffrement, linéarisation et nombre
+de révisions. Le coût ne dépend pas de la taille du document : quelques
+lectures ciblées au lieu d'un PdfReader complet et du parcours de l'arbre
+des pages.
+
+Les entrées xref ne sont pas toutes chargées : la position d'un objet est
+calculée dans la sous-section qui le contient (entrées de 20 octets pour
+une table classique, de largeur /W pour un flux xref). Les objets rangés
+dans un flux d'objets (/ObjStm) sont lus en décodant ce seul flux.
+
+Si la structure ne se lit pas ainsi (xref endommagée, en-tête décalé,
+objets chiffrés dans un flux d'objets...), l'inspection retombe sur une
+analyse complète en mode tolérant.
+
+Le /Count déclaré n'est pas vérifié : il sert à refuser tôt, les limites
+restent appliquées par le moteur après l'analyse complète.
+"""
+
+import io
+import os
+import re
+import logging
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional, Union
+
+from pypdf import PdfReader
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    StreamObject,
+    read_object,
+)
+
+logger = logging.getLogger(__name__)
+
+HEAD_SIZE = 1024
+TAIL_SIZE = 2048
+# Garde-fous contre les chaînes /Prev circulaires ou démesurées
+MAX_XREF_SECTIONS = 512
+MAX_RESOLVE_DEPTH = 16
+
+_HEADER_RE = re.compile(rb"%PDF-(\d\.\d)")
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+_OBJ_RE = re.compile(rb"\s*(\d+)\s+(\d+)\s+obj")
+_SUBSECTION_RE = re.compile(rb"\s*(\d+)\s+(\d+)")
+_LENGTH_RE = re.compile(rb"/L\s+(\d+)")
+
+
+class InvalidPDF(ValueError):
+    """Fichier illisible, même par l'analyse complète"""
+
+
+class PDFInfo:
+    """Résultat d'une inspection"""
+
+    __slots__ = ("version", "page_count", "encrypted", "encryption",
+                 "linearized", "revisions", "size", "method")
+
+    def __init__(self, size: int):
+        self.version: Optional[str] = None
+        self.page_count: Optional[int] = None
+        self.encrypted = False
+        # /Filter, /SubFilter, /V, /R, /Length, /P du dictionnaire /Encrypt
+        self.encryption: Dict[str, object] = {}
+        self.linearized = False
+        # Sections xref (1 + nombre de mises à jour incrémentales)
+        self.revisions = 0
+        self.size = size
+        # "fast" : lecture ciblée, "full" : analyse complète
+        self.method = "fast"
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"PDFInfo({self.as_dict()})"
+
+
+class _GuardedStream:
+    """
+    Flux en lecture qui lève EOFError après quelques lectures en fin de
+    fichier : sur un tableau tronqué, les lecteurs d'objets de pypdf
+    relisent indéfiniment la fin au lieu d'échouer.
+    """
+
+    MAX_EOF_READS = 8
+
+    def __init__(self, raw: BinaryIO):
+        self.raw = raw
+        self._eof_reads = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        if size and not data:
+            self._eof_reads += 1
+            if self._eof_reads > self.MAX_EOF_READS:
+                raise EOFError("fin de fichier inattendue")
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.raw.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.raw.tell()
+
+
+class _XRefTable:
+    """Table classique : sous-sections (premier objet, nombre, position des entrées)"""
+
+    def __init__(self, subsections):
+        self.subsections = subsections
+
+    def lookup(self, reader: "_Reader", num: int):
+        for first, count, offset in self.subsections:
+            if first <= num < first + count:
+                entry = reader.read_at(offset + (num - first) * 20, 20)
+                if len(entry) < 18 or entry[17:18] not in (b"n", b"f"):
+                    raise ValueError("entrée xref invalide")
+                if entry[17:18] == b"f":
+                    return None
+                return ("offset", int(entry[:10]))
+        return None
+
+
+class _XRefStream:
+    """Flux xref (PDF 1.5+) : entrées binaires de largeur /W"""
+
+    def __init__(self, data: bytes, widths, index):
+        self.data = data
+        self.widths = widths
+        self.entry_size = sum(widths)
+        self.index = index
+
+    def _field(self, entry: bytes, position: int, default: int) -> int:
+        start = sum(self.widths[:position])
+        width = self.widths[position]
+        if width == 0:
+            return default
+        return int.from_bytes(entry[start:start + width], "big")
+
+    def lookup(self, reader: "_Reader", num: int):
+        base = 0
+        for first, count in self.index:
+            if first <= num < first + count:
+                start = (base + num - first) * self.entry_size
+                entry = self.data[start:start + self.entry_size]
+                if len(entry) < self.entry_size:
+                    raise ValueError("flux xref tronqué")
+                kind = self._field(entry, 0, 1)
+                if kind == 1:
+                    return ("offset", self._field(entry, 1, 0))
+                if kind == 2:
+                    return ("compressed", self._field(entry, 1, 0), self._field(entry, 2, 0))
+                return None
+            base += count
+        return None
+
+
+class _Reader:
+    """
+    Lecture ciblée d'un PDF. Sert aussi de `pdf` aux lecteurs d'objets de
+    pypdf (get_object, strict) : les références indirectes se résolvent
+    par la xref partielle.
+    """
+
+    strict = True
+
+    def __init__(self, stream: BinaryIO, size: int):
+        self.stream = _GuardedStream(stream)
+        self.size = size
+        self.sections = []
+        self.trailer = DictionaryObject()
+        self._object_streams: Dict[int, tuple] = {}
+        self._depth = 0
+        self.revisions = 0
+
+    def read_at(self, offset: int, length: int) -> bytes:
+        self.stream.seek(offset)
+        return self.stream.read(length)
+
+    # --- xref ---------------------------------------------------------
+
+    def load_xref(self):
+        tail_start = max(0, self.size - TAIL_SIZE)
+        matches = list(_STARTXREF_RE.finditer(self.read_at(tail_start, TAIL_SIZE)))
+        if not matches:
+            raise ValueError("startxref introuvable")
+        offset = int(matches[-1].group(1))
+
+        visited = set()
+        while offset is not None:
+            if offset in visited or len(visited) >= MAX_XREF_SECTIONS or offset >= self.size:
+                raise ValueError(f"chaîne xref invalide ({offset})")
+            visited.add(offset)
+            self.revisions += 1
+            trailer = self._read_section(offset)
+            # Les clés les plus récentes priment
+            for key, value in trailer.items():
+                if key not in self.trailer:
+                    self.trailer[key] = value
+            previous = trailer.get("/Prev")
+            offset = int(previous) if previous is not None else None
+
+    def _read_section(self, offset: int) -> DictionaryObject:
+        self.stream.seek(offset)
+        if self.stream.read(4) == b"xref":
+            return self._read_table()
+        return self._read_stream_section(offset)
+
+    def _read_table(self) -> DictionaryObject:
+        subsections = []
+        while True:
+            position = self.stream.tell()
+            line = self.stream.read(64)
+            stripped = line.lstrip()
+            if stripped.startswith(b"trailer"):
+                self.stream.seek(position + len(line) - len(stripped) + len(b"trailer"))
+                break
+            match = _SUBSECTION_RE.match(line)
+            if not match:
+                raise ValueError("sous-section xref invalide")
+            first, count = int(match.group(1)), int(match.group(2))
+            entries = position + match.end()
+            # Fin de ligne de l'en-tête de sous-section
+            while self.read_at(entries, 1) in (b" ", b"\r", b"\n"):
+                entries += 1
+            subsections.append((first, count, entries))
+            self.stream.seek(entries + count * 20)
+
+        self._skip_whitespace()
+        trailer = read_object(self.stream, self)
+        if not isinstance(trailer, DictionaryObject):
+            raise ValueError("trailer invalide")
+        self.sections.append(_XRefTable(subsections))
+
+        # Fichier hybride : objets compressés décrits par un flux xref annexe
+        if "/XRefStm" in trailer:
+            self._read_stream_section(int(trailer["/XRefStm"]))
+        return trailer
+
+    def _read_stream_section(self, offset: int) -> DictionaryObject:
+        stream = self._read_object_at(offset)
+        if not isinstance(stream, StreamObject) or stream.get("/Type") != "/XRef":
+            raise ValueError("flux xref invalide")
+        widths = [int(w) for w in stream["/W"]]
+        index = stream.get("/Index", ArrayObject([0, stream["/Size"]]))
+        pairs = [(int(index[i]), int(index[i + 1])) for i in range(0, len(index) - 1, 2)]
+        self.sections.append(_XRefStream(stream.get_data(), widths, pairs))
+        return stream
+
+    def _skip_whitespace(self):
+        while True:
+            char = self.stream.read(1)
+            if char not in (b" ", b"\r", b"\n", b"\t", b"\x00", b"\x0c"):
+                if char:
+                    self.stream.seek(-1, io.SEEK_CUR)
+                return
+
+    # --- objets -------------------------------------------------------
+
+    def _read_object_at(self, offset: int):
+        match = _OBJ_RE.match(self.read_at(offset, 32))
+        if not match:
+            raise ValueError(f"objet attendu à l'octet {offset}")
+        self.stream.seek(offset + match.end())
+        self._skip_whitespace()
+        return read_object(self.stream, self)
+
+    def _read_compressed(self, container: int, index: int):
+        if container not in self._object_streams:
+            stream = self.get_object(IndirectObject(container, 0, self))
+            if not isinstance(stream, StreamObject) or stream.get("/Type") != "/ObjStm":
+                raise ValueError(f"flux d'objets {container} invalide")
+            self._object_streams[container] = (stream.get_data(), int(stream["/First"]), int(stream["/N"]))
+        data, first, count = self._object_streams[container]
+        if index >= count:
+            raise ValueError(f"objet {index} absent du flux {container}")
+        numbers = data[:first].split()
+        buffer = _GuardedStream(io.BytesIO(data))
+        buffer.seek(first + int(numbers[index * 2 + 1]))
+        previous, self.stream = self.stream, buffer
+        try:
+            self._skip_whitespace()
+            return read_object(buffer, self)
+        finally:
+            self.stream = previous
+
+    def get_object(self, reference):
+        """Résout une référence indirecte (protocole `pdf` de pypdf)"""
+        if not isinstance(reference, IndirectObject):
+            return reference
+        if self._depth >= MAX_RESOLVE_DEPTH:
+            raise ValueError("références imbriquées trop profondément")
+        for section in self.sections:
+            entry = section.lookup(self, reference.idnum)
+            if entry is not None:
+                break
+        else:
+            return None
+
+        self._depth += 1
+        position = self.stream.tell()
+        try:
+            if entry[0] == "offset":
+                obj = self._read_object_at(entry[1])
+            else:
+                obj = self._read_compressed(entry[1], entry[2])
+        finally:
+            self.stream.seek(position)
+            self._depth -= 1
+        return obj
+
+
+def _resolve(reader, value):
+    while isinstance(value, IndirectObject):
+        value = reader.get_object(value)
+    return value
+
+
+def _encryption_summary(reader, encrypt) -> Dict[str, object]:
+    encrypt = _resolve(reader, encrypt)
+    if not isinstance(encrypt, dict):
+        return {}
+    summary = {}
+    for key, name in (("/Filter", "filter"), ("/SubFilter", "subfilter"), ("/V", "version"),
+                      ("/R", "revision"), ("/Length", "key_length_bits"), ("/P", "permissions")):
+        value = _resolve(reader, encrypt.get(key))
+        if value is not None:
+            summary[name] = int(value) if isinstance(value, int) else str(value)
+    # /P est un entier signé sur 32 bits, parfois écrit non signé
+    if summary.get("permissions", 0) >= 2 ** 31:
+        summary["permissions"] -= 2 ** 32
+    return summary
+
+
+def _read_head(info: PDFInfo, head: bytes) -> int:
+    """Version et linéarisation ; retourne la position de l'en-tête"""
+    match = _HEADER_RE.search(head)
+    if not match:
+        raise InvalidPDF("En-tête %PDF absent")
+    info.version = match.group(1).decode("ascii")
+
+    # Dictionnaire de linéarisation : premier objet du fichier. Il n'est
+    # valide que si /L correspond encore à la taille (pas de mise à jour)
+    obj = _OBJ_RE.search(head, match.end())
+    if obj:
+        end = head.find(b">>", obj.end())
+        first = head[obj.end():end]
+        if end > 0 and b"/Linearized" in first:
+            length = _LENGTH_RE.search(first)
+            info.linearized = bool(length) and int(length.group(1)) == info.size
+    return match.start()
+
+
+def _fast_inspect(info: PDFInfo, stream: BinaryIO):
+    reader = _Reader(stream, info.size)
+    reader.load_xref()
+    info.revisions = reader.revisions
+
+    if "/Encrypt" in reader.trailer:
+        info.encrypted = True
+        info.encryption = _encryption_summary(reader, reader.trailer["/Encrypt"])
+
+    root = _resolve(reader, reader.trailer.get("/Root"))
+    if not isinstance(root, dict):
+        raise ValueError("catalogue /Root introuvable")
+    # Le catalogue peut déclarer une version plus récente que l'en-tête
+    declared = _resolve(reader, root.get("/Version"))
+    if declared is not None and str(declared).lstrip("/") > (info.version or ""):
+        info.version = str(declared).lstrip("/")
+
+    pages = _resolve(reader, root.get("/Pages"))
+    if not isinstance(pages, dict):
+        raise ValueError("arbre des pages introuvable")
+    info.page_count = int(_resolve(reader, pages["/Count"]))
+    if info.page_count < 0:
+        raise ValueError("/Count négatif")
+
+
+def _full_inspect(info: PDFInfo, stream: BinaryIO):
+    stream.seek(0)
+    try:
+        reader = PdfReader(stream, strict=False)
+    except Exception as e:
+        raise InvalidPDF(f"PDF illisible : {e}") from e
+
+    info.method = "full"
+    info.revisions = max(info.revisions, 1)
+    info.encrypted = reader.is_encrypted
+    info.encryption = {}
+    if reader.is_encrypted:
+        info.encryption = _encryption_summary(reader, reader.trailer.get("/Encrypt"))
+    try:
+        info.page_count = len(reader.pages)
+    except Exception:
+        # Arbre des pages chiffré : nombre inconnu sans mot de passe
+        info.page_count = None
+
+
+def inspect_pdf(source: Union[str, Path, bytes, bytearray, BinaryIO],
+                full_fallback: bool = True) -> PDFInfo:
+    """
+    Inspecte un PDF (chemin, contenu ou flux binaire positionnable ; la
+    position d'un flux est conservée). Lève InvalidPDF si le fichier n'est
+    pas un PDF ou, avec `full_fallback`, s'il est illisible.
+    """
+    if isinstance(source, (str, Path)):
+        with open(source, "rb") as handle:
+            return inspect_pdf(handle, full_fallback)
+    if isinstance(source, (bytes, bytearray)):
+        return inspect_pdf(io.BytesIO(source), full_fallback)
+
+    position = source.tell()
+    try:
+        size = source.seek(0, os.SEEK_END)
+        info = PDFInfo(size)
+        source.seek(0)
+        if _read_head(info, source.read(HEAD_SIZE)) != 0:
+            # Octets avant l'en-tête : les positions de la xref sont décalées
+            raise ValueError("en-tête décalé")
+        _fast_inspect(info, source)
+    except InvalidPDF:
+        raise
+    except Exception as e:
+        if not full_fallback:
+            raise InvalidPDF(f"Structure PDF non lisible directement : {e}") from e
+        logger.debug(f"[inspector] lecture ciblée impossible ({e}), analyse complète")
+        _full_inspect(info, source)
+    finally:
+        source.seek(position)
+    return info
@@ -0,0 +1,117 @@
+"""
+Élagage des ressources de page pour la division de PDF.
+
+Beaucoup de générateurs partagent un unique dictionnaire /Resources entre
+toutes les pages. Copier une page seule dans un nouveau PdfWriter recopie
+alors toutes les polices et images du document. On ne garde ici que les
+ressources dont le nom apparaît réellement dans le flux de contenu de la
+page (ou d'un formulaire XObject qui hérite de ses ressources).
+"""
+
+import re
+import logging
+from typing import Optional, Set
+
+from pypdf.generic import ArrayObject, DictionaryObject, NameObject
+
+logger = logging.getLogger(__name__)
+
+# Catégories de ressources référencées par nom depuis le contenu
+PRUNABLE_CATEGORIES = (
+    "/Font", "/XObject", "/ExtGState", "/ColorSpace",
+    "/Pattern", "/Shading", "/Properties",
+)
+
+# Jeton de nom PDF : "/" suivi de caractères réguliers
+_NAME_TOKEN = re.compile(rb"/([^\s/\[\]<>(){}%]+)")
+_NAME_ESCAPE = re.compile(rb"#([0-9A-Fa-f]{2})")
+
+
+def _decode_name(raw: bytes) -> str:
+    """Décode un nom PDF (échappements #xx compris) comme le fait pypdf"""
+    raw = _NAME_ESCAPE.sub(lambda m: bytes([int(m.group(1), 16)]), raw)
+    try:
+        return "/" + raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return "/" + raw.decode("latin-1")
+
+
+def content_names(data: bytes) -> Set[str]:
+    """
+    Ensemble des noms présents dans un flux de contenu.
+    Sur-ensemble volontaire des ressources utilisées : un nom de trop ne
+    fait que conserver une ressource, jamais en retirer une nécessaire.
+    """
+    return {_decode_name(m.group(1)) for m in _NAME_TOKEN.finditer(data)}
+
+
+def _contents_data(contents) -> bytes:
+    """Données décodées d'un /Contents (flux unique ou tableau de flux)"""
+    if contents is None:
+        return b""
+    contents = contents.get_object()
+    if isinstance(contents, ArrayObject):
+        return b"\n".join(part.get_object().get_data() for part in contents)
+    return contents.get_data()
+
+
+def _inherited_form_names(xobjects: DictionaryObject, used: Set[str]) -> Set[str]:
+    """
+    Noms utilisés par les formulaires XObject sans /Resources propres,
+    qui puisent dans les ressources de la page (usage PDF 1.1 toléré).
+    """
+    extra: Set[str] = set()
+    pending = [name for name in used if name in xobjects]
+    seen = set()
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        xobject = xobjects[name].get_object()
+        if xobject.get("/Subtype") != "/Form" or "/Resources" in xobject:
+            continue
+        names = content_names(xobject.get_data())
+        extra |= names
+        pending.extend(n for n in names if n in xobjects)
+    return extra
+
+
+def prune_page_resources(page) -> Optional[DictionaryObject]:
+    """
+    Construit un dictionnaire /Resources réduit aux ressources utilisées
+    par la page. Les valeurs restent des références vers le document
+    source : seul ce qui est conservé sera cloné dans le PdfWriter.
+    Retourne None si la page n'a pas de ressources ou si le contenu ne
+    peut pas être analysé (la page est alors copiée telle quelle).
+    """
+    resources = page.get("/Resources")
+    if resources is None:
+        return None
+
+    try:
+        resources = resources.get_object()
+        used = content_names(_contents_data(page.get("/Contents")))
+        xobjects = resources.get("/XObject")
+        if xobjects is not None:
+            used |= _inherited_form_names(xobjects.get_object(), used)
+    except Exception as e:
+        logger.debug(f"[split] analyse du contenu impossible, ressources conservées : {e}")
+        return None
+
+    pruned = DictionaryObject()
+    for category in resources:
+        value = resources.raw_get(category)
+        if category not in PRUNABLE_CATEGORIES:
+            pruned[NameObject(category)] = value
+            continue
+        entries = value.get_object()
+        if not isinstance(entries, DictionaryObject):
+            pruned[NameObject(category)] = value
+            continue
+        kept = DictionaryObject({
+            NameObject(name): entries.raw_get(name) for name in entries if name in used
+        })
+        if kept:
+            pruned[NameObject(category)] = kept
+    return pruned
@@ -5,8 +5,10 @@ Version ULTRA ROBUSTE — Production Ready
 from flask import flash
 import io
 import json
+import base64
 import uuid
 from datetime import datetime
+from functools import wraps
 from pathlib import Path
 
 from flask import (
@@ -30,11 +32,22 @@ from config import AppConfig
 from pypdf import PdfReader, PdfWriter
 
 from managers import stats_manager
-from .engine import PDFEngine
+from managers.job_manager import enqueue_request, should_enqueue
+from utils.process_pool import WorkerCrashed, process_pool
+from utils.admission import AdmissionRejected, admission, rejection_response
+from utils.uploads import spooled
+from utils.result_cache import result_cache, result_key
+from utils.singleflight import single_flight
+from .document_cache import DocumentSource, upload_source
+from .engine import PDFEngine, PageLimitExceeded
+from .inspector import InvalidPDF, inspect_pdf
+from . import thumbnails
 
 # Initialiser dossiers
 AppConfig.initialize()
 
+MAX_PAGES_PER_FILE = 500
+
 
 # ============================================================
 # HELPERS
@@ -42,38 +55,38 @@ AppConfig.initialize()
 
 def save_temp_file(file, subfolder="general"):
     """
-    Sauvegarde sécurisée sur disque.
+    Place le fichier reçu dans le dossier de conversion, sans recopie :
+    taille, format et empreinte ont été relevés pendant la réception
+    (utils/uploads.py).
     Protège contre :
     - fichiers vides
     - fichiers énormes
-    - faux PDF
+    - faux PDF (voir validate_pdf)
     """
 
     if not file or file.filename == "":
         raise ValueError(_("Fichier invalide"))
 
-    # IMPORTANT: Reset stream position avant lecture
-    file.stream.seek(0)
-    
-    temp_dir = AppConfig.get_conversion_temp_dir(subfolder)
-    temp_dir.mkdir(parents=True, exist_ok=True)
+    upload = spooled(file)
 
-    filename = f"{uuid.uuid4()}{Path(file.filename).suffix.lower()}"
-    path = temp_dir / filename
+    if upload.rejected:
+        raise ValueError(_("Fichier trop volumineux"))
 
-    file.save(path)
+    if upload.size == 0:
+        raise ValueError(_("Fichier vide"))
 
-    size = path.stat().st_size
+    temp_dir = AppConfig.get_conversion_temp_dir(subfolder)
+    temp_dir.mkdir(parents=True, exist_ok=True)
 
-    if size == 0:
-        path.unlink(missing_ok=True)
-        raise ValueError(_("Fichier vide"))
+    return upload.claim(temp_dir, f"{uuid.uuid4()}{Path(file.filename).suffix.lower()}")
 
-    if size > AppConfig.MAX_CONTENT_SIZE:
-        path.unlink(missing_ok=True)
-        raise ValueError(_("Fichier trop volumineux"))
 
-    return path
+def document_source(file, path: Path) -> DocumentSource:
+    """
+    Fichier reçu transmis au pool, avec sa clé dans le cache des documents
+    analysés (session + empreinte relevée à la réception)
+    """
+    return upload_source(path, spooled(file).sha256)
 
 
 def validate_pdf(path: Path):
@@ -88,6 +101,66 @@ def validate_pdf(path: Path):
         raise ValueError(_("Fichier corrompu ou non-PDF"))
 
 
+def check_page_limit(path: Path, filename: str = None):
+    """
+    Refuse un fichier de plus de MAX_PAGES_PER_FILE pages d'après son
+    inspection rapide (trailer, racine de l'arbre des pages), avant toute
+    analyse complète.
+    """
+    try:
+        info = inspect_pdf(path)
+    except InvalidPDF:
+        path.unlink(missing_ok=True)
+        raise ValueError(_("Fichier corrompu ou non-PDF"))
+
+    if info.page_count is not None and info.page_count > MAX_PAGES_PER_FILE:
+        path.unlink(missing_ok=True)
+        if filename:
+            raise ValueError(_("Fichier %(name)s contient trop de pages") % {"name": filename})
+        raise ValueError(_("Fichier contient trop de pages"))
+    return info
+
+
+def cached_result(operation: str, files):
+    """
+    Clé du résultat (fichiers reçus + formulaire) et, s'il est déjà en
+    cache, la réponse qui le sert sans recalcul.
+    """
+    files = [f for f in files if f and f.filename]
+    if not files:
+        return None, None
+    key = result_key(operation, files, request.form)
+    entry = result_cache.get(key)
+    if entry is None:
+        return key, None
+    stats_manager.increment("total_operations")
+    return key, result_cache.send(key, entry)
+
+
+def coalesced(operation: str, field: str = "file", long_running: bool = False):
+    """
+    Envoi (POST) d'une opération du moteur PDF : résultat en cache, mise en
+    file asynchrone, ou exécution regroupée avec les requêtes identiques en
+    cours (utils/singleflight.py). La vue reçoit la clé du résultat (cache_key).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "POST":
+                return view(*args, **kwargs)
+
+            cache_key, cached = cached_result(operation, request.files.getlist(field))
+            if cached:
+                return cached
+
+            if should_enqueue(request, long_running=long_running):
+                return enqueue_request(operation)
+
+            return single_flight.run(cache_key, lambda: view(*args, cache_key=cache_key, **kwargs))
+        return wrapper
+    return decorator
+
+
 def cleanup_files(paths):
     for p in paths:
         try:
@@ -105,42 +178,13 @@ def pdf_index():
     return render_template("pdf/index.html")
 
 
-# ==========================================
-# LECTURE SÉCURISÉE DES FICHIERS
-# ==========================================
-
-def read_uploaded_pdf(file):
-    if not file or file.filename == "":
-        raise ValueError(_("Fichier invalide"))
-
-    if not file.filename.lower().endswith(".pdf"):
-        raise ValueError(_("%(filename)s n'est pas un PDF") % {"filename": file.filename})
-
-    # IMPORTANT: Reset stream position avant lecture
-    file.stream.seek(0)
-    data = file.read()
-    
-    if len(data) > AppConfig.MAX_CONTENT_SIZE:
-        raise ValueError(_("Fichier trop volumineux"))
-
-    if not data:
-        raise ValueError(_("%(filename)s est vide") % {"filename": file.filename})
-
-    if not data.startswith(b"%PDF"):
-        raise ValueError(_("%(filename)s est corrompu ou non-PDF") % {"filename": file.filename})
-        
-    # IMPORTANT: Reset stream position après lecture pour permettre save()
-    file.stream.seek(0)
-
-    return data
-
-
 # ============================================================
 # MERGE — FULL DISK MODE
 # ============================================================
 
 @pdf_bp.route("/merge", methods=["GET", "POST"])
-def merge():
+@coalesced("merge", field="files")
+def merge(cache_key=None):
     if request.method == "GET":
         return render_template("pdf/merge.html")
 
@@ -161,31 +205,38 @@ def merge():
             }), 400
 
 
-        writer = PdfWriter()
-        total_pages = 0
-
+        sources = []
         for f in files:
             path = save_temp_file(f, "pdf")
             validate_pdf(path)
+            check_page_limit(path, f.filename)
 
             temp_paths.append(path)
+            sources.append(document_source(f, path))
 
-            reader = PdfReader(str(path), strict=False)
-            
-            if len(reader.pages) > 500:
-                raise ValueError(_("Fichier %(name)s contient trop de pages") % {"name": f.filename})
-
-            for page in reader.pages:
-                writer.add_page(page)
-                total_pages += 1
-
+        input_paths = list(temp_paths)
         output_path = AppConfig.get_conversion_temp_dir("pdf") / f"{uuid.uuid4()}_merged.pdf"
-
-        with open(output_path, "wb") as out:
-            writer.write(out)
-
         temp_paths.append(output_path)
 
+        # Écriture incrémentale sur disque : ni les entrées ni la sortie
+        # ne sont chargées entièrement en mémoire. Exécution dans le pool
+        # de processus : les threads web restent disponibles
+        try:
+            with admission.admit("merge", admission.estimate_upload("merge", input_paths)) as ticket:
+                merge_stats = process_pool.run(
+                    PDFEngine.merge_to_stream, sources, output_path, max_pages=MAX_PAGES_PER_FILE,
+                    affinity=sources[0].key
+                )
+                ticket.record(merge_stats["delta_rss_mb"] if merge_stats["isolated"] else None)
+        except PageLimitExceeded as e:
+            raise ValueError(_("Fichier %(name)s contient trop de pages") % {"name": files[e.index].filename})
+
+        current_app.logger.info(
+            f"Merge: {merge_stats['pages']} pages, {merge_stats['bytes_written']} octets "
+            f"({merge_stats['dedup_bytes_saved']} économisés par déduplication), "
+            f"pic RSS {merge_stats['peak_rss_mb']} MB"
+        )
+
         stats_manager.increment("merges")
         stats_manager.increment("total_operations")
 
@@ -194,17 +245,29 @@ def merge():
             cleanup_files(temp_paths)
             return response
 
-        return send_file(
+        response = send_file(
             output_path,
             as_attachment=True,
             download_name=f"fusion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
             mimetype="application/pdf"
         )
+        response.headers["X-Peak-RSS-MB"] = str(merge_stats["peak_rss_mb"])
+        response.headers["X-Dedup-Bytes-Saved"] = str(merge_stats["dedup_bytes_saved"])
+        result_cache.store_file(cache_key, output_path, "fusion.pdf", "application/pdf", response.headers)
+        return response
 
     except ValueError as e:
         cleanup_files(temp_paths)
         return jsonify({"error": str(e)}), 400
 
+    except AdmissionRejected as e:
+        cleanup_files(temp_paths)
+        return rejection_response(e)
+
+    except (WorkerCrashed, TimeoutError) as e:
+        cleanup_files(temp_paths)
+        return jsonify({"error": str(e)}), 503
+
     except Exception:
         cleanup_files(temp_paths)
         current_app.logger.exception("Merge PDF échoué")
@@ -216,7 +279,8 @@ def merge():
 # ============================================================
 
 @pdf_bp.route("/split", methods=["GET", "POST"])
-def split():
+@coalesced("split")
+def split(cache_key=None):
     if request.method == "GET":
         return render_template("pdf/split.html")
 
@@ -231,63 +295,63 @@ def split():
         # SOLUTION: Sauvegarder d'abord, lire ensuite
         path = save_temp_file(file, "pdf")
         validate_pdf(path)
+        check_page_limit(path)
 
         temp_paths.append(path)
+        source = document_source(file, path)
 
-        reader = PdfReader(str(path), strict=False)
-        
-        if len(reader.pages) > 500:
-            raise ValueError(_("Fichier contient trop de pages"))
-
-        output_files = []
-        temp_dir = AppConfig.get_conversion_temp_dir("pdf")
-
-        for i, page in enumerate(reader.pages):
-            writer = PdfWriter()
-            writer.add_page(page)
-
-            output_path = temp_dir / f"{uuid.uuid4()}_page_{i+1}.pdf"
-
-            with open(output_path, "wb") as f:
-                writer.write(f)
+        output_path = AppConfig.get_conversion_temp_dir("pdf") / f"{uuid.uuid4()}_split.bin"
+        temp_paths.append(output_path)
 
-            output_files.append(output_path)
-            temp_paths.append(output_path)
+        # Extraction des pages dans un processus du pool : l'archive est
+        # écrite sur disque, puis envoyée comme un fichier
+        try:
+            with admission.admit("split", admission.estimate_upload("split", [path])) as ticket:
+                split_stats = process_pool.run(
+                    PDFEngine.split_to_stream, source, output_path,
+                    max_pages=MAX_PAGES_PER_FILE, affinity=source.key
+                )
+                ticket.record(split_stats["delta_rss_mb"] if split_stats["isolated"] else None)
+        except PageLimitExceeded:
+            raise ValueError(_("Fichier contient trop de pages"))
 
-        if len(output_files) > 1:
-            zip_bytes, zip_name = PDFEngine.create_zip_from_paths(output_files)
+        current_app.logger.info(
+            f"Split: {split_stats['pages']} pages, {split_stats['bytes_written']} octets "
+            f"en {split_stats['duration_s']}s"
+        )
 
+        if split_stats["archive"]:
             stats_manager.increment("splits")
             stats_manager.increment("total_operations")
-
-            @after_this_request
-            def cleanup(response):
-                cleanup_files(temp_paths)
-                return response
-
-            return send_file(
-                io.BytesIO(zip_bytes),
-                as_attachment=True,
-                download_name=zip_name,
-                mimetype="application/zip"
-            )
+            download_name, mimetype = "pdf_split_results.zip", "application/zip"
+        else:
+            download_name, mimetype = "split.pdf", "application/pdf"
 
         @after_this_request
         def cleanup(response):
             cleanup_files(temp_paths)
             return response
 
+        result_cache.store_file(cache_key, output_path, download_name, mimetype)
         return send_file(
-            output_files[0],
+            output_path,
             as_attachment=True,
-            download_name="split.pdf",
-            mimetype="application/pdf"
+            download_name=download_name,
+            mimetype=mimetype
         )
 
     except ValueError as e:
         cleanup_files(temp_paths)
         return jsonify({"error": str(e)}), 400
 
+    except AdmissionRejected as e:
+        cleanup_files(temp_paths)
+        return rejection_response(e)
+
+    except (WorkerCrashed, TimeoutError) as e:
+        cleanup_files(temp_paths)
+        return jsonify({"error": str(e)}), 503
+
     except Exception:
         cleanup_files(temp_paths)
         current_app.logger.exception("Split crash")
@@ -299,7 +363,8 @@ def split():
 # ============================================================
 
 @pdf_bp.route("/rotate", methods=["GET", "POST"])
-def rotate():
+@coalesced("rotate")
+def rotate(cache_key=None):
     if request.method == "GET":
         return render_template("pdf/rotate.html")
 
@@ -314,28 +379,33 @@ def rotate():
         # SOLUTION: Sauvegarder d'abord, lire ensuite
         path = save_temp_file(file, "pdf")
         validate_pdf(path)
+        check_page_limit(path)
 
         temp_paths.append(path)
+        source = document_source(file, path)
 
         angle = int(request.form.get("angle", 90))
-
-        reader = PdfReader(str(path), strict=False)
-        
-        if len(reader.pages) > 500:
-            raise ValueError(_("Fichier contient trop de pages"))
-        
-        writer = PdfWriter()
-
-        for page in reader.pages:
-            page.rotate(angle)
-            writer.add_page(page)
+        pages_input = request.form.get("pages", "all")
 
         output_path = AppConfig.get_conversion_temp_dir("pdf") / f"{uuid.uuid4()}_rotated.pdf"
+        temp_paths.append(output_path)
 
-        with open(output_path, "wb") as f:
-            writer.write(f)
+        # Mise à jour incrémentale : seules les pages tournées sont réécrites
+        try:
+            with admission.admit("rotate", admission.estimate_upload("rotate", [path])) as ticket:
+                rotate_stats = process_pool.run(
+                    PDFEngine.rotate_to_stream, source, output_path, angle, pages_input,
+                    max_pages=MAX_PAGES_PER_FILE, affinity=source.key
+                )
+                ticket.record(rotate_stats["delta_rss_mb"] if rotate_stats["isolated"] else None)
+        except PageLimitExceeded:
+            raise ValueError(_("Fichier contient trop de pages"))
 
-        temp_paths.append(output_path)
+        current_app.logger.info(
+            f"Rotate: {rotate_stats['rotated']}/{rotate_stats['pages']} pages, "
+            f"{'incrémental' if rotate_stats['incremental'] else 'réécriture'} "
+            f"en {rotate_stats['duration_s']}s"
+        )
 
         stats_manager.increment("rotations")
         stats_manager.increment("total_operations")
@@ -345,6 +415,7 @@ def rotate():
             cleanup_files(temp_paths)
             return response
 
+        result_cache.store_file(cache_key, output_path, "rotation.pdf", "application/pdf")
         return send_file(
             output_path,
             as_attachment=True,
@@ -356,6 +427,14 @@ def rotate():
         cleanup_files(temp_paths)
         return jsonify({"error": str(e)}), 400
 
+    except AdmissionRejected as e:
+        cleanup_files(temp_paths)
+        return rejection_response(e)
+
+    except (WorkerCrashed, TimeoutError) as e:
+        cleanup_files(temp_paths)
+        return jsonify({"error": str(e)}), 503
+
     except Exception:
         cleanup_files(temp_paths)
         current_app.logger.exception("Rotate crash")
@@ -367,7 +446,9 @@ def rotate():
 # ============================================================
 
 @pdf_bp.route("/compress", methods=["GET", "POST"])
-def compress():
+# Recodage des images : traitement long, même pour un petit fichier
+@coalesced("compress", long_running=True)
+def compress(cache_key=None):
     if request.method == "GET":
         return render_template("pdf/compress.html")
 
@@ -382,27 +463,30 @@ def compress():
         # SOLUTION: Sauvegarder d'abord, lire ensuite
         path = save_temp_file(file, "pdf")
         validate_pdf(path)
+        check_page_limit(path)
 
         temp_paths.append(path)
+        source = document_source(file, path)
 
-        reader = PdfReader(str(path), strict=False)
-        
-        if len(reader.pages) > 500:
-            raise ValueError(_("Fichier contient trop de pages"))
-        
-        writer = PdfWriter()
-
-        for page in reader.pages:
-            writer.add_page(page)
-
-        writer.add_metadata(reader.metadata)
-
+        profile = AppConfig.get_compression_profile(request.form.get("compression", "medium"))
         output_path = AppConfig.get_conversion_temp_dir("pdf") / f"{uuid.uuid4()}_compressed.pdf"
+        temp_paths.append(output_path)
 
-        with open(output_path, "wb") as f:
-            writer.write(f)
+        try:
+            with admission.admit("compress", admission.estimate_upload("compress", [path])) as ticket:
+                compress_stats = process_pool.run(
+                    PDFEngine.compress_to_stream, source, output_path, profile,
+                    max_pages=MAX_PAGES_PER_FILE, affinity=source.key
+                )
+                ticket.record(compress_stats["delta_rss_mb"] if compress_stats["isolated"] else None)
+        except PageLimitExceeded:
+            raise ValueError(_("Fichier contient trop de pages"))
 
-        temp_paths.append(output_path)
+        current_app.logger.info(
+            f"Compress ({profile}): {compress_stats['input_bytes']} → "
+            f"{compress_stats['output_bytes']} octets (-{compress_stats['reduction_pct']} %), "
+            f"pic RSS {compress_stats['peak_rss_mb']} MB"
+        )
 
         stats_manager.increment("compressions")
         stats_manager.increment("total_operations")
@@ -412,25 +496,37 @@ def compress():
             cleanup_files(temp_paths)
             return response
 
-        return send_file(
+        response = send_file(
             output_path,
             as_attachment=True,
             download_name="compresse.pdf",
             mimetype="application/pdf"
         )
+        response.headers["X-Compression-Profile"] = profile
+        response.headers["X-Original-Size"] = str(compress_stats["input_bytes"])
+        response.headers["X-Compressed-Size"] = str(compress_stats["output_bytes"])
+        response.headers["X-Size-Reduction-Pct"] = str(compress_stats["reduction_pct"])
+        result_cache.store_file(cache_key, output_path, "compresse.pdf", "application/pdf", response.headers)
+        return response
 
     except ValueError as e:
         cleanup_files(temp_paths)
         return jsonify({"error": str(e)}), 400
 
+    except AdmissionRejected as e:
+        cleanup_files(temp_paths)
+        return rejection_response(e)
+
+    except (WorkerCrashed, TimeoutError) as e:
+        cleanup_files(temp_paths)
+        return jsonify({"error": str(e)}), 503
+
     except Exception:
         cleanup_files(temp_paths)
         current_app.logger.exception("Compress crash")
         return jsonify({"error": _("Erreur interne serveur")}), 500
 
 
-MAX_PAGES_PER_FILE = 500
-
 
 # -------------------------------
 # OCR image → texte
@@ -496,45 +592,84 @@ def ocr_image():
 @pdf_bp.route("/preview", methods=["POST"])
 def handle_preview():
 
+    temp_paths = []
+
     try:
         if "file" not in request.files:
             return jsonify({"error": _("Aucun fichier")}), 400
-            
+
         file = request.files["file"]
-        
-        # Reset stream avant lecture
-        file.stream.seek(0)
-        data = file.read()
-        
-        if len(data) > AppConfig.MAX_CONTENT_SIZE:
-            raise ValueError(_("Fichier trop volumineux"))
-            
-        # Reset stream pour permettre réutilisation
-        file.stream.seek(0)
-            
-        if not data:
-            raise ValueError(_("%(filename)s est vide") % {"filename": file.filename})
-        
-        if not data.startswith(b"%PDF"):
-            raise ValueError(_("%(filename)s est corrompu ou non-PDF") % {"filename": file.filename})
+        width = thumbnails.thumbnail_width(request.form.get("width"))
+        fmt = thumbnails.thumbnail_format(request.form.get("format"))
+        max_pages = min(int(request.form.get("max_pages", 3)), MAX_PAGES_PER_FILE)
+
+        path = save_temp_file(file, "pdf")
+        temp_paths.append(path)
+        validate_pdf(path)
 
+        # Le fichier est déplacé dans le dossier des aperçus : les pages
+        # suivantes se chargent ensuite à la demande via /preview/<id>/<page>
+        document_id, total_pages = thumbnails.register_document(path)
 
-        previews, total_pages = PDFEngine.preview(data)
+        previews = [
+            base64.b64encode(thumbnails.render_thumbnail(document_id, i, width, fmt)).decode()
+            for i in range(min(max_pages, total_pages))
+        ]
 
         stats_manager.increment("previews")
 
         return jsonify({
             "success": True,
+            "document_id": document_id,
+            "format": fmt,
+            "width": width,
             "previews": previews,
+            "pages": [
+                url_for("pdf.preview_page", document_id=document_id, page=i + 1,
+                        width=width, format=fmt)
+                for i in range(total_pages)
+            ],
             "total_pages": total_pages
         })
 
-    except Exception as e:
-        current_app.logger.exception("Crash /preview")
-    if isinstance(e, ValueError):
+    except ValueError as e:
+        cleanup_files(temp_paths)
         return jsonify({"error": str(e)}), 400
-    
-    return jsonify({"error": _("Erreur interne serveur")}), 500
+
+    except thumbnails.PreviewUnavailable:
+        cleanup_files(temp_paths)
+        return jsonify({"error": _("Aperçu indisponible")}), 503
+
+    except Exception:
+        cleanup_files(temp_paths)
+        current_app.logger.exception("Crash /preview")
+        return jsonify({"error": _("Erreur interne serveur")}), 500
+
+
+@pdf_bp.route("/preview/<document_id>/<int:page>", methods=["GET"])
+def preview_page(document_id, page):
+    """Vignette d'une page, rendue à la demande puis servie depuis le cache"""
+    width = thumbnails.thumbnail_width(request.args.get("width"))
+    fmt = thumbnails.thumbnail_format(request.args.get("format"))
+
+    try:
+        data = thumbnails.render_thumbnail(document_id, page - 1, width, fmt)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except thumbnails.PreviewUnavailable:
+        return jsonify({"error": _("Aperçu indisponible")}), 503
+    except Exception:
+        current_app.logger.exception("Crash /preview page")
+        return jsonify({"error": _("Erreur interne serveur")}), 500
+
+    # Contenu entièrement déterminé par l'URL : cache navigateur durable
+    return send_file(
+        io.BytesIO(data),
+        mimetype=thumbnails.THUMBNAIL_FORMATS[fmt],
+        etag=f"{document_id[:16]}-{page}-{width}-{fmt}",
+        max_age=AppConfig.PREVIEW_DOCUMENT_TTL,
+        conditional=True
+    )
 
 
 
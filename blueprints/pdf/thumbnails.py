@@ -0,0 +1,210 @@
+"""
+Vignettes d'aperçu rendues côté serveur.
+
+Un PDF envoyé pour aperçu est rangé sous son empreinte SHA-256 dans le
+dossier des aperçus ; chaque page peut ensuite être demandée séparément,
+à la largeur voulue, en PNG ou en WebP. Les images produites sont gardées
+dans un cache LRU borné, indexé par (empreinte, page, largeur, format) :
+un second aperçu du même fichier ne rend plus rien.
+
+Rendu par PyMuPDF, ou par pdf2image (poppler) à défaut.
+"""
+
+import io
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from PIL import Image
+
+from config import AppConfig
+from utils.cache import LRUCache
+
+try:
+    import fitz  # PyMuPDF
+    HAS_FITZ = True
+except ImportError:
+    HAS_FITZ = False
+
+try:
+    from pdf2image import convert_from_path
+    HAS_PDF2IMAGE = True
+except ImportError:
+    HAS_PDF2IMAGE = False
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMATS = {"png": "image/png", "webp": "image/webp"}
+WEBP_QUALITY = 80
+
+_DOCUMENT_ID = re.compile(r"^[0-9a-f]{64}$")
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# PyMuPDF n'est pas sûr entre threads : un rendu à la fois
+_RENDER_LOCK = threading.Lock()
+
+thumbnail_cache = LRUCache(
+    max_entries=2048,
+    max_bytes=AppConfig.THUMBNAIL_CACHE_MB * 1024 * 1024,
+)
+# Nombre de pages par document, pour éviter de rouvrir le fichier
+_page_counts = LRUCache(max_entries=1024, sizeof=lambda value: 0)
+
+
+class PreviewUnavailable(RuntimeError):
+    """Aucun moteur de rendu (PyMuPDF, poppler) n'est disponible"""
+
+
+def thumbnail_width(value) -> int:
+    """Largeur demandée, bornée ; largeur par défaut si absente ou invalide"""
+    try:
+        width = int(value)
+    except (TypeError, ValueError):
+        return AppConfig.THUMBNAIL_DEFAULT_WIDTH
+    return max(AppConfig.THUMBNAIL_MIN_WIDTH, min(width, AppConfig.THUMBNAIL_MAX_WIDTH))
+
+
+def thumbnail_format(value) -> str:
+    value = (value or "png").lower()
+    return value if value in THUMBNAIL_FORMATS else "png"
+
+
+def _store_dir() -> Path:
+    directory = AppConfig.get_conversion_temp_dir("previews")
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def document_path(document_id: str) -> Optional[Path]:
+    """Chemin du PDF enregistré, None si l'identifiant est invalide ou expiré"""
+    if not _DOCUMENT_ID.match(document_id or ""):
+        return None
+    path = _store_dir() / f"{document_id}.pdf"
+    return path if path.exists() else None
+
+
+def _purge_expired(directory: Path):
+    limit = time.time() - AppConfig.PREVIEW_DOCUMENT_TTL
+    for path in directory.glob("*.pdf"):
+        try:
+            if path.stat().st_mtime < limit:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def _count_pages(path: Path) -> int:
+    if HAS_FITZ:
+        with _RENDER_LOCK, fitz.open(path) as doc:
+            if doc.needs_pass:
+                raise ValueError("PDF protégé par mot de passe")
+            return doc.page_count
+    from pypdf import PdfReader
+    with open(path, "rb") as f:
+        return len(PdfReader(f, strict=False).pages)
+
+
+def register_document(source: Union[bytes, str, Path]) -> Tuple[str, int]:
+    """
+    Enregistre un PDF pour aperçu et retourne (identifiant, nombre de pages).
+    `source` peut être le contenu ou un fichier temporaire : celui-ci est
+    alors déplacé dans le dossier des aperçus (ou supprimé s'il y est déjà).
+    """
+    directory = _store_dir()
+    _purge_expired(directory)
+
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+                digest.update(block)
+    document_id = digest.hexdigest()
+
+    path = directory / f"{document_id}.pdf"
+    if path.exists():
+        os.utime(path)  # prolonge la conservation
+        if not isinstance(source, (bytes, bytearray)):
+            Path(source).unlink(missing_ok=True)
+    elif isinstance(source, (bytes, bytearray)):
+        tmp = directory / f"{document_id}.{threading.get_ident()}.tmp"
+        tmp.write_bytes(source)
+        os.replace(tmp, path)
+    else:
+        os.replace(source, path)
+
+    page_count = _page_counts.get(document_id)
+    if page_count is None:
+        page_count = _count_pages(path)
+        _page_counts.set(document_id, page_count)
+    return document_id, page_count
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _render_fitz(path: Path, page_index: int, width: int, fmt: str) -> bytes:
+    with _RENDER_LOCK, fitz.open(path) as doc:
+        page = doc.load_page(page_index)
+        zoom = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        if fmt == "png":
+            return pixmap.tobytes("png")
+        image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    return _encode(image, fmt)
+
+
+def _render_poppler(path: Path, page_index: int, width: int, fmt: str) -> bytes:
+    images = convert_from_path(
+        str(path), first_page=page_index + 1, last_page=page_index + 1, size=(width, None)
+    )
+    if not images:
+        raise ValueError(f"Page {page_index + 1} introuvable")
+    return _encode(images[0].convert("RGB"), fmt)
+
+
+def render_thumbnail(document_id: str, page_index: int,
+                     width: int = None, fmt: str = "png") -> bytes:
+    """
+    Vignette d'une page (index à partir de 0) d'un document enregistré.
+    Lève LookupError si le document est inconnu ou la page hors limites.
+    """
+    width = thumbnail_width(width)
+    fmt = thumbnail_format(fmt)
+    key = (document_id, page_index, width, fmt)
+
+    cached = thumbnail_cache.get(key)
+    if cached is not None:
+        return cached
+
+    path = document_path(document_id)
+    if path is None:
+        raise LookupError("Document d'aperçu inconnu ou expiré")
+    page_count = _page_counts.get(document_id)
+    if page_count is None:
+        page_count = _count_pages(path)
+        _page_counts.set(document_id, page_count)
+    if not 0 <= page_index < page_count:
+        raise LookupError(f"Page {page_index + 1} hors limites (1-{page_count})")
+
+    if HAS_FITZ:
+        data = _render_fitz(path, page_index, width, fmt)
+    elif HAS_PDF2IMAGE:
+        data = _render_poppler(path, page_index, width, fmt)
+    else:
+        raise PreviewUnavailable("Ni PyMuPDF ni pdf2image ne sont installés")
+
+    thumbnail_cache.set(key, data)
+    return data
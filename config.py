@@ -65,6 +65,8 @@ class AppConfig:
     MAX_DOC_SIZE = 50 * 1024 * 1024    # 50 MB
     MAX_EXCEL_SIZE = 50 * 1024 * 1024  # 50 MB
     MAX_PPT_SIZE = 50 * 1024 * 1024    # 50 MB
+    # Au-delà, un fichier reçu est écrit sur disque (utils/uploads.py)
+    UPLOAD_SPOOL_MEMORY = 1024 * 1024  # 1 MB
 
     MAX_IMAGES_PER_PDF = 50  # Augmenté
     MAX_FILES_PER_CONVERSION = 10  # Augmenté
@@ -145,6 +147,21 @@ class AppConfig:
         'original': {'dpi': None, 'quality': 100, 'max_size': None, 'compression': 'none'}
     }
 
+    # Vignettes d'aperçu (blueprints/pdf/thumbnails.py)
+    THUMBNAIL_DEFAULT_WIDTH = 200
+    THUMBNAIL_MIN_WIDTH = 32
+    THUMBNAIL_MAX_WIDTH = 1024
+    THUMBNAIL_CACHE_MB = int(os.environ.get("THUMBNAIL_CACHE_MB", 64))
+    # Durée de conservation des PDF dont les pages restent consultables
+    PREVIEW_DOCUMENT_TTL = 3600  # 1 heure
+
+    # Cache des documents PDF analysés (blueprints/pdf/document_cache.py),
+    # par processus qui analyse les documents (processus du pool, ou web sans
+    # pool), pris sur MEMORY_BUDGET_MB
+    DOCUMENT_CACHE_MB = int(os.environ.get("DOCUMENT_CACHE_MB", 32))
+    # Au-delà (contenu reçu en mémoire + arbre des pages), un document n'est pas mis en cache
+    DOCUMENT_CACHE_MAX_ENTRY_MB = int(os.environ.get("DOCUMENT_CACHE_MAX_ENTRY_MB", 8))
+
     # ============================================================
     # OCR CONFIGURATION
     # ============================================================
@@ -203,6 +220,25 @@ class AppConfig:
         'high': 9
     }
     
+    # Profils du moteur de compression PDF (blueprints/pdf/compression.py)
+    #   image_dpi    : résolution cible des images (None = pas de rééchantillonnage)
+    #   jpeg_quality : qualité JPEG des images photographiques (None = sans perte)
+    PDF_COMPRESSION_PROFILES = {
+        'lossless': {'image_dpi': None, 'jpeg_quality': None, 'strip_metadata': False},
+        'balanced': {'image_dpi': 150, 'jpeg_quality': 80, 'strip_metadata': True},
+        'aggressive': {'image_dpi': 96, 'jpeg_quality': 60, 'strip_metadata': True},
+    }
+    # Niveaux proposés par le formulaire de compression
+    PDF_COMPRESSION_ALIASES = {
+        'low': 'lossless',
+        'medium': 'balanced',
+        'high': 'aggressive',
+    }
+    # Processus dédiés au recodage des images (1 = dans le processus courant)
+    PDF_COMPRESSION_WORKERS = int(os.environ.get(
+        "PDF_COMPRESSION_WORKERS", min(4, os.cpu_count() or 1)
+    ))
+
     # Marges par défaut (en mm)
     DEFAULT_MARGINS = {
         'none': (0, 0, 0, 0),
@@ -243,7 +279,85 @@ class AppConfig:
     
     # Worker threads
     WORKER_THREADS = 4
-    MAX_CONCURRENT_CONVERSIONS = 10
+    # Conversions simultanées, imposé par le contrôle d'admission (utils/admission.py)
+    MAX_CONCURRENT_CONVERSIONS = int(os.environ.get("MAX_CONCURRENT_CONVERSIONS", 10))
+    # Budget mémoire partagé par les conversions en cours (instance 512 MB)
+    MEMORY_BUDGET_MB = int(os.environ.get("MEMORY_BUDGET_MB", 320))
+    # Mémoire de base estimée pour toute conversion
+    ADMISSION_BASE_MB = 20
+    # Attente maximale d'une place avant refus (503 + Retry-After)
+    ADMISSION_QUEUE_TIMEOUT = int(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 15))
+
+    # Pages envoyées simultanément au modèle par PDF→TXT/HTML/Excel (utils/page_scheduler.py)
+    PAGE_INFLIGHT = int(os.environ.get("PAGE_INFLIGHT", 4))
+    # Pages rendues d'avance, en attente d'une place auprès du modèle
+    PAGE_PREFETCH = int(os.environ.get("PAGE_PREFETCH", 2))
+    # Pages à couche texte exploitable extraites localement, sans le modèle (utils/text_layer.py)
+    NATIVE_TEXT_PAGES = os.environ.get("NATIVE_TEXT_PAGES", "true").lower() == "true"
+    # Résolution, couleur et format choisis par page avant l'envoi au modèle (utils/page_encoder.py)
+    ADAPTIVE_PAGE_ENCODING = os.environ.get("ADAPTIVE_PAGE_ENCODING", "true").lower() == "true"
+    # Délai par page au-delà duquel la page est traitée sans le modèle
+    PAGE_TIMEOUT = int(os.environ.get("PAGE_TIMEOUT", 90))
+
+    # Tâches asynchrones (managers/job_manager.py)
+    JOBS_FOLDER = "jobs"
+    # Threads d'exécution des tâches, en dehors des threads gunicorn
+    JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+    # Tâches en attente ou en cours au-delà desquelles une soumission est refusée (503)
+    JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", 20))
+    # Conservation des résultats après la fin d'une tâche
+    JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 3600))  # 1 heure
+    # En deçà, une opération rapide reste synchrone même si le client accepte l'asynchrone
+    JOB_SYNC_MAX_BYTES = int(os.environ.get("JOB_SYNC_MAX_BYTES", 2 * 1024 * 1024))
+
+    # Envois fractionnés reprenables (managers/upload_manager.py)
+    CHUNKED_UPLOADS_FOLDER = "chunked_uploads"
+    # Taille des morceaux imposée au client (le dernier peut être plus court)
+    UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 4 * 1024 * 1024))
+    # Conservation d'un envoi, en cours ou finalisé, après sa dernière utilisation
+    CHUNKED_UPLOAD_RETENTION = int(os.environ.get("CHUNKED_UPLOAD_RETENTION", 24 * 3600))  # 24 heures
+    # Volume total réservé par les envois conservés, tous clients confondus (507 au-delà)
+    CHUNKED_UPLOADS_MAX_MB = int(os.environ.get("CHUNKED_UPLOADS_MAX_MB", 2048))
+    # Envois non finalisés par client (adresse IP, 429 au-delà)
+    CHUNKED_UPLOADS_PER_CLIENT = int(os.environ.get("CHUNKED_UPLOADS_PER_CLIENT", 5))
+
+    # Fichiers reçus conservés par empreinte (utils/blob_store.py), 0 = désactivé
+    BLOB_STORE_FOLDER = "blobs"
+    BLOB_STORE_MB = int(os.environ.get("BLOB_STORE_MB", 1024))
+    BLOB_STORE_TTL = int(os.environ.get("BLOB_STORE_TTL", 24 * 3600))  # 24 heures
+
+    # Fichiers produits conservés pour la reprise des téléchargements
+    # (utils/output_store.py), 0 = désactivé
+    OUTPUTS_FOLDER = "outputs"
+    OUTPUT_RETENTION = int(os.environ.get("OUTPUT_RETENTION", 15 * 60))  # 15 minutes
+
+    # Cache disque des résultats (utils/result_cache.py), 0 = désactivé
+    RESULT_CACHE_FOLDER = "result_cache"
+    RESULT_CACHE_MB = int(os.environ.get("RESULT_CACHE_MB", 512))
+    RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 6 * 3600))  # 6 heures
+
+    # Cache disque des réponses du modèle de vision (utils/model_cache.py), 0 = désactivé
+    MODEL_CACHE_FOLDER = "model_cache"
+    MODEL_CACHE_MB = int(os.environ.get("MODEL_CACHE_MB", 64))
+    MODEL_CACHE_TTL = int(os.environ.get("MODEL_CACHE_TTL", 7 * 24 * 3600))  # 7 jours
+
+    # Pool de processus des traitements lourds (utils/process_pool.py)
+    # Processus de calcul, une tâche à la fois chacun ; 0 = exécution dans le
+    # thread de la requête. Au plus 2 : chacun prend sa part de MEMORY_BUDGET_MB
+    PROCESS_POOL_WORKERS = int(os.environ.get("PROCESS_POOL_WORKERS", min(2, os.cpu_count() or 1)))
+    # Recyclage d'un processus après N tâches
+    PROCESS_POOL_MAX_TASKS = int(os.environ.get("PROCESS_POOL_MAX_TASKS", 50))
+    # Espace d'adressage d'un processus au démarrage (interpréteur, pypdf,
+    # Pillow, PyMuPDF, pandas et OpenCV des convertisseurs préchargés :
+    # ~490 MB mesurés), hors document traité
+    PROCESS_WORKER_BASE_MB = int(os.environ.get("PROCESS_WORKER_BASE_MB", 520))
+    # Plafond d'espace d'adressage par processus (RLIMIT_AS) ; 0 = dérivé :
+    # PROCESS_WORKER_BASE_MB + MEMORY_BUDGET_MB / PROCESS_POOL_WORKERS
+    PROCESS_WORKER_MEMORY_MB = int(os.environ.get("PROCESS_WORKER_MEMORY_MB", 0))
+    # Priorité abaissée des processus de calcul, au profit des threads web
+    PROCESS_WORKER_NICE = int(os.environ.get("PROCESS_WORKER_NICE", 5))
+    # Modules chargés une fois par le serveur forkserver, partagés par les processus
+    PROCESS_POOL_PRELOAD = ["blueprints.pdf.engine", "blueprints.conversion"]
 
     # ============================================================
     # CACHE CONFIGURATION
@@ -319,6 +433,13 @@ class AppConfig:
             cls.TEMP_FOLDER / "conversion_temp/powerpoint",
             cls.TEMP_FOLDER / "conversion_temp/ocr",
             cls.TEMP_FOLDER / "conversion_temp/office",
+            cls.TEMP_FOLDER / "conversion_temp/previews",
+            cls.TEMP_FOLDER / cls.JOBS_FOLDER,
+            cls.TEMP_FOLDER / cls.CHUNKED_UPLOADS_FOLDER,
+            cls.TEMP_FOLDER / cls.BLOB_STORE_FOLDER,
+            cls.TEMP_FOLDER / cls.OUTPUTS_FOLDER,
+            cls.TEMP_FOLDER / cls.RESULT_CACHE_FOLDER,
+            cls.TEMP_FOLDER / cls.MODEL_CACHE_FOLDER,
             # Dossiers de données
             Path("data"),
             Path("data/contacts"),
@@ -378,7 +499,7 @@ class AppConfig:
     @classmethod
     def get_conversion_temp_dir(cls, conversion_type: str = "general") -> Path:
         """Retourne le dossier temporaire pour un type de conversion"""
-        if conversion_type in ['images', 'pdf', 'word', 'excel', 'powerpoint', 'ocr', 'office']:
+        if conversion_type in ['images', 'pdf', 'word', 'excel', 'powerpoint', 'ocr', 'office', 'previews']:
             return cls.TEMP_FOLDER / "conversion_temp" / conversion_type
         return cls.TEMP_FOLDER / "conversion_temp"
 
@@ -409,6 +530,13 @@ class AppConfig:
         """Retourne le niveau de compression"""
         return cls.COMPRESSION_LEVELS.get(level.lower(), 5)
 
+    @classmethod
+    def get_compression_profile(cls, name: str) -> str:
+        """Retourne le nom du profil de compression PDF (niveau du formulaire accepté)"""
+        name = (name or '').lower()
+        name = cls.PDF_COMPRESSION_ALIASES.get(name, name)
+        return name if name in cls.PDF_COMPRESSION_PROFILES else 'balanced'
+
     @classmethod
     def get_margins(cls, margin_type: str) -> tuple:
         """Retourne les marges"""
@@ -515,6 +643,7 @@ class AppConfig:
             cls.get_conversion_temp_dir('powerpoint'),
             cls.get_conversion_temp_dir('ocr'),
             cls.get_conversion_temp_dir('office'),
+            cls.get_conversion_temp_dir('previews'),
             cls.TEMP_FOLDER / cls.UPLOADS_FOLDER
         ]
 
@@ -8,6 +8,7 @@ from .contact_manager import ContactManager
 from .conversion_manager import ConversionManager
 from .rating_manager import RatingManager
 from .stats_manager import StatisticsManager
+from .job_manager import JobManager, job_manager
 
 # Instances singleton pour réutilisation
 contact_manager = ContactManager()
@@ -20,8 +21,10 @@ __all__ = [
     'ConversionManager',
     'RatingManager', 
     'StatisticsManager',
+    'JobManager',
     'contact_manager',
     'conversion_manager',
     'rating_manager',
-    'stats_manager'
+    'stats_manager',
+    'job_manager'
 ]
\ No newline at end of file
@@ -0,0 +1,428 @@
+"""
+Gestionnaire de tâches asynchrones pour les conversions longues.
+
+Une requête de conversion peut être mise en file au lieu d'être traitée
+dans le thread gunicorn qui l'a reçue : ses fichiers sont copiés dans le
+dossier de la tâche (AppConfig.TEMP_FOLDER / "jobs" / <id>), puis un
+thread du pool rejoue la requête sur la même route. La réponse produite
+devient le résultat de la tâche : fichier à télécharger, ou erreur (JSON,
+message flash d'une redirection).
+
+L'état de chaque tâche est écrit dans job.json : tout processus partageant
+le dossier peut répondre au suivi et servir le résultat. Les champs du
+formulaire (mots de passe de protection PDF...) ne sont gardés qu'en
+mémoire : une tâche en attente lors d'un redémarrage est déclarée
+interrompue.
+
+Côté client : en-tête "Prefer: respond-async" (RFC 7240) ou champ
+async=1 ; les opérations courtes restent synchrones.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_options_header
+
+from config import AppConfig
+from utils.process_pool import notify_progress
+from utils.uploads import BLOB_FIELD, KEEP_FIELD, UPLOAD_ID_FIELD, save_upload
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+# Intervalle minimal entre deux écritures de la progression sur disque
+PROGRESS_WRITE_INTERVAL = 0.5
+PURGE_INTERVAL = 60
+# Champs propres à la mise en file, retirés de la requête rejouée ; les
+# fichiers désignés (upload_id, blob) y sont déjà copiés parmi les fichiers,
+# les fichiers à conserver (keep) l'ont été à l'envoi
+_ASYNC_FIELDS = ("async", UPLOAD_ID_FIELD, BLOB_FIELD, KEEP_FIELD)
+# En-têtes ajoutés à toutes les réponses, sans intérêt pour le résultat
+_IGNORED_HEADERS = {"X-Content-Type-Options", "X-Frame-Options", "X-XSS-Protection"}
+
+_current = threading.local()
+
+
+class JobQueueFull(Exception):
+    """Trop de tâches en attente ou en cours"""
+
+
+class JobFailed(Exception):
+    """La requête rejouée n'a pas produit de fichier"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def current_job_id() -> Optional[str]:
+    """Identifiant de la tâche exécutée par le thread courant, None hors tâche"""
+    return getattr(_current, "job_id", None)
+
+
+def report_progress(done: int, total: Optional[int] = None, message: Optional[str] = None):
+    """
+    Signale l'avancement de la tâche courante (pages traitées, par exemple).
+    Sans effet en dehors d'une tâche : les conversions l'appellent sans
+    savoir si elles sont exécutées de façon synchrone. Dans un processus du
+    pool, l'avancement est transmis au thread qui attend la conversion.
+    """
+    manager = getattr(_current, "manager", None)
+    if manager is not None:
+        manager._progress(current_job_id(), done, total, message)
+    else:
+        notify_progress(done, total, message)
+
+
+class JobManager:
+    """File de tâches en processus, avec stockage sur disque"""
+
+    def __init__(self, workers: int = None, queue_max: int = None):
+        self.workers = workers or AppConfig.JOB_WORKERS
+        self.queue_max = queue_max or AppConfig.JOB_QUEUE_MAX
+        # Tâches en attente ou en cours dans ce processus
+        self._jobs = {}
+        self._written = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+        self._last_purge = 0.0
+
+    @property
+    def root(self) -> Path:
+        return AppConfig.TEMP_FOLDER / AppConfig.JOBS_FOLDER
+
+    def _dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Créé à la demande : les threads ne survivent pas au fork de gunicorn (preload_app)
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    # ------------------------------------------------------------
+    # Stockage
+    # ------------------------------------------------------------
+
+    def _save(self, job: dict):
+        path = self._dir(job["id"]) / "job.json"
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(job, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+        self._written[job["id"]] = time.monotonic()
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        try:
+            return json.loads((self._dir(job_id) / "job.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _purge_expired(self):
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL or not self.root.exists():
+            return
+        self._last_purge = now
+        limit = now - AppConfig.JOB_RETENTION
+        for directory in self.root.iterdir():
+            if directory.name in self._jobs:
+                continue
+            try:
+                if (directory / "job.json").stat().st_mtime < limit:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except OSError:
+                # Dossier sans job.json : soumission interrompue
+                if directory.stat().st_mtime < limit:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+    # ------------------------------------------------------------
+    # Soumission et exécution
+    # ------------------------------------------------------------
+
+    def submit_request(self, operation: str, path: Optional[str] = None) -> dict:
+        """
+        Met en file la requête Flask courante (fichiers, formulaire, langue),
+        rejouée ensuite sur `path` (la route courante par défaut).
+        Lève JobQueueFull si la file est pleine.
+        """
+        from flask import current_app, request, session
+
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "operation": operation,
+            "status": QUEUED,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": {"done": 0, "total": None, "message": None},
+            "error": None,
+            "result": None,
+            "pid": os.getpid(),
+        }
+        with self._lock:
+            if len(self._jobs) >= self.queue_max:
+                raise JobQueueFull(f"File de traitement pleine ({self.queue_max} tâches)")
+            self._jobs[job_id] = job
+
+        inputs = self._dir(job_id) / "inputs"
+        try:
+            inputs.mkdir(parents=True)
+            files = []
+            for index, (field, storage) in enumerate(request.files.items(multi=True)):
+                if not storage or not storage.filename:
+                    continue
+                target = save_upload(storage, inputs / str(index))
+                files.append((field, target, storage.filename, storage.content_type))
+            self._save(job)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            shutil.rmtree(self._dir(job_id), ignore_errors=True)
+            raise
+
+        replay = {
+            "path": path or request.path,
+            "query": urlencode([(k, v) for k, v in request.args.items(multi=True) if k not in _ASYNC_FIELDS]),
+            "form": [(k, v) for k, v in request.form.items(multi=True) if k not in _ASYNC_FIELDS],
+            "files": files,
+            "language": session.get("language") or request.headers.get("Accept-Language", ""),
+        }
+        self._pool().submit(self._run, current_app._get_current_object(), job_id, replay)
+        logger.info(f"[jobs] {operation} mis en file : {job_id}")
+        return self.public(job)
+
+    def _update(self, job: dict, **changes):
+        with self._lock:
+            job.update(changes)
+        self._save(job)
+
+    def _progress(self, job_id: str, done: int, total: Optional[int], message: Optional[str]):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        with self._lock:
+            job["progress"]["done"] = done
+            if total is not None:
+                job["progress"]["total"] = total
+            if message is not None:
+                job["progress"]["message"] = message
+        finished = total is not None and done >= total
+        if finished or time.monotonic() - self._written.get(job_id, 0) >= PROGRESS_WRITE_INTERVAL:
+            self._save(job)
+
+    def _run(self, app, job_id: str, replay: dict):
+        job = self._jobs[job_id]
+        _current.job_id, _current.manager = job_id, self
+        started = time.perf_counter()
+        try:
+            self._update(job, status=RUNNING, started_at=_now())
+            result = self._replay(app, job_id, replay)
+            progress = dict(job["progress"])
+            if progress["total"]:
+                progress["done"] = progress["total"]
+            self._update(job, status=DONE, finished_at=_now(), result=result, progress=progress)
+            logger.info(f"[jobs] {job['operation']} {job_id} terminé en {time.perf_counter() - started:.1f}s")
+        except JobFailed as e:
+            self._update(job, status=FAILED, finished_at=_now(), error=str(e))
+        except Exception as e:
+            logger.exception(f"[jobs] {job['operation']} {job_id} a échoué")
+            self._update(job, status=FAILED, finished_at=_now(), error=f"Erreur interne : {e}")
+        finally:
+            _current.job_id, _current.manager = None, None
+            shutil.rmtree(self._dir(job_id) / "inputs", ignore_errors=True)
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            self._written.pop(job_id, None)
+
+    def _replay(self, app, job_id: str, replay: dict) -> dict:
+        data = MultiDict(replay["form"])
+        handles = []
+        try:
+            for field, path, filename, content_type in replay["files"]:
+                handle = open(path, "rb")
+                handles.append(handle)
+                data.add(field, (handle, filename, content_type))
+            headers = {"Accept-Language": replay["language"]} if replay["language"] else {}
+
+            with app.test_request_context(replay["path"], method="POST", data=data,
+                                          query_string=replay["query"], headers=headers):
+                response = app.full_dispatch_request()
+                try:
+                    return self._store_response(job_id, response)
+                finally:
+                    response.close()
+        finally:
+            for handle in handles:
+                handle.close()
+
+    def _store_response(self, job_id: str, response) -> dict:
+        """Écrit le corps d'une réponse réussie dans le dossier de la tâche"""
+        if response.status_code >= 300:
+            raise JobFailed(_response_error(response))
+
+        size = 0
+        with open(self._dir(job_id) / "result", "wb") as out:
+            for chunk in response.iter_encoded():
+                out.write(chunk)
+                size += len(chunk)
+
+        _, options = parse_options_header(response.headers.get("Content-Disposition", ""))
+        return {
+            "filename": options.get("filename") or "resultat",
+            "mimetype": response.mimetype,
+            "size": size,
+            "headers": {
+                key: value for key, value in response.headers.items()
+                if key.startswith("X-") and key not in _IGNORED_HEADERS
+            },
+        }
+
+    # ------------------------------------------------------------
+    # Consultation
+    # ------------------------------------------------------------
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """État d'une tâche, None si l'identifiant est invalide ou expiré"""
+        if not _JOB_ID.match(job_id or ""):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return json.loads(json.dumps(job))
+        job = self._load(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        # Tâche non terminée qu'aucun processus n'exécute : redémarrage, crash
+        if job["pid"] == os.getpid() or not _process_alive(job["pid"]):
+            job.update(status=FAILED, finished_at=_now(), error="Tâche interrompue (redémarrage du serveur)")
+            self._save(job)
+        return job
+
+    def result_path(self, job_id: str) -> Optional[Path]:
+        job = self.get(job_id)
+        if job is None or job["status"] != DONE:
+            return None
+        path = self._dir(job_id) / "result"
+        return path if path.exists() else None
+
+    @staticmethod
+    def public(job: dict) -> dict:
+        """Représentation exposée par l'API (sans pid)"""
+        progress = dict(job["progress"])
+        total = progress.get("total")
+        if job["status"] == DONE:
+            progress["percent"] = 100
+        elif total:
+            progress["percent"] = min(99, int(100 * progress["done"] / total))
+        else:
+            progress["percent"] = 0
+        return {
+            "job_id": job["id"],
+            "operation": job["operation"],
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "progress": progress,
+            "error": job["error"],
+            "result": job["result"],
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": statuses.count(QUEUED),
+            "running": statuses.count(RUNNING),
+            "queue_max": self.queue_max,
+        }
+
+
+def _response_error(response) -> str:
+    """Message d'erreur d'une réponse non réussie (JSON, flash ou code HTTP)"""
+    from flask import get_flashed_messages
+
+    if response.is_json:
+        payload = response.get_json(silent=True) or {}
+        if payload.get("error"):
+            return str(payload["error"])
+    messages = get_flashed_messages(category_filter=["error"])
+    if messages:
+        return " ".join(str(m) for m in messages)
+    return f"La conversion a échoué (HTTP {response.status_code})"
+
+
+job_manager = JobManager()
+
+
+def wants_async(request) -> bool:
+    """Le client accepte une réponse différée (Prefer: respond-async ou async=1)"""
+    if "respond-async" in request.headers.get("Prefer", "").lower():
+        return True
+    return (request.values.get("async") or "").lower() in ("1", "true", "yes")
+
+
+def should_enqueue(request, long_running: bool = False) -> bool:
+    """
+    Mise en file si le client l'accepte, sauf pour les opérations courtes :
+    traitement rapide (`long_running` faux) d'un envoi de petite taille.
+    Jamais pendant l'exécution d'une tâche (requête rejouée).
+    """
+    if current_job_id() is not None or not wants_async(request):
+        return False
+    return long_running or (request.content_length or 0) > AppConfig.JOB_SYNC_MAX_BYTES
+
+
+def enqueue_request(operation: str, path: Optional[str] = None):
+    """
+    Met en file la requête courante et retourne la réponse 202 (suivi dans
+    l'en-tête Location), ou 503 avec Retry-After si la file est pleine.
+    """
+    from flask import jsonify, request, url_for
+
+    try:
+        job = job_manager.submit_request(operation, path)
+    except JobQueueFull as e:
+        response = jsonify({"error": str(e)})
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+
+    status_url = url_for("api.job_status", job_id=job["job_id"])
+    job["status_url"] = status_url
+    job["download_url"] = url_for("api.job_download", job_id=job["job_id"])
+    response = jsonify(job)
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    if "respond-async" in request.headers.get("Prefer", "").lower():
+        response.headers["Preference-Applied"] = "respond-async"
+    return response
@@ -0,0 +1,307 @@
+"""
+Envois fractionnés reprenables pour les gros documents.
+
+Un envoi multipart interrompu (connexion mobile instable) repart de zéro.
+Ici, le client ouvre un envoi, transmet le fichier par morceaux de
+AppConfig.UPLOAD_CHUNK_SIZE octets, chacun avec sa somme SHA-256, puis le
+finalise ; un morceau perdu se renvoie seul. Les morceaux sont écrits à
+leur place dans le fichier de l'envoi (TEMP_FOLDER/CHUNKED_UPLOADS_FOLDER/
+<id>/data), dans n'importe quel ordre et depuis n'importe quel processus :
+
+- meta.json : nom, taille, taille des morceaux, puis empreinte et format
+  une fois finalisé ;
+- chunks/<index> : somme du morceau reçu (sa présence vaut accusé de réception).
+
+Un envoi finalisé sert d'entrée à toute opération (/pdf/*, /conversion/<type>)
+via le champ upload_id du formulaire (voir utils/uploads.UploadRequest).
+
+Le fichier de l'envoi est réservé à sa taille finale dès l'ouverture :
+le volume total des envois conservés est plafonné
+(AppConfig.CHUNKED_UPLOADS_MAX_MB, 507 au-delà) et un client ne peut
+garder qu'AppConfig.CHUNKED_UPLOADS_PER_CLIENT envois non finalisés
+(429 au-delà).
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from config import AppConfig
+from utils.blob_store import blob_store
+from utils.uploads import SNIFF_SIZE, SpooledUpload, extension_format, sniff_format
+
+logger = logging.getLogger(__name__)
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+_CHECKSUM = re.compile(r"^[0-9a-f]{64}$")
+PURGE_INTERVAL = 60
+COPY_BUFFER = 64 * 1024
+
+
+class UploadError(ValueError):
+    """Requête d'envoi fractionné invalide ; `status` est le code HTTP à retourner"""
+
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class UploadManager:
+    def __init__(self, chunk_size: int = None):
+        self.chunk_size = chunk_size or AppConfig.UPLOAD_CHUNK_SIZE
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        return AppConfig.TEMP_FOLDER / AppConfig.CHUNKED_UPLOADS_FOLDER
+
+    def _dir(self, upload_id: str) -> Path:
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise UploadError("Envoi inconnu ou expiré", status=404)
+        return self.root / upload_id
+
+    # ------------------------------------------------------------
+    # Stockage
+    # ------------------------------------------------------------
+
+    def _save(self, meta: dict):
+        path = self._dir(meta["id"]) / "meta.json"
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _load(self, upload_id: str) -> dict:
+        path = self._dir(upload_id) / "meta.json"
+        try:
+            meta = json.loads(path.read_text(encoding="utf-8"))
+            # Dernière utilisation : repousse l'expiration
+            os.utime(path)
+        except (OSError, ValueError):
+            raise UploadError("Envoi inconnu ou expiré", status=404)
+        return meta
+
+    def _received(self, upload_id: str) -> set:
+        try:
+            return {int(name) for name in os.listdir(self._dir(upload_id) / "chunks") if name.isdigit()}
+        except OSError:
+            return set()
+
+    def _usage(self, client: Optional[str]):
+        """(octets réservés par les envois conservés, envois non finalisés de `client`)"""
+        reserved = opened = 0
+        if not self.root.exists():
+            return reserved, opened
+        for directory in self.root.iterdir():
+            try:
+                meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            reserved += meta.get("size", 0)
+            if not meta.get("finalized") and client is not None and meta.get("client") == client:
+                opened += 1
+        return reserved, opened
+
+    def _purge_expired(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < PURGE_INTERVAL or not self.root.exists():
+                return
+            self._last_purge = now
+        limit = now - AppConfig.CHUNKED_UPLOAD_RETENTION
+        for directory in self.root.iterdir():
+            try:
+                if (directory / "meta.json").stat().st_mtime < limit:
+                    shutil.rmtree(directory, ignore_errors=True)
+            except OSError:
+                # Dossier sans meta.json : création interrompue
+                if directory.stat().st_mtime < limit:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+    # ------------------------------------------------------------
+    # Envoi
+    # ------------------------------------------------------------
+
+    def create(self, filename: str, size: int, sha256: Optional[str] = None,
+               client: Optional[str] = None) -> dict:
+        """
+        Ouvre un envoi de `size` octets pour `client` (adresse) ; `sha256`
+        (facultatif) est vérifié à la finalisation.
+        """
+        self._purge_expired()
+        if not filename:
+            raise UploadError("Nom de fichier manquant")
+        if size <= 0:
+            raise UploadError("Fichier vide")
+        limit = AppConfig.get_max_size_for_format(extension_format(filename) or "")
+        if size > limit:
+            raise UploadError(f"Fichier trop volumineux (max {limit // (1024 * 1024)} MB)", status=413)
+        if sha256 is not None:
+            sha256 = sha256.lower()
+            if not _CHECKSUM.match(sha256):
+                raise UploadError("Somme SHA-256 invalide")
+
+        upload_id = uuid.uuid4().hex
+        directory = self._dir(upload_id)
+        with self._lock:
+            reserved, opened = self._usage(client)
+            if opened >= AppConfig.CHUNKED_UPLOADS_PER_CLIENT:
+                raise UploadError(
+                    f"Trop d'envois en cours ({opened}), finalisez ou supprimez-en un",
+                    status=429, retry_after=60,
+                )
+            if reserved + size > AppConfig.CHUNKED_UPLOADS_MAX_MB * 1024 * 1024:
+                raise UploadError("Espace de réception saturé, réessayez plus tard",
+                                  status=507, retry_after=300)
+            (directory / "chunks").mkdir(parents=True)
+            # Fichier creux à la taille finale : chaque morceau est écrit à sa place
+            with open(directory / "data", "wb") as f:
+                f.truncate(size)
+            meta = {
+                "id": upload_id,
+                "filename": filename,
+                "size": size,
+                "client": client,
+                "chunk_size": self.chunk_size,
+                "chunks": -(-size // self.chunk_size),
+                "sha256": sha256,
+                "created_at": _now(),
+                "finalized": False,
+                "digest": None,
+                "format": None,
+            }
+            self._save(meta)
+        logger.info(f"[uploads] {filename} ({size} octets) ouvert : {upload_id}")
+        return self.public(meta, received=set())
+
+    def write_chunk(self, upload_id: str, index: int, stream, checksum: Optional[str]) -> dict:
+        """
+        Écrit le morceau `index` lu dans `stream`, après vérification de sa
+        longueur et de sa somme SHA-256. Un morceau déjà reçu est remplacé
+        (nouvel essai du client).
+        """
+        meta = self._load(upload_id)
+        if meta["finalized"]:
+            raise UploadError("Envoi déjà finalisé", status=409)
+        if not 0 <= index < meta["chunks"]:
+            raise UploadError(f"Morceau hors limites (0 à {meta['chunks'] - 1})")
+        checksum = (checksum or "").lower()
+        if not _CHECKSUM.match(checksum):
+            raise UploadError("En-tête X-Chunk-SHA256 manquant ou invalide")
+
+        offset = index * meta["chunk_size"]
+        expected = min(meta["chunk_size"], meta["size"] - offset)
+        directory = self._dir(upload_id)
+        marker = directory / "chunks" / str(index)
+        # Nouvel essai : le morceau n'est plus considéré reçu tant qu'il n'est pas vérifié
+        marker.unlink(missing_ok=True)
+        digest = hashlib.sha256()
+        length = 0
+        fd = os.open(directory / "data", os.O_WRONLY)
+        try:
+            while length <= expected:
+                data = stream.read(min(COPY_BUFFER, expected + 1 - length))
+                if not data:
+                    break
+                if length + len(data) <= expected:
+                    os.pwrite(fd, data, offset + length)
+                digest.update(data)
+                length += len(data)
+        finally:
+            os.close(fd)
+
+        if length != expected:
+            raise UploadError(f"Morceau {index} : {expected} octets attendus, {length} reçus")
+        if digest.hexdigest() != checksum:
+            raise UploadError(f"Morceau {index} : somme de contrôle incorrecte", status=422)
+
+        tmp = marker.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_text(checksum, encoding="ascii")
+        os.replace(tmp, marker)
+        return self.public(meta)
+
+    def finalize(self, upload_id: str, owner: Optional[str] = None) -> dict:
+        """
+        Vérifie que tous les morceaux sont reçus, calcule l'empreinte du
+        fichier (comparée à celle annoncée) et reconnaît son format ; le
+        fichier est conservé par empreinte pour le client `owner`.
+        """
+        meta = self._load(upload_id)
+        if meta["finalized"]:
+            return self.public(meta)
+        missing = sorted(set(range(meta["chunks"])) - self._received(upload_id))
+        if missing:
+            raise UploadError(f"{len(missing)} morceau(x) manquant(s)", status=409, missing=missing[:100])
+
+        digest = hashlib.sha256()
+        with open(self._dir(upload_id) / "data", "rb") as f:
+            head = f.read(SNIFF_SIZE)
+            digest.update(head)
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        if meta["sha256"] and digest.hexdigest() != meta["sha256"]:
+            raise UploadError("Somme SHA-256 du fichier incorrecte", status=422)
+
+        file_format = sniff_format(head, meta["filename"])
+        limit = AppConfig.get_max_size_for_format(file_format or "")
+        if meta["size"] > limit:
+            self.delete(upload_id)
+            raise UploadError(f"Fichier trop volumineux (max {limit // (1024 * 1024)} MB)", status=413)
+
+        meta.update(finalized=True, digest=digest.hexdigest(), format=file_format)
+        self._save(meta)
+        blob_store.add_file(self._dir(upload_id) / "data", meta["digest"], meta["filename"], file_format, owner)
+        shutil.rmtree(self._dir(upload_id) / "chunks", ignore_errors=True)
+        logger.info(f"[uploads] {meta['filename']} finalisé : {upload_id}")
+        return self.public(meta)
+
+    def status(self, upload_id: str) -> dict:
+        return self.public(self._load(upload_id))
+
+    def delete(self, upload_id: str):
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def open(self, upload_id: str) -> SpooledUpload:
+        """Fichier d'un envoi finalisé, utilisable comme fichier reçu"""
+        meta = self._load(upload_id)
+        if not meta["finalized"]:
+            raise UploadError("Envoi non finalisé", status=409)
+        return SpooledUpload.from_file(
+            self._dir(upload_id) / "data", meta["filename"], sha256=meta["digest"], file_format=meta["format"]
+        )
+
+    def public(self, meta: dict, received: Optional[set] = None) -> dict:
+        """Vue client d'un envoi"""
+        view = {
+            "upload_id": meta["id"],
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "chunk_size": meta["chunk_size"],
+            "chunks": meta["chunks"],
+            "finalized": meta["finalized"],
+        }
+        if meta["finalized"]:
+            view.update(sha256=meta["digest"], format=meta["format"])
+        else:
+            if received is None:
+                received = self._received(meta["id"])
+            view["missing"] = sorted(set(range(meta["chunks"])) - received)[:100]
+            view["received"] = len(received)
+        return view
+
+
+upload_manager = UploadManager()
@@ -0,0 +1,310 @@
+"""
+Contrôle d'admission des conversions sous un budget mémoire global.
+
+Avant de démarrer une conversion, son pic mémoire est estimé d'après le
+type d'opération, le nombre de pages, la résolution demandée et la taille
+des fichiers. La conversion démarre si l'estimation tient dans le budget
+restant (AppConfig.MEMORY_BUDGET_MB) et qu'une place est libre parmi
+AppConfig.MAX_CONCURRENT_CONVERSIONS ; sinon elle attend qu'une
+conversion se termine, puis est refusée (503 + Retry-After) si l'attente
+dépasse le délai. Une conversion dont l'estimation dépasse le budget
+entier est refusée d'emblée (413).
+
+Les estimations sont corrigées par apprentissage : le rapport entre pic
+mesuré et estimation est suivi par opération (moyenne mobile
+exponentielle). Seules les mesures isolées comptent : pic relevé dans un
+processus du pool (Ticket.record) ou conversion seule en cours dans le
+processus (PeakRSSTracker.isolated) ; les autres ne corrigent rien.
+
+Une conversion dont la réponse est produite pendant l'envoi (archive en
+flux, BytesIO) garde sa place jusqu'à la fermeture de la réponse
+(hold_until_closed).
+"""
+
+import io
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+from config import AppConfig
+from utils.memory import PeakRSSTracker
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+# Page A4 en pouces
+PAGE_WIDTH_IN, PAGE_HEIGHT_IN = 8.27, 11.69
+# Copies de travail de la page en cours (conversions de mode, encodage)
+RASTER_WORKING_COPIES = 1.0
+# Lissage des corrections apprises et bornes du facteur ; prudence à la
+# baisse : le pic mesuré sous-estime quand la mémoire du processus est réutilisée
+EWMA_ALPHA = 0.3
+MIN_CORRECTION, MAX_CORRECTION = 0.75, 4.0
+
+# raster      : "all" = toutes les pages rendues en mémoire à la fois,
+#               "page" = une page à la fois, "window" = AppConfig.PAGE_INFLIGHT
+#               + AppConfig.PAGE_PREFETCH pages à la fois (utils/page_scheduler.py),
+#               None = pas de rendu
+# dpi         : (défaut, min, max) du champ "dpi" du formulaire
+# file_factor : mémoire de travail par octet reçu (analyse, copies, décodage)
+OPERATION_PROFILES = {
+    "pdf-en-ppt": {"raster": "all", "dpi": (250, 150, 400), "file_factor": 2},
+    "pdf-en-image": {"raster": "page", "dpi": (200, 72, 600), "file_factor": 2},
+    "pdf-en-txt": {"raster": "window", "dpi": (120, 120, 200), "file_factor": 2},
+    "pdf-en-html": {"raster": "window", "dpi": (120, 120, 200), "file_factor": 2},
+    "pdf-en-excel": {"raster": "window", "dpi": (150, 150, 150), "file_factor": 2},
+    # pdf2docx reconstruit la mise en page de tout le document
+    "pdf-en-word": {"raster": None, "file_factor": 8},
+    "pdf-en-doc": {"raster": None, "file_factor": 8},
+    # Images compressées (JPEG, PNG) décodées en pixels
+    "image-en-pdf": {"raster": None, "file_factor": 10},
+    "jpg-en-pdf": {"raster": None, "file_factor": 10},
+    "png-en-pdf": {"raster": None, "file_factor": 10},
+    "image-en-word": {"raster": None, "file_factor": 10},
+    "image-en-excel": {"raster": None, "file_factor": 10},
+    # Moteur PDF : lecture et écriture en flux
+    "merge": {"raster": None, "file_factor": 2},
+    "split": {"raster": None, "file_factor": 2},
+    "rotate": {"raster": None, "file_factor": 1},
+    "compress": {"raster": None, "file_factor": 4},
+}
+DEFAULT_PROFILE = {"raster": None, "file_factor": 3}
+
+
+class AdmissionRejected(Exception):
+    """Conversion refusée : budget mémoire ou nombre de conversions atteint"""
+
+    def __init__(self, message: str, status: int = 503, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _page_bytes(dpi: int) -> float:
+    """Page A4 rendue en RGB"""
+    return (PAGE_WIDTH_IN * dpi) * (PAGE_HEIGHT_IN * dpi) * 3
+
+
+def requested_dpi(operation: str, form) -> Optional[int]:
+    """Résolution effective, bornée comme le fait la conversion"""
+    profile = OPERATION_PROFILES.get(operation, DEFAULT_PROFILE)
+    if not profile.get("dpi"):
+        return None
+    default, low, high = profile["dpi"]
+    try:
+        dpi = int((form or {}).get("dpi", default))
+    except (TypeError, ValueError):
+        dpi = default
+    return max(low, min(dpi, high))
+
+
+def count_pages(stream) -> int:
+    """Nombre de pages déclaré d'un PDF reçu (1 si illisible ou non-PDF), position conservée"""
+    from blueprints.pdf.inspector import inspect_pdf
+    try:
+        return max(1, inspect_pdf(stream, full_fallback=False).page_count or 1)
+    except Exception:
+        return 1
+
+
+def _stream_size(stream) -> int:
+    position = stream.tell()
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(position)
+    return size
+
+
+class Ticket:
+    """Conversion admise ; `record` remplace la mesure du processus courant"""
+
+    def __init__(self, operation: str, estimate_mb: float):
+        self.operation = operation
+        self.estimate_mb = estimate_mb
+        self.measured_mb: Optional[float] = None
+        self.tracker = PeakRSSTracker(operation)
+
+    def record(self, peak_mb: Optional[float]):
+        """Pic mesuré ailleurs (processus du pool, par exemple) ; None : mesure non isolée"""
+        self.measured_mb = peak_mb
+
+
+class AdmissionController:
+    def __init__(self, budget_mb: int = None, max_concurrent: int = None):
+        self.budget_mb = budget_mb or AppConfig.MEMORY_BUDGET_MB
+        self.max_concurrent = max_concurrent or AppConfig.MAX_CONCURRENT_CONVERSIONS
+        self._condition = threading.Condition()
+        self._running: Dict[Ticket, float] = {}
+        self._corrections: Dict[str, float] = {}
+        self._avg_duration = 30.0
+        self.admitted = 0
+        self.rejected = 0
+        self.waited = 0
+
+    @property
+    def used_mb(self) -> float:
+        return sum(self._running.values())
+
+    def estimate(self, operation: str, pages: int = 1, dpi: Optional[int] = None,
+                 input_bytes: int = 0) -> float:
+        """Pic mémoire estimé (MB), correction apprise comprise"""
+        profile = OPERATION_PROFILES.get(operation, DEFAULT_PROFILE)
+        total = AppConfig.ADMISSION_BASE_MB * MB + input_bytes * profile["file_factor"]
+        if profile["raster"] and dpi:
+            if profile["raster"] == "all":
+                total += (pages + RASTER_WORKING_COPIES) * _page_bytes(dpi)
+            else:
+                # Chaque page en cours a ses propres copies de travail
+                window = min(pages, max(1, AppConfig.PAGE_INFLIGHT) + max(0, AppConfig.PAGE_PREFETCH)) if profile["raster"] == "window" else 1
+                total += window * (1 + RASTER_WORKING_COPIES) * _page_bytes(dpi)
+        return total / MB * self._corrections.get(operation, 1.0)
+
+    def estimate_upload(self, operation: str, files: Iterable, form=None) -> float:
+        """Estimation pour des fichiers reçus (FileStorage ou chemins)"""
+        pages = 0
+        input_bytes = 0
+        profile = OPERATION_PROFILES.get(operation, DEFAULT_PROFILE)
+        for item in files:
+            if item is None:
+                continue
+            if hasattr(item, "stream"):
+                input_bytes += _stream_size(item.stream)
+                if profile["raster"]:
+                    pages += count_pages(item.stream)
+            else:
+                with open(item, "rb") as f:
+                    input_bytes += _stream_size(f)
+                    if profile["raster"]:
+                        pages += count_pages(f)
+        return self.estimate(operation, max(1, pages), requested_dpi(operation, form), input_bytes)
+
+    def _learn(self, operation: str, estimate_mb: float, measured_mb: float, duration: float):
+        base = estimate_mb / self._corrections.get(operation, 1.0)
+        if base > 0 and measured_mb > 0:
+            ratio = measured_mb / base
+            previous = self._corrections.get(operation, 1.0)
+            corrected = (1 - EWMA_ALPHA) * previous + EWMA_ALPHA * ratio
+            self._corrections[operation] = max(MIN_CORRECTION, min(corrected, MAX_CORRECTION))
+        self._avg_duration = (1 - EWMA_ALPHA) * self._avg_duration + EWMA_ALPHA * duration
+
+    def _retry_after(self) -> int:
+        return int(max(5, min(self._avg_duration, 300)))
+
+    def _fits(self, estimate_mb: float) -> bool:
+        if len(self._running) >= self.max_concurrent:
+            return False
+        # Une conversion seule passe toujours si elle tient dans le budget entier
+        return not self._running or self.used_mb + estimate_mb <= self.budget_mb
+
+    def acquire(self, operation: str, estimate_mb: float, timeout: Optional[float] = None) -> Ticket:
+        """
+        Réserve `estimate_mb` jusqu'à release(), en attendant au plus
+        `timeout` secondes (AppConfig.ADMISSION_QUEUE_TIMEOUT par défaut,
+        AppConfig.CONVERSION_TIMEOUT dans une tâche asynchrone).
+        Lève AdmissionRejected si la conversion ne peut pas démarrer.
+        """
+        if estimate_mb > self.budget_mb:
+            self.rejected += 1
+            raise AdmissionRejected(
+                f"Conversion trop volumineuse : ~{estimate_mb:.0f} MB estimés "
+                f"pour un budget de {self.budget_mb} MB. Réduisez la résolution ou le nombre de pages.",
+                status=413,
+            )
+        if timeout is None:
+            from managers.job_manager import current_job_id
+            # Une tâche de la file asynchrone peut attendre : aucun client n'est bloqué
+            timeout = AppConfig.CONVERSION_TIMEOUT if current_job_id() else AppConfig.ADMISSION_QUEUE_TIMEOUT
+
+        deadline = time.monotonic() + timeout
+        ticket = Ticket(operation, estimate_mb)
+        with self._condition:
+            if not self._fits(estimate_mb):
+                self.waited += 1
+            while not self._fits(estimate_mb):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise AdmissionRejected(
+                        "Serveur occupé : trop de conversions en cours, réessayez dans quelques instants.",
+                        retry_after=self._retry_after(),
+                    )
+                self._condition.wait(remaining)
+            self._running[ticket] = estimate_mb
+            self.admitted += 1
+        # Pic remis à zéro seulement si aucune autre mesure n'est en cours
+        ticket.tracker.__enter__()
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Rend la place du ticket (sans effet s'il est déjà rendu)"""
+        with self._condition:
+            if self._running.pop(ticket, None) is None:
+                return
+        tracker = ticket.tracker
+        tracker.__exit__(None, None, None)
+        if ticket.measured_mb is not None:
+            measured = ticket.measured_mb
+        elif tracker.isolated:
+            measured = tracker.delta_mb
+        else:
+            # Mesure et durée faussées par les conversions concurrentes :
+            # ni la correction ni la durée moyenne (Retry-After) n'en apprennent
+            measured = None
+        with self._condition:
+            if measured is not None:
+                self._learn(ticket.operation, ticket.estimate_mb, measured, tracker.duration)
+            self._condition.notify_all()
+        if measured is None:
+            logger.debug(f"[admission] {ticket.operation}: estimé {ticket.estimate_mb:.0f} MB, mesure non isolée")
+        else:
+            logger.debug(f"[admission] {ticket.operation}: estimé {ticket.estimate_mb:.0f} MB, mesuré {measured:.0f} MB")
+
+    def hold_until_closed(self, ticket: Ticket, response):
+        """
+        Rend la place à la fermeture de `response` si c'est une réponse
+        Flask (corps encore en mémoire ou produit pendant l'envoi), aussitôt
+        sinon. Retourne `response`.
+        """
+        from werkzeug.wrappers import Response
+        if isinstance(response, Response):
+            response.call_on_close(lambda: self.release(ticket))
+        else:
+            self.release(ticket)
+        return response
+
+    @contextmanager
+    def admit(self, operation: str, estimate_mb: float,
+              timeout: Optional[float] = None) -> Iterator[Ticket]:
+        """Réserve `estimate_mb` pendant le bloc `with` (voir acquire)"""
+        ticket = self.acquire(operation, estimate_mb, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "budget_mb": self.budget_mb,
+                "used_mb": round(self.used_mb, 1),
+                "running": len(self._running),
+                "max_concurrent": self.max_concurrent,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "rejected": self.rejected,
+                "corrections": {k: round(v, 2) for k, v in self._corrections.items()},
+            }
+
+
+admission = AdmissionController()
+
+
+def rejection_response(error: AdmissionRejected):
+    """Réponse JSON d'un refus : 503 + Retry-After, ou 413"""
+    from flask import jsonify
+    response = jsonify({"error": str(error)})
+    response.status_code = error.status
+    if error.retry_after:
+        response.headers["Retry-After"] = str(error.retry_after)
+    return response
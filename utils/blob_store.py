@@ -0,0 +1,113 @@
+"""
+Stockage des fichiers reçus par empreinte SHA-256.
+
+Un même document passe souvent par plusieurs outils (compression, puis
+rotation, puis conversion) et serait renvoyé en entier à chaque fois.
+Chaque fichier reçu sur disque (formulaire multipart au-delà de
+AppConfig.UPLOAD_SPOOL_MEMORY, envoi fractionné finalisé) est conservé dans
+TEMP_FOLDER/BLOB_STORE_FOLDER par lien physique, sans copie ; un petit
+fichier reçu en mémoire coûte moins à renvoyer qu'à écrire. Le client
+demande d'abord si l'empreinte est connue (HEAD /api/blobs/<sha256>) puis,
+le cas échéant, remplace le fichier par le champ blob=<sha256> du
+formulaire (voir utils/uploads.UploadRequest) : aucun octet n'est renvoyé.
+
+Un fichier n'est visible que du client qui l'a envoyé (identifiant de
+session, utils/uploads.client_id) : l'entrée est indexée par l'empreinte
+combinée à cet identifiant, connaître la somme SHA-256 d'un document ne
+suffit pas pour apprendre qu'il a été envoyé ni pour le récupérer.
+
+Même organisation que le cache des résultats (utils/result_cache.py) :
+volume borné (AppConfig.BLOB_STORE_MB), éviction des fichiers les moins
+récemment utilisés, expiration après AppConfig.BLOB_STORE_TTL.
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+from config import AppConfig
+from utils.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _scoped_key(digest: str, owner: str) -> str:
+    """Clé d'un fichier : empreinte et client propriétaire"""
+    return hashlib.sha256(f"{owner}:{digest}".encode("ascii")).hexdigest()
+
+
+class BlobStore(ResultCache):
+    """Fichiers reçus indexés par client et empreinte ; get() retourne aussi nom et format"""
+
+    def __init__(self, directory: Path = None, max_bytes: int = None, ttl: int = None):
+        super().__init__(
+            directory or AppConfig.TEMP_FOLDER / AppConfig.BLOB_STORE_FOLDER,
+            AppConfig.BLOB_STORE_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            AppConfig.BLOB_STORE_TTL if ttl is None else ttl,
+        )
+
+    def lookup(self, digest: Optional[str], owner: Optional[str]) -> Optional[dict]:
+        """Fichier `digest` envoyé par `owner`, ou None"""
+        if not owner or not _DIGEST.match(digest or ""):
+            return None
+        return self.get(_scoped_key(digest, owner))
+
+    def add_file(self, path, digest: str, filename: str, file_format: Optional[str], owner: Optional[str]):
+        """Conserve un fichier déjà sur disque pour `owner` (lien physique, copie à défaut)"""
+        if not self.enabled or not owner or not _DIGEST.match(digest or ""):
+            return
+        key = _scoped_key(digest, owner)
+        if self._data_path(key).exists():
+            # Déjà présent : seule la date d'utilisation change
+            try:
+                os.utime(self._meta_path(key))
+                return
+            except OSError:
+                pass
+        tmp = self._tmp_path(key)
+        try:
+            try:
+                os.link(path, tmp)
+            except OSError:
+                shutil.copyfile(path, tmp)
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            logger.warning(f"[blobs] fichier non conservé : {e}")
+            return
+        self._commit(key, tmp, {"filename": filename, "format": file_format})
+
+    def add_upload(self, upload, owner: Optional[str]):
+        """
+        Conserve un fichier reçu (SpooledUpload) complet et non vide, s'il
+        est déjà sur disque : un fichier gardé en mémoire n'y est pas écrit.
+        """
+        if not self.enabled or upload.rejected or upload.size == 0 or upload.in_memory:
+            return
+        self.add_file(upload.as_path(), upload.sha256, upload.filename, upload.format, owner)
+
+    def open(self, digest: str, owner: Optional[str], filename: Optional[str] = None):
+        """
+        Fichier conservé pour `owner`, exposé comme fichier reçu
+        (SpooledUpload) ; None s'il est inconnu ou expiré. `filename`
+        remplace le nom d'origine.
+        """
+        from utils.uploads import SpooledUpload
+        entry = self.lookup(digest, owner)
+        if entry is None:
+            return None
+        try:
+            return SpooledUpload.from_file(
+                entry["path"], filename or entry["filename"], sha256=digest, file_format=entry.get("format")
+            )
+        except OSError:
+            # Évincé entre-temps
+            return None
+
+
+blob_store = BlobStore()
@@ -1,4 +1,6 @@
 import time
+import threading
+from collections import OrderedDict
 
 class SimpleCache:
     def __init__(self, ttl=10):
@@ -15,3 +17,73 @@ class SimpleCache:
     def set(self, key, value):
         self.data[key] = value
         self.timestamps[key] = time.time()
+
+
+class LRUCache:
+    """
+    Cache LRU borné en nombre d'entrées et en octets, partagé entre threads.
+    `sizeof` donne le poids d'une valeur (len() par défaut, adapté aux bytes).
+    `on_evict`, s'il est fourni, reçoit chaque valeur retirée (éviction,
+    remplacement, vidage), hors du verrou du cache.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, sizeof=len, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.data = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key][0]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        removed = []
+        with self._lock:
+            if key in self.data:
+                previous, previous_size = self.data.pop(key)
+                self.total_bytes -= previous_size
+                if previous is not value:
+                    removed.append(previous)
+            self.data[key] = (value, size)
+            self.total_bytes += size
+            while len(self.data) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (evicted, evicted_size) = self.data.popitem(last=False)
+                self.total_bytes -= evicted_size
+                removed.append(evicted)
+        self._evicted(removed)
+
+    def clear(self):
+        """Vide le cache (les compteurs de hits/misses sont conservés)"""
+        with self._lock:
+            removed = [value for value, _ in self.data.values()]
+            self.data.clear()
+            self.total_bytes = 0
+        self._evicted(removed)
+
+    def _evicted(self, values):
+        if self.on_evict is not None:
+            for value in values:
+                self.on_evict(value)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.data),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,139 @@
+"""
+Mesure de la mémoire résidente (RSS) du processus.
+
+Sous Linux, le pic (VmHWM) peut être remis à zéro via /proc/self/clear_refs,
+ce qui permet de mesurer le pic d'une opération précise. Ailleurs, on se
+rabat sur resource.getrusage (pic depuis le démarrage du processus).
+"""
+
+import os
+import time
+import logging
+import threading
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_PROC_STATUS = "/proc/self/status"
+_PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+# Mesures en cours dans le processus (PeakRSSTracker)
+_active_lock = threading.Lock()
+_active = set()
+
+
+def _read_status_kb(field: str):
+    """Lit un champ en kB de /proc/self/status (None si indisponible)"""
+    try:
+        with open(_PROC_STATUS, "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss_bytes() -> int:
+    """RSS courante du processus, en octets"""
+    kb = _read_status_kb("VmRSS")
+    if kb is not None:
+        return kb * 1024
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """Pic de RSS du processus, en octets"""
+    kb = _read_status_kb("VmHWM")
+    if kb is not None:
+        return kb * 1024
+    if resource is not None:
+        # ru_maxrss : kB sous Linux, octets sous macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+    return 0
+
+
+def reset_peak_rss() -> bool:
+    """Remet le pic de RSS au niveau courant (Linux >= 4.0)"""
+    try:
+        with open(_PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class PeakRSSTracker:
+    """
+    Context manager mesurant le pic de RSS et la durée d'une opération.
+
+    La mesure porte sur tout le processus : avec plusieurs threads actifs,
+    le pic inclut le travail des autres requêtes. Le pic n'est remis à zéro
+    que si aucune autre mesure n'est en cours (la remise à zéro fausserait
+    la sienne) ; une mesure chevauchée par une autre n'est pas isolée
+    (isolated = False) et son delta vaut 0.
+
+        with PeakRSSTracker("merge") as tracker:
+            ...
+        tracker.peak_rss_mb
+    """
+
+    def __init__(self, label: str = "operation", log: bool = False):
+        self.label = label
+        self.log = log
+        self.start_rss = 0
+        self.peak_rss = 0
+        self.duration = 0.0
+        self._reset = False
+        self.isolated = False
+        self._start_time = 0.0
+
+    def __enter__(self):
+        with _active_lock:
+            for other in _active:
+                other.isolated = False
+            self.isolated = not _active
+            _active.add(self)
+            self._reset = self.isolated and reset_peak_rss()
+        self.start_rss = current_rss_bytes()
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start_time
+        self.peak_rss = max(peak_rss_bytes(), self.start_rss)
+        with _active_lock:
+            _active.discard(self)
+        if self.log:
+            logger.info(
+                f"[mem] {self.label}: pic RSS {self.peak_rss_mb:.1f} MB "
+                f"(+{self.delta_mb:.1f} MB) en {self.duration:.2f}s"
+            )
+        return False
+
+    @property
+    def peak_rss_mb(self) -> float:
+        return self.peak_rss / (1024 * 1024)
+
+    @property
+    def delta_mb(self) -> float:
+        """
+        Croissance du pic pendant l'opération (0 si le pic n'a pas pu être
+        remis à zéro ou si une autre mesure a chevauché celle-ci)
+        """
+        if not self._reset or not self.isolated:
+            return 0.0
+        return max(0, self.peak_rss - self.start_rss) / (1024 * 1024)
+
+    def as_dict(self) -> dict:
+        return {
+            "peak_rss_mb": round(self.peak_rss_mb, 2),
+            "delta_rss_mb": round(self.delta_mb, 2),
+            "duration_s": round(self.duration, 3),
+            "isolated": self.isolated,
+        }
@@ -0,0 +1,78 @@
+"""
+Cache disque des réponses du modèle de vision (Gemini).
+
+Les mêmes pages reviennent souvent (formulaires types, papier à en-tête,
+essais répétés du même fichier) et chaque passage coûte un appel facturé
+de plusieurs secondes. La réponse analysée (JSON) de call_gemini_vision est
+indexée par (empreinte SHA-256 de l'image envoyée, empreinte du prompt,
+modèle) et conservée sous TEMP_FOLDER/MODEL_CACHE_FOLDER. Le prompt est
+celui effectivement envoyé, langue comprise : modifier un gabarit de prompt
+invalide de lui-même les entrées produites par l'ancien.
+
+Même organisation que le cache des résultats (utils/result_cache.py) :
+volume borné (AppConfig.MODEL_CACHE_MB), éviction des entrées les moins
+récemment servies, expiration après AppConfig.MODEL_CACHE_TTL, compteurs
+de succès exposés dans le tableau de bord.
+"""
+
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+
+from config import AppConfig
+from utils.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+def model_key(image_bytes: bytes, prompt: str, model: str) -> str:
+    """Clé d'une réponse : image envoyée, prompt et modèle"""
+    material = json.dumps({
+        "image": hashlib.sha256(image_bytes).hexdigest(),
+        "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        "model": model,
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ModelCache(ResultCache):
+    """Réponses JSON du modèle ; lookup() et store() remplacent l'envoi de fichiers"""
+
+    def __init__(self, directory: Path = None, max_bytes: int = None, ttl: int = None):
+        super().__init__(
+            directory or AppConfig.TEMP_FOLDER / AppConfig.MODEL_CACHE_FOLDER,
+            AppConfig.MODEL_CACHE_MB * 1024 * 1024 if max_bytes is None else max_bytes,
+            AppConfig.MODEL_CACHE_TTL if ttl is None else ttl,
+        )
+
+    def lookup(self, key: Optional[str]):
+        """Réponse retenue (JSON analysé) ou None"""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        try:
+            with open(entry["path"], encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Évincée entre-temps ou illisible
+            self._remove(key)
+            return None
+
+    def store(self, key: Optional[str], data, model: str):
+        if not self.enabled or key is None or data is None:
+            return
+        tmp = self._tmp_path(key)
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+        except (OSError, TypeError, ValueError) as e:
+            tmp.unlink(missing_ok=True)
+            logger.warning(f"[model_cache] réponse non retenue : {e}")
+            return
+        self._commit(key, tmp, {"filename": f"{key}.json", "mimetype": "application/json",
+                                "model": model})
+
+
+model_cache = ModelCache()
@@ -0,0 +1,242 @@
+"""
+Conservation des fichiers produits, pour reprendre un téléchargement.
+
+Les résultats sont envoyés depuis un BytesIO ou depuis un fichier
+temporaire supprimé dès la fin de la requête : un téléchargement
+interrompu (fusion de 90 MB sur mobile) obligeait à tout recalculer.
+Chaque réponse d'opération (POST, 200 en pièce jointe) est recopiée au fil
+de l'envoi sous TEMP_FOLDER/OUTPUTS_FOLDER et conservée
+AppConfig.OUTPUT_RETENTION secondes. La réponse porte :
+
+- ETag : identifiant stable du fichier produit ;
+- Content-Location : /api/outputs/<id>, à télécharger par GET avec
+  Range / If-Range pour reprendre là où l'envoi s'est arrêté.
+
+Si le client abandonne, le reste du corps est tout de même écrit : le
+fichier reste complet et la reprise ne refait pas la conversion. Un
+fichier déjà sur disque (send_file) est lié au lieu d'être recopié : la
+capture est enregistrée par register() avant les nettoyages
+after_this_request des routes, qui suppriment le fichier temporaire servi.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+_OUTPUT_ID = re.compile(r"^[0-9a-f]{32}$")
+PURGE_INTERVAL = 60
+
+
+def _source_path(response) -> Optional[str]:
+    """Chemin du fichier servi par send_file, s'il existe toujours sous ce nom"""
+    handle = getattr(response.response, "file", None)
+    name = getattr(handle, "name", None)
+    if not isinstance(name, str):
+        return None
+    try:
+        opened = os.fstat(handle.fileno())
+        current = os.stat(name)
+    except (OSError, ValueError, AttributeError):
+        return None
+    # Fichier supprimé ou remplacé depuis son ouverture
+    if (opened.st_dev, opened.st_ino) != (current.st_dev, current.st_ino):
+        return None
+    return name
+
+
+class _TeeIterable:
+    """
+    Recopie le corps pendant l'envoi ; à la fermeture, termine la copie si
+    le client a abandonné, puis valide le fichier conservé.
+    """
+
+    def __init__(self, iterable, store: "OutputStore", output_id: str):
+        self._iterator = iter(iterable)
+        self._iterable = iterable
+        self._store = store
+        self._output_id = output_id
+        self._tmp = store._partial_path(output_id)
+        self._out = open(self._tmp, "wb")
+
+    def __iter__(self):
+        for chunk in self._iterator:
+            self._write(chunk)
+            yield chunk
+
+    def _write(self, chunk):
+        if self._out is None:
+            return
+        try:
+            self._out.write(chunk)
+        except OSError as e:
+            logger.warning(f"[outputs] copie abandonnée : {e}")
+            self._out.close()
+            self._out = None
+            self._tmp.unlink(missing_ok=True)
+
+    def close(self):
+        try:
+            if self._out is not None:
+                for chunk in self._iterator:
+                    self._write(chunk)
+        finally:
+            close = getattr(self._iterable, "close", None)
+            if close is not None:
+                close()
+        if self._out is None:
+            self._store._discard(self._output_id)
+            return
+        self._out.close()
+        self._out = None
+        self._store._commit(self._output_id, self._tmp)
+
+
+class OutputStore:
+    def __init__(self, directory: Path = None, retention: int = None):
+        self.directory = Path(directory or AppConfig.TEMP_FOLDER / AppConfig.OUTPUTS_FOLDER)
+        self.retention = AppConfig.OUTPUT_RETENTION if retention is None else retention
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention > 0
+
+    def _data_path(self, output_id: str) -> Path:
+        return self.directory / f"{output_id}.bin"
+
+    def _meta_path(self, output_id: str) -> Path:
+        return self.directory / f"{output_id}.json"
+
+    def _partial_path(self, output_id: str) -> Path:
+        return self.directory / f"{output_id}.partial"
+
+    def _discard(self, output_id: str):
+        for path in (self._partial_path(output_id), self._data_path(output_id), self._meta_path(output_id)):
+            path.unlink(missing_ok=True)
+
+    def _commit(self, output_id: str, tmp: Path):
+        try:
+            os.replace(tmp, self._data_path(output_id))
+        except OSError as e:
+            logger.warning(f"[outputs] fichier non conservé : {e}")
+            self._discard(output_id)
+
+    def _purge_expired(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge < PURGE_INTERVAL or not self.directory.exists():
+                return
+            self._last_purge = now
+        limit = now - self.retention
+        for path in self.directory.iterdir():
+            try:
+                if path.stat().st_mtime < limit:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+    # --- capture --------------------------------------------------------
+
+    def register(self):
+        """
+        Crochet before_request : capture() passe en tête des fonctions
+        after_this_request de la requête, donc avant les nettoyages
+        enregistrés ensuite par la route.
+        """
+        if self.enabled:
+            from flask import after_this_request
+            after_this_request(self.capture)
+
+    def capture(self, response):
+        """
+        Crochet after_this_request (register) : conserve le corps d'une réponse d'opération
+        (POST, 200 en pièce jointe) et y ajoute ETag et Content-Location.
+        """
+        if not self.enabled:
+            return response
+        from flask import request, url_for
+        from managers.job_manager import current_job_id
+
+        disposition = response.headers.get("Content-Disposition", "")
+        if (request.method != "POST" or response.status_code != 200
+                or "attachment" not in disposition
+                or current_job_id() is not None):
+            # Le résultat d'une tâche asynchrone est déjà conservé par la tâche
+            return response
+
+        from werkzeug.http import parse_options_header
+        self._purge_expired()
+        output_id = uuid.uuid4().hex
+        etag = response.get_etag()[0] or output_id
+        _, options = parse_options_header(disposition)
+        meta = {
+            "filename": options.get("filename") or "resultat",
+            "mimetype": response.mimetype,
+            "etag": etag,
+            # En-têtes propres au résultat, renvoyés avec le fichier conservé
+            "headers": {k: v for k, v in response.headers.items()
+                        if k.startswith("X-") and k != "X-Cache"},
+            "created_at": time.time(),
+        }
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self._meta_path(output_id), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+            source = _source_path(response)
+            linked = False
+            if source is not None:
+                try:
+                    os.link(source, self._data_path(output_id))
+                    linked = True
+                except OSError:
+                    # Autre système de fichiers : copie au fil de l'envoi
+                    pass
+            if not linked:
+                response.response = _TeeIterable(response.response, self, output_id)
+                response.direct_passthrough = False
+        except OSError as e:
+            logger.warning(f"[outputs] fichier non conservé : {e}")
+            self._discard(output_id)
+            return response
+
+        response.set_etag(etag)
+        response.headers["Content-Location"] = url_for("api.output_download", output_id=output_id)
+        return response
+
+    # --- lecture --------------------------------------------------------
+
+    def get(self, output_id: str) -> Optional[dict]:
+        """
+        Métadonnées d'un fichier conservé ; "path" vaut None tant que sa
+        copie n'est pas terminée. None s'il est inconnu ou expiré.
+        """
+        if not _OUTPUT_ID.match(output_id or ""):
+            return None
+        try:
+            with open(self._meta_path(output_id), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - meta["created_at"] > self.retention:
+            self._discard(output_id)
+            return None
+        data_path = self._data_path(output_id)
+        meta["path"] = data_path if data_path.exists() else None
+        if meta["path"] is None and not self._partial_path(output_id).exists():
+            return None
+        return meta
+
+
+output_store = OutputStore()
@@ -0,0 +1,143 @@
+"""
+Encodage des pages envoyées au modèle de vision.
+
+call_gemini_vision envoyait chaque page telle que rendue (120 à 200 DPI,
+JPEG couleur) : le volume envoyé et la latence du modèle croissent avec le
+nombre de pixels alors que la lisibilité du texte plafonne bien avant.
+encode_page() analyse la page et choisit :
+
+- la résolution : hauteur des lignes de texte mesurée sur le profil
+  horizontal d'encre, réduite jusqu'à TARGET_LINE_PX pixels (seuil de
+  lisibilité), jamais agrandie, bornée par MIN_EDGE / MAX_EDGE ;
+- niveaux de gris ou couleur : couleur seulement si une part notable des
+  pixels est saturée (graphiques, tampons, surlignages) ;
+- le format : PNG à palette réduite pour une page aux aplats nets (PDF
+  bureautique), WebP (JPEG à défaut) pour un scan ou une photo, bruités.
+
+AppConfig.ADAPTIVE_PAGE_ENCODING = False rétablit l'envoi JPEG en l'état.
+"""
+
+import io
+import logging
+import statistics
+from typing import Tuple
+
+import numpy as np
+from PIL import Image, features
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+# Hauteur de ligne (pixels) suffisante pour la lecture par le modèle
+TARGET_LINE_PX = 20
+# Bornes du plus grand côté de l'image envoyée
+MIN_EDGE, MAX_EDGE = 1024, 2048
+# Côté de la miniature d'analyse
+THUMB_EDGE = 256
+# Écart max-min des composantes au-delà duquel un pixel est coloré, et part
+# de pixels colorés au-delà de laquelle la couleur est conservée
+CHROMA_THRESHOLD, COLOR_FRACTION = 32, 0.01
+# Part des pixels de la valeur de fond exacte : page aux aplats nets
+FLAT_FRACTION = 0.5
+# Couleurs de la palette PNG (niveaux de gris, couleur)
+PNG_GRAY_LEVELS, PNG_COLORS = 16, 64
+# Au-delà (octets par pixel), le PNG cède la place à l'encodage avec pertes
+PNG_MAX_BYTES_PER_PIXEL = 0.25
+LOSSY_QUALITY = 80
+HAS_WEBP = features.check("webp")
+
+
+class EncodedPage:
+    __slots__ = ("data", "mime_type", "size", "source_size", "grayscale")
+
+    def __init__(self, data: bytes, mime_type: str, size: Tuple[int, int],
+                 source_size: Tuple[int, int], grayscale: bool):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.source_size = source_size
+        self.grayscale = grayscale
+
+    def describe(self) -> str:
+        (w, h), (sw, sh) = self.size, self.source_size
+        mode = "gris" if self.grayscale else "couleur"
+        return f"{self.mime_type} {mode} {w}x{h} (rendu {sw}x{sh}), {len(self.data) // 1024} Ko"
+
+
+def _line_height(gray: Image.Image) -> float:
+    """Hauteur médiane des lignes d'encre (pixels de l'image), 0 si aucune"""
+    # Largeur réduite, hauteur conservée : une valeur par ligne de pixels
+    profile = np.asarray(gray.resize((THUMB_EDGE, gray.height), Image.BOX), dtype=np.int16)
+    background = int(np.median(profile))
+    inked = profile.min(axis=1) < background - 48
+    heights = []
+    run = 0
+    for row in inked:
+        if row:
+            run += 1
+        elif run:
+            heights.append(run)
+            run = 0
+    # Filets et illustrations écartés
+    heights = [h for h in heights if 4 <= h <= gray.height * 0.1]
+    return statistics.median(heights) if heights else 0.0
+
+
+def _scale(image: Image.Image, gray: Image.Image) -> float:
+    edge = max(image.size)
+    line = _line_height(gray)
+    scale = min(1.0, TARGET_LINE_PX / line) if line else min(1.0, MIN_EDGE / edge)
+    scale = max(scale, min(1.0, MIN_EDGE / edge))
+    return min(scale, MAX_EDGE / edge)
+
+
+def _lossy(image: Image.Image) -> Tuple[bytes, str]:
+    buffer = io.BytesIO()
+    if HAS_WEBP:
+        image.save(buffer, format="WEBP", quality=LOSSY_QUALITY, method=4)
+        return buffer.getvalue(), "image/webp"
+    image.save(buffer, format="JPEG", quality=LOSSY_QUALITY, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def encode_page(image: Image.Image) -> EncodedPage:
+    """Page encodée pour l'envoi au modèle (image RGB ou niveaux de gris)"""
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    source_size = image.size
+
+    if not AppConfig.ADAPTIVE_PAGE_ENCODING:
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG")
+        return EncodedPage(buffer.getvalue(), "image/jpeg", image.size, source_size, False)
+
+    thumb = image.copy()
+    thumb.thumbnail((THUMB_EDGE, THUMB_EDGE))
+    if image.mode == "RGB":
+        pixels = np.asarray(thumb, dtype=np.int16)
+        chroma = pixels.max(axis=2) - pixels.min(axis=2)
+        grayscale = (chroma > CHROMA_THRESHOLD).mean() < COLOR_FRACTION
+    else:
+        grayscale = True
+    histogram = thumb.convert("L").histogram()
+    flat = max(histogram) / (thumb.width * thumb.height) >= FLAT_FRACTION
+
+    gray = image.convert("L")
+    scale = _scale(image, gray)
+    encoded = gray if grayscale else image
+    del gray
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        encoded = encoded.resize(size, Image.LANCZOS)
+
+    data = None
+    if flat:
+        palette = encoded.quantize(PNG_GRAY_LEVELS if grayscale else PNG_COLORS)
+        buffer = io.BytesIO()
+        palette.save(buffer, format="PNG")
+        if buffer.tell() <= encoded.width * encoded.height * PNG_MAX_BYTES_PER_PIXEL:
+            data, mime_type = buffer.getvalue(), "image/png"
+    if data is None:
+        data, mime_type = _lossy(encoded)
+    return EncodedPage(data, mime_type, encoded.size, source_size, grayscale)
@@ -0,0 +1,161 @@
+"""
+Expressions de sélection de pages, compilées une fois pour toutes.
+
+Syntaxe (pages numérotées à partir de 1, termes séparés par des virgules) :
+    5          une page
+    2-8        un intervalle (bornes incluses, dans n'importe quel ordre)
+    10-        de la page 10 à la fin ;  -4  du début à la page 4
+    first      première page ;  last  dernière page ;  last-3  3 pages avant la dernière
+    1-last-2   intervalles avec références relatives à la fin
+    odd, even  pages impaires / paires
+    all        toutes les pages
+
+Exemple : "1-5,8,odd,last-3".
+
+Le résultat (PageSelection) garde les termes dans l'ordre de saisie, pour
+les opérations qui produisent un fichier par terme ou respectent l'ordre
+donné, et un masque d'appartenance pour un test `i in selection` en O(1).
+La compilation est linéaire en nombre de pages.
+"""
+
+import re
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+_REF = r"(?:\d+|first|last(?:\s*-\s*\d+)?)"
+_TERM = re.compile(rf"^({_REF})?\s*(-)?\s*({_REF})?$")
+_RUN = re.compile(rb"\x01+")
+
+# Référence de page : ("abs", n) ou ("last", k) pour la page total - k
+Ref = Tuple[str, int]
+
+
+class PageRangeError(ValueError):
+    """Expression de pages invalide"""
+
+
+def _parse_ref(text: Optional[str]) -> Optional[Ref]:
+    if text is None:
+        return None
+    if text == "first":
+        return ("abs", 1)
+    if text.startswith("last"):
+        offset = text[4:].replace("-", "").strip()
+        return ("last", int(offset) if offset else 0)
+    return ("abs", int(text))
+
+
+@lru_cache(maxsize=256)
+def parse_page_ranges(expression: str) -> tuple:
+    """
+    Analyse une expression en termes indépendants du nombre de pages :
+    ("all",), ("odd",), ("even",) ou ("range", début, fin).
+    Lève PageRangeError si un terme est invalide.
+    """
+    terms = []
+    for raw in expression.lower().split(","):
+        term = raw.strip()
+        if not term:
+            continue
+        if term in ("all", "*"):
+            terms.append(("all",))
+            continue
+        if term in ("odd", "even"):
+            terms.append((term,))
+            continue
+        match = _TERM.match(term)
+        if not match or not (match.group(1) or match.group(3)):
+            raise PageRangeError(f"Sélection de pages invalide : '{raw.strip()}'")
+        start, dash, end = match.groups()
+        start, end = _parse_ref(start), _parse_ref(end)
+        if dash is None:
+            end = start
+        terms.append(("range", start, end))
+    return tuple(terms)
+
+
+def _resolve(ref: Optional[Ref], total: int, default: int) -> int:
+    if ref is None:
+        return default
+    kind, value = ref
+    return total - value if kind == "last" else value
+
+
+def _term_range(term: tuple, total: int) -> range:
+    """Pages (index à partir de 0) désignées par un terme, bornées au document"""
+    kind = term[0]
+    if kind == "all":
+        return range(total)
+    if kind == "odd":
+        return range(0, total, 2)
+    if kind == "even":
+        return range(1, total, 2)
+    start = _resolve(term[1], total, 1)
+    end = _resolve(term[2], total, total)
+    if start > end:
+        start, end = end, start
+    return range(max(start, 1) - 1, min(end, total))
+
+
+class PageSelection:
+    """
+    Sélection de pages compilée pour un document de `total` pages.
+    Les index manipulés sont ceux de pypdf (à partir de 0).
+    """
+
+    __slots__ = ("total", "_groups", "_mask", "_count", "_intervals")
+
+    def __init__(self, groups: List[range], total: int):
+        self.total = total
+        self._groups = groups
+        self._mask = bytearray(total)
+        for group in groups:
+            if len(group):
+                self._mask[group.start:group.stop:group.step] = b"\x01" * len(group)
+        self._count = self._mask.count(1)
+        self._intervals = None
+
+    def __contains__(self, index) -> bool:
+        return isinstance(index, int) and 0 <= index < self.total and self._mask[index] == 1
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __bool__(self) -> bool:
+        return self._count > 0
+
+    def __iter__(self) -> Iterator[int]:
+        """Pages sélectionnées, croissantes et sans doublon, produites à la demande"""
+        for start, stop in self.intervals:
+            yield from range(start, stop)
+
+    def __repr__(self) -> str:
+        return f"PageSelection({self.intervals!r}, total={self.total})"
+
+    @property
+    def intervals(self) -> List[Tuple[int, int]]:
+        """Intervalles disjoints triés [début, fin[ couvrant la sélection"""
+        if self._intervals is None:
+            self._intervals = [m.span() for m in _RUN.finditer(self._mask)]
+        return self._intervals
+
+    def groups(self) -> List[range]:
+        """Un range par terme, dans l'ordre de saisie (vides exclus)"""
+        return [group for group in self._groups if len(group)]
+
+    def ordered(self) -> Iterator[int]:
+        """Pages dans l'ordre de saisie, doublons compris"""
+        for group in self._groups:
+            yield from group
+
+
+def compile_pages(expression: Optional[str], total: int, empty: str = "all") -> PageSelection:
+    """
+    Compile une expression pour un document de `total` pages.
+    Une expression vide sélectionne tout (`empty="all"`) ou rien (`empty="none"`).
+    Les pages hors du document sont ignorées.
+    """
+    terms = parse_page_ranges((expression or "").strip())
+    if not terms and empty == "all":
+        terms = (("all",),)
+    return PageSelection([_term_range(term, total) for term in terms], total)
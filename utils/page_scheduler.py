@@ -0,0 +1,173 @@
+"""
+Traitement concurrent des pages d'un document (appels au modèle de vision).
+
+Les conversions PDF→TXT/HTML/Excel rendent une page puis attendent la
+réponse de Gemini avant de passer à la suivante : 40 pages coûtent 40 fois
+la latence du modèle, et le processeur reste inactif pendant l'appel réseau.
+map_pages() enchaîne deux étages :
+
+- rendu : un thread rend les pages dans l'ordre (render), en avance sur le
+  modèle ; au plus `inflight` + `prefetch` pages rendues et non traitées à
+  la fois, le rendu attend qu'une place se libère (mémoire bornée) ;
+- modèle : au plus `inflight` appels en cours (AppConfig.PAGE_INFLIGHT),
+  la page rendue suivante part dès qu'un appel se termine ;
+- délai par appel (AppConfig.PAGE_TIMEOUT) : une page trop lente est
+  déclarée en échec (PageTimeout) sans retenir les autres ;
+- échecs partiels : chaque page produit (page, résultat, erreur), à la
+  conversion de se rabattre sur l'extraction locale ;
+- résultats produits dans l'ordre des pages, dès que les précédentes sont
+  terminées.
+
+Les appels s'exécutent dans des threads (réseau : le GIL est libéré pendant
+l'attente). Le thread d'une page hors délai n'est pas interrompu : la page
+est déclarée en échec, mais sa place (page rendue, appel réseau) reste
+retenue jusqu'au retour de l'appel, dont le résultat est ignoré. Si les
+`inflight` places d'appel restent toutes retenues par des appels abandonnés
+pendant un délai supplémentaire, le modèle ne répond plus : les pages
+restantes sont déclarées hors délai sans être rendues.
+"""
+
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+_RENDERED, _DONE = "rendered", "done"
+
+
+class PageTimeout(TimeoutError):
+    """Page non traitée dans le délai imparti"""
+
+
+def _render_pages(render: Callable, pages: list, slots: threading.Semaphore,
+                  stopped: threading.Event, events: queue.Queue):
+    """Étage de rendu : une page à la fois, dans l'ordre, tant qu'une place est libre"""
+    for index, page in enumerate(pages):
+        slots.acquire()
+        if stopped.is_set():
+            return
+        try:
+            events.put((_RENDERED, index, render(page), None))
+        except Exception as e:
+            events.put((_RENDERED, index, None, e))
+
+
+def _call(fn: Callable, index: int, rendered, events: queue.Queue):
+    try:
+        events.put((_DONE, index, fn(rendered), None))
+    except Exception as e:
+        events.put((_DONE, index, None, e))
+
+
+def map_pages(fn: Callable, pages: Iterable, render: Optional[Callable] = None,
+              inflight: int = None, prefetch: int = None, timeout: float = None,
+              progress: Optional[Callable[[int, int], None]] = None
+              ) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """
+    Applique fn(render(page)) à chaque page (fn(page) sans `render`) et
+    produit (page, résultat, erreur) dans l'ordre des pages ; erreur vaut
+    None en cas de succès, l'exception levée ou PageTimeout sinon. Une page
+    dont le rendu vaut None produit (page, None, None) sans appel à fn.
+    `progress(terminées, total)` est appelée depuis le thread appelant
+    (report_progress).
+    """
+    pages = list(pages)
+    total = len(pages)
+    inflight = max(1, inflight or AppConfig.PAGE_INFLIGHT)
+    prefetch = AppConfig.PAGE_PREFETCH if prefetch is None else max(0, prefetch)
+    timeout = timeout or AppConfig.PAGE_TIMEOUT
+
+    events = queue.Queue()
+    # Pages rendues et non terminées : en attente du modèle ou en cours d'appel
+    slots = threading.Semaphore(inflight + prefetch)
+    stopped = threading.Event()
+    threading.Thread(
+        target=_render_pages, args=(render or (lambda page: page), pages, slots, stopped, events),
+        name="page-render", daemon=True,
+    ).start()
+
+    ready = deque()  # (index, page rendue) en attente d'un appel
+    running = {}  # index -> échéance
+    abandoned = set()  # pages hors délai dont l'appel n'est pas revenu
+    finished = {}  # index -> (résultat, erreur)
+    stalled = None  # échéance d'attente lorsque toutes les places d'appel sont abandonnées
+    emitted = completed = 0
+
+    def finish(index, result, error, release=True):
+        nonlocal completed
+        finished[index] = (result, error)
+        if release:
+            slots.release()
+        completed += 1
+        if progress is not None:
+            progress(completed, total)
+
+    try:
+        while emitted < total:
+            while ready and len(running) + len(abandoned) < inflight:
+                index = ready[0][0]
+                running[index] = time.monotonic() + timeout
+                threading.Thread(target=_call, args=(fn, *ready.popleft(), events),
+                                 name=f"page-{pages[index]}", daemon=True).start()
+
+            deadlines = list(running.values()) + ([stalled] if stalled else [])
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            try:
+                kind, index, value, error = events.get(timeout=wait_for)
+            except queue.Empty:
+                kind = None
+
+            if kind == _RENDERED and stopped.is_set():
+                # Rendue après l'abandon des pages restantes
+                pass
+            elif kind == _RENDERED:
+                if error is not None or value is None:
+                    finish(index, None, error)
+                else:
+                    ready.append((index, value))
+            elif kind == _DONE and index in running:
+                del running[index]
+                finish(index, value, error)
+            elif kind == _DONE and index in abandoned:
+                # Appel hors délai enfin revenu : résultat ignoré, sa place est rendue
+                abandoned.discard(index)
+                slots.release()
+            # Aucune référence à la page rendue ou au résultat hors des files
+            value = None
+
+            now = time.monotonic()
+            for index, deadline in list(running.items()):
+                if now >= deadline:
+                    logger.warning(f"[pages] page {pages[index]} hors délai ({timeout}s)")
+                    del running[index]
+                    abandoned.add(index)
+                    finish(index, None, PageTimeout(f"Page {pages[index]} hors délai ({timeout}s)"),
+                           release=False)
+
+            if len(abandoned) < inflight or stopped.is_set():
+                stalled = None
+            elif stalled is None:
+                stalled = now + timeout
+            elif now >= stalled:
+                logger.warning(f"[pages] {len(abandoned)} appel(s) sans réponse, pages restantes abandonnées")
+                stopped.set()
+                ready.clear()
+                for index in range(emitted, total):
+                    if index not in finished:
+                        finish(index, None, PageTimeout(f"Page {pages[index]} non traitée : modèle sans réponse"),
+                               release=False)
+
+            while emitted in finished:
+                result, error = finished.pop(emitted)
+                yield pages[emitted], result, error
+                emitted += 1
+    finally:
+        # Arrêt anticipé (exception de l'appelant) : libère l'étage de rendu
+        stopped.set()
+        slots.release(total)
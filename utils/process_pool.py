@@ -0,0 +1,438 @@
+"""
+Pool de processus pour les traitements lourds (pypdf, Pillow, PyMuPDF).
+
+Ces traitements tiennent le GIL : exécutés dans les threads gunicorn, ils
+bloquent toutes les autres requêtes du processus, /health compris. Le
+pool les exécute dans des processus dédiés :
+
+- processus bornés (AppConfig.PROCESS_POOL_WORKERS, 0 = exécution dans
+  le thread appelant), issus du serveur forkserver (modules préchargés),
+  une tâche à la fois chacun ;
+- recyclage d'un processus après AppConfig.PROCESS_POOL_MAX_TASKS tâches
+  contre la fragmentation et les fuites des bibliothèques C ;
+- affinité : une tâche sur un document déjà analysé va de préférence au
+  processus qui le garde dans son cache (blueprints/pdf/document_cache.py) ;
+- plafond mémoire par processus (RLIMIT_AS), dérivé de
+  AppConfig.MEMORY_BUDGET_MB : un document démesuré lève MemoryError dans
+  son processus au lieu de faire tuer le serveur web ;
+- isolation des incidents : une tâche hors délai voit son seul processus
+  tué (TimeoutError), un processus arrêté brutalement (OOM, segfault) ne
+  fait échouer que sa tâche (WorkerCrashed) ; le processus est remplacé à
+  la demande, les autres tâches en cours ne sont pas touchées ;
+- priorité abaissée (nice) : les threads web restent prioritaires ;
+- une tâche peut répartir une de ses étapes sur un pool local
+  (task_subpool), borné par l'appelant ;
+- avancement : une tâche transmet son avancement (notify_progress) au
+  thread qui l'attend.
+
+Les fonctions soumises, leurs arguments et leurs résultats doivent être
+sérialisables (fonctions de module, chemins de fichiers plutôt que flux
+ouverts).
+"""
+
+import os
+import time
+import logging
+import threading
+import multiprocessing
+import multiprocessing.util
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from config import AppConfig
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Documents récents retenus par processus pour diriger les tâches suivantes
+AFFINITY_KEYS = 16
+
+_IN_WORKER = False
+# Liaison du processus avec le processus web, pour les avancements (notify_progress)
+_connection = None
+_send_lock = threading.Lock()
+
+
+class WorkerCrashed(RuntimeError):
+    """Le processus qui exécutait la tâche s'est arrêté brutalement"""
+
+
+def in_worker() -> bool:
+    """Vrai dans un processus du pool (pas de pool imbriqué)"""
+    return _IN_WORKER
+
+
+def notify_progress(*progress):
+    """
+    Dans un processus du pool, transmet un avancement de la tâche en cours
+    au `progress` de run() ; sans effet ailleurs.
+    """
+    if _connection is None:
+        return
+    with _send_lock:
+        _connection.send(("progress", progress))
+
+
+def worker_memory_mb(workers: int) -> int:
+    """
+    Plafond d'espace d'adressage d'un processus : valeur imposée par
+    AppConfig.PROCESS_WORKER_MEMORY_MB, sinon l'espace d'un processus au
+    démarrage plus sa part du budget mémoire des conversions.
+    """
+    if AppConfig.PROCESS_WORKER_MEMORY_MB:
+        return AppConfig.PROCESS_WORKER_MEMORY_MB
+    return AppConfig.PROCESS_WORKER_BASE_MB + AppConfig.MEMORY_BUDGET_MB // max(1, workers)
+
+
+def _init_worker(memory_mb: int, nice: int):
+    global _IN_WORKER
+    _IN_WORKER = True
+    if memory_mb and resource is not None:
+        limit = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError) as e:
+            logger.warning(f"[pool] plafond mémoire non appliqué : {e}")
+    if nice:
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+def _die_with_parent():
+    """Linux : processus tué avec son parent (PR_SET_PDEATHSIG)"""
+    try:
+        import ctypes
+        import signal
+        ctypes.CDLL(None).prctl(1, signal.SIGKILL)
+    except (OSError, AttributeError):
+        pass
+
+
+def _init_subworker():
+    global _IN_WORKER, _connection
+    _IN_WORKER = True
+    # La liaison héritée reste au processus de la tâche
+    _connection = None
+    # Une tâche hors délai est tuée : ses sous-processus ne lui survivent pas
+    _die_with_parent()
+
+
+@contextmanager
+def task_subpool(workers: int):
+    """
+    Pool local à une tâche, ouvert depuis un processus du pool pour en
+    paralléliser une étape (recodage des images). Processus créés par fork
+    avant tout thread : ils partagent le document déjà chargé en copie sur
+    écriture et héritent du plafond mémoire de la tâche. Terminé à la
+    sortie du bloc, ou avec la tâche si elle est tuée.
+    """
+    if not _IN_WORKER:
+        raise RuntimeError("task_subpool() s'utilise dans un processus du pool")
+    pool = multiprocessing.get_context("fork").Pool(workers, initializer=_init_subworker)
+    try:
+        yield pool
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _worker_main(connection, memory_mb: int, nice: int):
+    """Boucle d'un processus du pool : une tâche à la fois, jusqu'à son retrait"""
+    global _connection
+    _init_worker(memory_mb, nice)
+    _connection = connection
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            # Processus web arrêté : plus personne n'attend de tâche
+            break
+        except Exception as e:
+            connection.send(("error", RuntimeError(f"Tâche illisible : {e}")))
+            continue
+        if task is None:
+            break
+        fn, args, kwargs = task
+        try:
+            outcome = ("ok", fn(*args, **kwargs))
+        except BaseException as e:
+            outcome = ("error", e)
+        del task
+        with _send_lock:
+            try:
+                connection.send(outcome)
+            except Exception as e:
+                # Résultat ou exception non sérialisable (sérialisé avant tout envoi)
+                connection.send(("error", RuntimeError(f"{type(e).__name__}: {e}")))
+        del outcome
+    connection.close()
+
+
+def _context():
+    """
+    forkserver : plus léger que "spawn", les modules préchargés étant
+    partagés par les processus, et sans hériter des threads du serveur web
+    comme le ferait "fork".
+    """
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" not in methods:
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(AppConfig.PROCESS_POOL_PRELOAD)
+    return context
+
+
+class _Worker:
+    __slots__ = ("process", "connection", "tasks", "affinity")
+
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.tasks = 0
+        # Clés des derniers documents traités (cache des documents du processus)
+        self.affinity = deque(maxlen=AFFINITY_KEYS)
+
+
+class ProcessPool:
+    """Processus de calcul partagés, tués ou remplacés un par un"""
+
+    def __init__(self, workers: int = None, max_tasks: int = None,
+                 memory_mb: int = None, nice: int = None):
+        self.workers = AppConfig.PROCESS_POOL_WORKERS if workers is None else workers
+        self.max_tasks = AppConfig.PROCESS_POOL_MAX_TASKS if max_tasks is None else max_tasks
+        self.memory_mb = worker_memory_mb(self.workers) if memory_mb is None else memory_mb
+        self.nice = AppConfig.PROCESS_WORKER_NICE if nice is None else nice
+        self._slots = threading.BoundedSemaphore(max(1, self.workers))
+        self._context = None
+        self._lock = threading.Lock()
+        self._idle = []
+        self._all = set()
+        self._pid = os.getpid()
+        self.tasks = 0
+        self.running = 0
+        self.crashes = 0
+        self.timeouts = 0
+        self.recycled = 0
+        # Avant que multiprocessing n'attende ses processus enfants, à la sortie
+        multiprocessing.util.Finalize(self, self.shutdown, exitpriority=10)
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0 and not _IN_WORKER
+
+    def _count(self, counter: str, delta: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + delta)
+
+    def _spawn(self) -> _Worker:
+        if self._context is None:
+            self._context = _context()
+        connection, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child, self.memory_mb, self.nice),
+            name="pool-worker",
+            # Non démon : une tâche peut ouvrir un task_subpool()
+            daemon=False,
+        )
+        process.start()
+        child.close()
+        worker = _Worker(process, connection)
+        with self._lock:
+            self._all.add(worker)
+        return worker
+
+    def _checkout(self, affinity: Optional[str]) -> _Worker:
+        """Processus libre, de préférence celui qui a déjà traité `affinity`"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Processus gunicorn issu d'un fork : ceux du parent ne sont pas à lui
+                self._idle, self._all, self._pid = [], set(), os.getpid()
+            for i, worker in enumerate(self._idle):
+                if affinity is not None and affinity in worker.affinity:
+                    return self._idle.pop(i)
+            if self._idle:
+                return self._idle.pop(0)
+        return self._spawn()
+
+    def _checkin(self, worker: _Worker):
+        if worker.tasks >= self.max_tasks:
+            # Recyclage contre la fragmentation et les fuites des bibliothèques C
+            self._count("recycled")
+            self._retire(worker)
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                self._idle.append(worker)
+                return
+        self._retire(worker)
+
+    def _retire(self, worker: _Worker, kill: bool = False):
+        """Arrête un processus : retrait demandé, ou tué s'il exécute une tâche"""
+        with self._lock:
+            self._all.discard(worker)
+        if kill:
+            worker.process.kill()
+        else:
+            try:
+                worker.connection.send(None)
+            except (OSError, ValueError):
+                pass
+        worker.connection.close()
+        worker.process.join(timeout=None if kill else 5)
+        if worker.process.exitcode is None:
+            worker.process.kill()
+            worker.process.join()
+        worker.process.close()
+
+    def _execute(self, worker: _Worker, fn: Callable, args: tuple, kwargs: dict,
+                 timeout: float, progress: Optional[Callable] = None):
+        """Exécute une tâche sur `worker` ; seul ce processus est tué en cas d'incident"""
+        name = getattr(fn, "__qualname__", fn)
+        deadline = time.monotonic() + timeout
+        try:
+            worker.connection.send((fn, args, kwargs))
+        except BrokenPipeError:
+            raise
+        except Exception:
+            # Tâche non sérialisable : rien n'a été envoyé, le processus reste sain
+            self._checkin(worker)
+            raise
+        while True:
+            # Lisible à chaque envoi (avancement, résultat) ou à la fin du processus
+            if not worker.connection.poll(max(0.0, deadline - time.monotonic())):
+                pid = worker.process.pid
+                self._count("timeouts")
+                self._retire(worker, kill=True)
+                logger.error(f"[pool] {name} hors délai ({timeout:.0f}s), processus {pid} tué")
+                raise TimeoutError(f"Traitement interrompu après {timeout:.0f}s")
+            try:
+                status, value = worker.connection.recv()
+            except EOFError:
+                pid = worker.process.pid
+                worker.process.join()
+                exitcode = worker.process.exitcode
+                self._count("crashes")
+                self._retire(worker, kill=True)
+                logger.error(f"[pool] processus {pid} arrêté pendant {name} (code {exitcode})")
+                raise WorkerCrashed("Le traitement a été interrompu (mémoire insuffisante ?)")
+            if status != "progress":
+                break
+            if progress is not None:
+                try:
+                    progress(*value)
+                except Exception as e:
+                    logger.debug(f"[pool] avancement de {name} ignoré : {e}")
+        worker.tasks += 1
+        self._checkin(worker)
+        if status == "error":
+            raise value
+        return value
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None,
+            affinity: Optional[str] = None, progress: Optional[Callable] = None, **kwargs):
+        """
+        Exécute fn(*args, **kwargs) dans un processus du pool et retourne son
+        résultat ; les exceptions de la tâche sont relancées telles quelles.
+        Le délai couvre l'attente d'une place et l'exécution. `affinity`
+        (clé d'un DocumentSource) dirige la tâche vers le processus qui a
+        déjà analysé ce document, s'il est libre. `progress` reçoit, dans le
+        thread appelant, les avancements transmis par notify_progress().
+        Sans pool (désactivé, ou appel depuis un processus du pool), exécution
+        directe dans le thread appelant.
+        """
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        if timeout is None:
+            timeout = AppConfig.CONVERSION_TIMEOUT
+        deadline = time.monotonic() + timeout
+        self._count("tasks")
+        if not self._slots.acquire(timeout=timeout):
+            self._count("timeouts")
+            raise TimeoutError(f"Aucun processus disponible après {timeout}s")
+        self._count("running")
+        try:
+            worker = self._checkout(affinity)
+            if affinity is not None:
+                worker.affinity.append(affinity)
+            try:
+                return self._execute(worker, fn, args, kwargs, deadline - time.monotonic(), progress)
+            except BrokenPipeError:
+                # Processus libre arrêté entre deux tâches : un neuf le remplace
+                self._retire(worker, kill=True)
+                worker = self._spawn()
+                return self._execute(worker, fn, args, kwargs, deadline - time.monotonic(), progress)
+        finally:
+            self._count("running", -1)
+            self._slots.release()
+
+    def shutdown(self):
+        """Arrête les processus de ce processus web (sortie de l'interpréteur)"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            idle, busy = list(self._idle), self._all - set(self._idle)
+            self._idle = []
+        for worker in idle:
+            self._retire(worker)
+        for worker in busy:
+            worker.process.kill()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """run() dans un thread : la future porte le résultat ou l'exception"""
+        future = Future()
+
+        def target():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.run(fn, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=target, name="pool-submit", daemon=True).start()
+        return future
+
+    def imap_unordered(self, fn: Callable, items: Iterable[Tuple[object, object]],
+                       inflight: int) -> Iterator[Tuple[object, Future]]:
+        """
+        Applique fn à chaque argument de `items` (paires (clé, argument)),
+        au plus `inflight` tâches en vol : les arguments sont préparés à la
+        demande. Produit (clé, future terminée) dans l'ordre d'achèvement.
+        """
+        pending = {}
+        for key, arg in items:
+            pending[self.submit(fn, arg)] = key
+            if len(pending) >= inflight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "enabled": self.enabled,
+            "memory_mb": self.memory_mb,
+            "tasks": self.tasks,
+            "running": self.running,
+            "crashes": self.crashes,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled,
+            "idle": len(self._idle),
+        }
+
+
+process_pool = ProcessPool()
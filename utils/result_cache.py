@@ -0,0 +1,340 @@
+"""
+Cache disque des résultats d'opérations déterministes.
+
+Un même fichier revient souvent avec les mêmes options (double clic,
+nouvel essai après un téléchargement lent, lots identiques). Le résultat
+d'une opération est indexé par (opération, empreintes SHA-256 des
+fichiers reçus, paramètres du formulaire, AppConfig.VERSION) et conservé
+sous TEMP_FOLDER/RESULT_CACHE_FOLDER :
+
+- <clé>.bin : contenu envoyé au client ;
+- <clé>.json : nom de téléchargement, type MIME, en-têtes X-*, date ;
+  sa date de modification sert d'horodatage LRU.
+
+Le volume total est borné (AppConfig.RESULT_CACHE_MB, éviction des
+entrées les moins récemment servies) et chaque entrée expire après
+AppConfig.RESULT_CACHE_TTL. Un résultat déjà écrit sur disque est lié
+dans le cache (lien physique, sans copie) ; une réponse produite en flux
+est recopiée au fil de l'envoi et n'est retenue que si l'envoi est allé
+au bout. Les empreintes des fichiers reçus viennent de utils/uploads.py,
+calculées pendant la réception.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+# Champs du formulaire sans effet sur le résultat (un fichier désigné par
+# upload_id ou blob compte par son empreinte, pas par sa référence)
+IGNORED_FIELDS = {"csrf_token", "async", "operation", "upload_id", "blob"}
+# Nouvel inventaire du dossier au plus tard après cet intervalle (autres processus)
+RESCAN_INTERVAL = 60
+# L'éviction ramène le volume sous cette fraction du plafond
+EVICTION_TARGET = 0.9
+
+
+def _file_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def input_digest(item) -> Optional[str]:
+    """Empreinte d'un fichier reçu (FileStorage) ou d'un chemin ; None si refusé"""
+    if hasattr(item, "stream"):
+        from utils.uploads import spooled
+        upload = spooled(item)
+        # Contenu tronqué à la limite de taille : empreinte sans valeur
+        return None if upload.rejected else upload.sha256
+    return _file_digest(item)
+
+
+def result_key(operation: str, inputs: Iterable, params=None) -> Optional[str]:
+    """
+    Clé d'un résultat : opération, empreintes des entrées, paramètres,
+    version. None (pas de cache) si un fichier a été refusé à la réception.
+    """
+    digests = [input_digest(item) for item in inputs if item]
+    if None in digests:
+        return None
+    if params is not None and hasattr(params, "to_dict"):
+        params = params.to_dict(flat=False)
+    params = {k: v for k, v in (params or {}).items() if k not in IGNORED_FIELDS}
+    material = json.dumps({
+        "operation": operation,
+        "inputs": digests,
+        "params": params,
+        "version": AppConfig.VERSION,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _kept_headers(headers) -> dict:
+    return {k: v for k, v in (headers or {}).items() if k.startswith("X-") and k != "X-Cache"}
+
+
+class _TeeIterable:
+    """Recopie le corps d'une réponse dans le cache pendant son envoi"""
+
+    def __init__(self, iterable, cache: "ResultCache", key: str, meta: dict):
+        self._iterable = iterable
+        self._cache = cache
+        self._key = key
+        self._meta = meta
+        self._tmp = cache._tmp_path(key)
+        self._out = open(self._tmp, "wb")
+        self._complete = False
+
+    def __iter__(self):
+        for chunk in self._iterable:
+            if self._out is not None:
+                try:
+                    self._out.write(chunk)
+                except OSError as e:
+                    logger.warning(f"[result_cache] copie abandonnée : {e}")
+                    self._abandon()
+            yield chunk
+        self._complete = True
+
+    def _abandon(self):
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        self._tmp.unlink(missing_ok=True)
+
+    def close(self):
+        close = getattr(self._iterable, "close", None)
+        if close is not None:
+            close()
+        if self._out is None:
+            return
+        if not self._complete:
+            self._abandon()
+            return
+        self._out.close()
+        self._out = None
+        self._cache._commit(self._key, self._tmp, self._meta)
+
+
+class ResultCache:
+    def __init__(self, directory: Path = None, max_bytes: int = None, ttl: int = None):
+        self.directory = Path(directory or AppConfig.TEMP_FOLDER / AppConfig.RESULT_CACHE_FOLDER)
+        self.max_bytes = AppConfig.RESULT_CACHE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.ttl = AppConfig.RESULT_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self._last_scan = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _data_path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _tmp_path(self, key: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return self.directory / f"{key}.{uuid.uuid4().hex}.tmp"
+
+    def _remove(self, key: str):
+        self._meta_path(key).unlink(missing_ok=True)
+        self._data_path(key).unlink(missing_ok=True)
+
+    # --- lecture --------------------------------------------------------
+
+    def get(self, key: Optional[str]) -> Optional[dict]:
+        """Entrée valide (métadonnées + "path") ou None ; la marque comme récemment servie"""
+        if not self.enabled or key is None:
+            return None
+        meta_path = self._meta_path(key)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            expired = time.time() - meta["created_at"] > self.ttl
+            data_path = self._data_path(key)
+            if expired or not data_path.exists():
+                self._remove(key)
+                raise FileNotFoundError(key)
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        meta["path"] = data_path
+        return meta
+
+    def send(self, key: str, entry: dict):
+        """Réponse d'un résultat en cache, servie depuis le disque"""
+        from flask import send_file
+        response = send_file(
+            entry["path"],
+            mimetype=entry["mimetype"],
+            as_attachment=True,
+            download_name=entry["filename"],
+            etag=key[:32],
+            conditional=True,
+            max_age=0,
+        )
+        response.headers.update(entry.get("headers", {}))
+        response.headers["X-Cache"] = "HIT"
+        return response
+
+    # --- écriture -------------------------------------------------------
+
+    def store_file(self, key: Optional[str], path, filename: str, mimetype: str, headers=None):
+        """Retient un résultat écrit sur disque (lien physique, copie à défaut)"""
+        if not self.enabled or key is None:
+            return
+        tmp = self._tmp_path(key)
+        try:
+            try:
+                os.link(path, tmp)
+            except OSError:
+                shutil.copyfile(path, tmp)
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            logger.warning(f"[result_cache] résultat non retenu : {e}")
+            return
+        self._commit(key, tmp, {"filename": filename, "mimetype": mimetype,
+                                "headers": _kept_headers(headers)})
+
+    def capture(self, key: Optional[str], response):
+        """
+        Retient le corps d'une réponse Flask 200 en pièce jointe, recopié
+        pendant l'envoi. Retourne la réponse (inchangée si elle ne s'y prête pas).
+        """
+        if not self.enabled or key is None or response.status_code != 200:
+            return response
+        disposition = response.headers.get("Content-Disposition", "")
+        if "attachment" not in disposition:
+            return response
+        from werkzeug.http import parse_options_header
+        _, options = parse_options_header(disposition)
+        meta = {
+            "filename": options.get("filename") or "resultat",
+            "mimetype": response.mimetype,
+            "headers": _kept_headers(response.headers),
+        }
+        response.response = _TeeIterable(response.response, self, key, meta)
+        # Le corps passe par la recopie ; la fermeture de la réponse la valide
+        response.direct_passthrough = False
+        response.headers["X-Cache"] = "MISS"
+        return response
+
+    def _commit(self, key: str, tmp: Path, meta: dict):
+        try:
+            size = tmp.stat().st_size
+            if size > self.max_bytes:
+                tmp.unlink(missing_ok=True)
+                return
+            os.replace(tmp, self._data_path(key))
+            meta = dict(meta, created_at=time.time(), size=size)
+            meta_tmp = self._tmp_path(key)
+            with open(meta_tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(meta_tmp, self._meta_path(key))
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            logger.warning(f"[result_cache] résultat non retenu : {e}")
+            return
+
+        with self._lock:
+            self.stores += 1
+            if self._total_bytes is not None:
+                self._total_bytes += size
+            over = self._total_bytes is None or self._total_bytes > self.max_bytes
+            stale = time.monotonic() - self._last_scan > RESCAN_INTERVAL
+        if over or stale:
+            self._evict()
+
+    def _evict(self):
+        """Supprime les entrées expirées puis les moins récemment servies"""
+        now = time.time()
+        entries = []
+        for meta_path in self.directory.glob("*.json"):
+            key = meta_path.stem
+            try:
+                stat = meta_path.stat()
+                size = self._data_path(key).stat().st_size
+            except OSError:
+                self._remove(key)
+                continue
+            entries.append((stat.st_mtime, key, size))
+
+        total = 0
+        kept = []
+        for last_used, key, size in entries:
+            if now - last_used > self.ttl:
+                # Expirée faute d'avoir été servie (la date de création est vérifiée à la lecture)
+                self._remove(key)
+                with self._lock:
+                    self.evictions += 1
+                continue
+            kept.append((last_used, key, size))
+            total += size
+
+        if total > self.max_bytes:
+            for last_used, key, size in sorted(kept):
+                if total <= self.max_bytes * EVICTION_TARGET:
+                    break
+                self._remove(key)
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+
+        # Fichiers temporaires abandonnés (processus interrompu)
+        for tmp in self.directory.glob("*.tmp"):
+            try:
+                if now - tmp.stat().st_mtime > self.ttl:
+                    tmp.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+        with self._lock:
+            self._total_bytes = total
+            self._last_scan = time.monotonic()
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        with self._lock:
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes or 0,
+                "max_bytes": self.max_bytes,
+            }
+
+
+result_cache = ResultCache()
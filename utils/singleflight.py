@@ -0,0 +1,185 @@
+"""
+Regroupement des conversions identiques simultanées (single-flight).
+
+Un lien partagé amène plusieurs personnes à envoyer le même PDF au même
+moment : sans regroupement, chaque envoi lance sa propre conversion (et ses
+appels Gemini). Les requêtes de même clé (empreintes des fichiers reçus +
+paramètres, voir utils/result_cache.result_key) arrivées pendant qu'une
+conversion est en cours attendent son résultat au lieu d'en lancer une autre :
+
+- la première requête (meneuse) exécute la conversion ;
+- si d'autres attendent à la fin, la réponse (200 en pièce jointe) est
+  écrite une fois sur disque puis envoyée à chacune ;
+- un échec de la meneuse (exception, erreur, redirection) n'est pas
+  partagé : chaque requête en attente exécute alors sa propre conversion.
+
+Le regroupement vaut pour les threads d'un processus ; entre processus
+gunicorn, le cache des résultats prend le relais une fois la première
+conversion terminée.
+"""
+
+import uuid
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+# Attente au-delà de la durée maximale d'une conversion : la meneuse a été perdue
+WAIT_MARGIN = 30
+
+
+def _shareable(response) -> bool:
+    headers = getattr(response, "headers", None)
+    if headers is None or getattr(response, "status_code", None) != 200:
+        return False
+    return "attachment" in headers.get("Content-Disposition", "")
+
+
+class _SharedResult:
+    """Réponse de la meneuse écrite sur disque, supprimée après le dernier envoi"""
+
+    def __init__(self, path: Path, filename: str, mimetype: str, headers: dict, readers: int):
+        self.path = path
+        self.filename = filename
+        self.mimetype = mimetype
+        self.headers = headers
+        self._readers = readers
+        self._lock = threading.Lock()
+
+    def send(self):
+        from flask import send_file
+        try:
+            # send_file ouvre le fichier : il peut être supprimé ensuite
+            response = send_file(
+                self.path,
+                mimetype=self.mimetype,
+                as_attachment=True,
+                download_name=self.filename,
+            )
+        finally:
+            self.release()
+        response.headers.update(self.headers)
+        return response
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            last = self._readers <= 0
+        if last:
+            self.path.unlink(missing_ok=True)
+
+
+class _Flight:
+    __slots__ = ("event", "waiters", "result")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.waiters = 0
+        self.result: Optional[_SharedResult] = None
+
+
+class SingleFlight:
+    def __init__(self, directory: Path = None, timeout: float = None):
+        self.directory = Path(directory or AppConfig.get_conversion_temp_dir())
+        self.timeout = AppConfig.CONVERSION_TIMEOUT + WAIT_MARGIN if timeout is None else timeout
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def run(self, key: Optional[str], compute: Callable):
+        """
+        Retourne compute(), ou la réponse d'une exécution en cours de même
+        clé. Sans clé (None), compute() est appelée directement.
+        """
+        if key is None:
+            return compute()
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            return self._follow(key, flight, compute)
+
+        try:
+            response = compute()
+        except BaseException:
+            self._land(key, flight)
+            raise
+        return self._land(key, flight, response)
+
+    def _land(self, key: str, flight: _Flight, response=None):
+        """Fin de l'exécution : partage la réponse avec les requêtes en attente"""
+        with self._lock:
+            self._flights.pop(key, None)
+            waiters = flight.waiters
+        try:
+            if waiters and _shareable(response):
+                flight.result = self._materialize(response, waiters + 1)
+                response = flight.result.send()
+        finally:
+            flight.event.set()
+        return response
+
+    def _materialize(self, response, readers: int) -> _SharedResult:
+        from werkzeug.http import parse_options_header
+        _, options = parse_options_header(response.headers.get("Content-Disposition", ""))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{uuid.uuid4().hex}.shared"
+        try:
+            with open(path, "wb") as out:
+                for chunk in response.iter_encoded():
+                    out.write(chunk)
+        finally:
+            response.close()
+        return _SharedResult(
+            path,
+            options.get("filename") or "resultat",
+            response.mimetype,
+            {k: v for k, v in response.headers.items() if k.startswith("X-") and k != "X-Cache"},
+            readers,
+        )
+
+    def _follow(self, key: str, flight: _Flight, compute: Callable):
+        if not flight.event.wait(self.timeout):
+            with self._lock:
+                abandoned = self._flights.get(key) is flight
+                if abandoned:
+                    flight.waiters -= 1
+            if abandoned:
+                logger.warning(f"[singleflight] attente de {key[:12]} dépassée, conversion relancée")
+            else:
+                # Réponse en cours d'écriture : cette requête est déjà comptée
+                flight.event.wait()
+        if flight.event.is_set() and flight.result is not None:
+            with self._lock:
+                self.coalesced += 1
+            response = flight.result.send()
+            response.headers["X-Coalesced"] = "1"
+            return response
+        with self._lock:
+            self.fallbacks += 1
+        return compute()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "fallbacks": self.fallbacks,
+            }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,240 @@
+"""
+Extraction locale des pages dont la couche texte est exploitable.
+
+Les conversions PDF→TXT/HTML/Excel envoyaient chaque page au modèle de
+vision, y compris celles d'un PDF bureautique dont le texte est déjà
+parfait ; pdfplumber ne servait qu'en secours. Chaque page est d'abord
+examinée :
+
+- densité : assez de caractères pour une page de texte (MIN_CHARS) ;
+- lisibilité : glyphes traduits en caractères réels, sans "(cid:N)", zone
+  privée ni caractère de remplacement (MIN_READABLE) ;
+- image : pas d'image couvrant l'essentiel de la page (scan, éventuellement
+  doublé d'une couche OCR de qualité inconnue) ;
+- mise en page : pas de colonnes multiples, que la lecture ligne à ligne
+  mélangerait.
+
+Une page retenue est reconstruite localement à partir des mots et tableaux
+de pdfplumber : titres (taille de police), paragraphes (écarts verticaux),
+listes (puces, numéros) et tableaux, dans l'ordre de lecture. Les autres
+pages (scannées, illisibles, complexes) partent au modèle.
+"""
+
+import re
+import logging
+import statistics
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import pdfplumber
+except ImportError:
+    pdfplumber = None
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+# Caractères en deçà desquels la page est vide ou scannée
+MIN_CHARS = 40
+# Part minimale de caractères lisibles
+MIN_READABLE = 0.9
+# Part de la page couverte par des images au-delà de laquelle c'est un scan
+MAX_IMAGE_COVERAGE = 0.5
+# Part des lignes coupées au centre de la page (gouttière) : plusieurs colonnes
+MAX_SPLIT_LINES = 0.4
+# Taille de police relative au corps du texte : titre, titre principal
+TITLE_RATIO, HEADING_RATIO = 1.2, 1.6
+# Écart entre deux lignes, relatif à l'interligne habituel de la page, qui
+# sépare deux paragraphes ; ligne plus courte que la justification : fin de paragraphe
+PARAGRAPH_GAP = 1.5
+SHORT_LINE = 0.85
+
+# Puce : symbole, glyphe sans correspondance Unicode "(cid:N)" ou numéro
+_BULLET = re.compile(r"^\s*(?:(?:[•▪◦●‣■□➢►]|\(cid:\d+\))\s*|[–—\-\*]\s+|(\d{1,3}|[a-z])[.)]\s+)")
+_CID = re.compile(r"\(cid:\d+\)")
+
+
+def _readable(text: str) -> bool:
+    if len(text) != 1:
+        # "(cid:N)" : glyphe sans correspondance Unicode
+        return False
+    if text == "�":
+        return False
+    return unicodedata.category(text) not in ("Co", "Cn", "Cc") or text in "\t\n"
+
+
+def _image_coverage(page) -> float:
+    area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for image in page.images:
+        width = min(image["x1"], page.width) - max(image["x0"], 0)
+        height = min(image["bottom"], page.height) - max(image["top"], 0)
+        if width > 0 and height > 0:
+            covered += width * height
+    return min(1.0, covered / area)
+
+
+def _line_size(line: dict) -> float:
+    sizes = [c["size"] for c in line.get("chars", []) if c.get("size")]
+    return statistics.median(sizes) if sizes else 0.0
+
+
+def _split_at_gutter(line: dict, page_width: float) -> bool:
+    """Ligne coupée par un large blanc autour du centre de la page"""
+    chars = sorted(line.get("chars", []), key=lambda c: c["x0"])
+    center = page_width / 2
+    for left, right in zip(chars, chars[1:]):
+        gap = right["x0"] - left["x1"]
+        if gap > max(20.0, 3 * (left.get("size") or 10)) and left["x1"] < center * 1.2 and right["x0"] > center * 0.8:
+            return True
+    return False
+
+
+def _unique_header(header: List[str]) -> List[str]:
+    seen = {}
+    names = []
+    for i, name in enumerate(header):
+        name = name or f"Colonne {i + 1}"
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name} ({seen[name]})")
+    return names
+
+
+def _table_block(table) -> Optional[dict]:
+    rows = [[" ".join((cell or "").split()) for cell in row] for row in table.extract()]
+    rows = [row for row in rows if any(row)]
+    if len(rows) < 2 or max(len(row) for row in rows) < 2:
+        return None
+    header = _unique_header(rows[0])
+    width = len(header)
+    return {
+        "type": "table",
+        "top": table.bbox[1],
+        "header": header,
+        "rows": [(row + [""] * width)[:width] for row in rows[1:]],
+    }
+
+
+def _text_blocks(lines: List[dict]) -> List[dict]:
+    """Titres, paragraphes et listes à partir des lignes de texte"""
+    lines = [line for line in lines if line["text"].strip()]
+    if not lines:
+        return []
+    sizes = [size for size in map(_line_size, lines) if size]
+    body_size = statistics.median(sizes) if sizes else 0.0
+    gaps = [b["top"] - a["bottom"] for a, b in zip(lines, lines[1:]) if b["top"] >= a["bottom"]]
+    leading = statistics.median(gaps) if gaps else 0.0
+    left = min(line["x0"] for line in lines)
+    right = max(line["x1"] for line in lines)
+    blocks = []
+    previous = None
+    for line in lines:
+        text = line["text"].strip()
+        size = _line_size(line)
+        height = max(line["bottom"] - line["top"], 1.0)
+        is_title = body_size and size >= body_size * TITLE_RATIO and len(text) < 150
+        bullet = _BULLET.match(text)
+        gap = line["top"] - previous["bottom"] if previous else 0.0
+        close = previous is not None and gap <= max(leading * PARAGRAPH_GAP, 0.25 * height) + 1
+        # Ligne précédente arrêtée avant la marge droite : fin de paragraphe
+        ended = previous is not None and previous["x1"] < left + (right - left) * SHORT_LINE
+        text = _CID.sub("", text[bullet.end():] if bullet else text).strip()
+        if not text:
+            continue
+        last = blocks[-1] if blocks else None
+
+        if is_title:
+            if last and last["type"] == "title" and close:
+                last["text"] += " " + text
+            else:
+                blocks.append({"type": "title", "top": line["top"], "text": text,
+                               "level": 1 if size >= body_size * HEADING_RATIO else 2})
+        elif bullet:
+            if last and last["type"] == "list" and gap <= max(leading * PARAGRAPH_GAP * 2, height):
+                last["items"].append(text)
+            else:
+                blocks.append({"type": "list", "top": line["top"], "items": [text],
+                               "ordered": bullet.group(1) is not None})
+        elif last and last["type"] == "list" and close and line["x0"] > previous["x0"] + 2:
+            # Suite d'un élément de liste sur la ligne suivante (retrait)
+            last["items"][-1] += " " + text
+        elif last and last["type"] == "paragraph" and close and not ended:
+            if last["text"].endswith("-") and text[:1].islower():
+                last["text"] = last["text"][:-1] + text
+            else:
+                last["text"] += " " + text
+        else:
+            blocks.append({"type": "paragraph", "top": line["top"], "text": text})
+        previous = line
+    return blocks
+
+
+def page_blocks(page) -> Tuple[Optional[List[dict]], str]:
+    """
+    Blocs d'une page pdfplumber dans l'ordre de lecture, ou None si elle
+    doit passer par le modèle ; le second élément en donne la raison.
+    Blocs : {"type": "title", "text", "level"}, {"type": "paragraph", "text"},
+    {"type": "list", "items", "ordered"}, {"type": "table", "header", "rows"}.
+    """
+    chars = page.chars
+    if len(chars) < MIN_CHARS:
+        return None, "peu de texte"
+    readable = sum(1 for c in chars if _readable(c["text"]))
+    if readable / len(chars) < MIN_READABLE:
+        return None, "texte illisible"
+    if _image_coverage(page) > MAX_IMAGE_COVERAGE:
+        return None, "image pleine page"
+
+    tables = [t for t in page.find_tables() if t.bbox]
+    blocks = [block for block in map(_table_block, tables) if block]
+    body = page
+    if tables:
+        boxes = [t.bbox for t in tables]
+
+        def outside(obj):
+            return not any(obj.get("x0", 0) >= x0 - 1 and obj.get("x1", 0) <= x1 + 1
+                           and obj.get("top", 0) >= top - 1 and obj.get("bottom", 0) <= bottom + 1
+                           for x0, top, x1, bottom in boxes)
+        body = page.filter(outside)
+
+    lines = body.extract_text_lines(return_chars=True, strip=True, x_tolerance=3, y_tolerance=3)
+    if len(lines) >= 10 and sum(_split_at_gutter(line, page.width) for line in lines) / len(lines) > MAX_SPLIT_LINES:
+        return None, "plusieurs colonnes"
+
+    blocks += _text_blocks(lines)
+    if not blocks:
+        return None, "aucun bloc"
+    blocks.sort(key=lambda block: block["top"])
+    for block in blocks:
+        del block["top"]
+    return blocks, "texte natif"
+
+
+def native_pages(path, page_numbers=None) -> Dict[int, List[dict]]:
+    """
+    {numéro de page (à partir de 1): blocs} des pages extraites localement ;
+    les pages absentes sont à confier au modèle.
+    """
+    if pdfplumber is None or not AppConfig.NATIVE_TEXT_PAGES:
+        return {}
+    pages = {}
+    reasons = {}
+    try:
+        with pdfplumber.open(str(path)) as pdf:
+            for number in page_numbers or range(1, len(pdf.pages) + 1):
+                page = pdf.pages[number - 1]
+                try:
+                    blocks, reason = page_blocks(page)
+                except Exception as e:
+                    blocks, reason = None, f"erreur ({e})"
+                finally:
+                    page.close()
+                reasons[reason] = reasons.get(reason, 0) + 1
+                if blocks is not None:
+                    pages[number] = blocks
+    except Exception as e:
+        logger.warning(f"[text_layer] couche texte illisible : {e}")
+        return {}
+    logger.info(f"[text_layer] {len(pages)} page(s) extraites localement : {reasons}")
+    return pages
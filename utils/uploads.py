@@ -0,0 +1,423 @@
+"""
+Réception des fichiers envoyés en un seul passage.
+
+Werkzeug écrit chaque fichier d'un formulaire multipart dans le flux que
+fournit Request._get_file_stream. UploadRequest y branche un
+SpooledUpload qui, au fil de l'écriture :
+
+- calcule l'empreinte SHA-256 ;
+- reconnaît le format d'après la signature (%PDF, PNG, JPEG, ZIP, OLE...)
+  complétée par l'extension pour les conteneurs (docx, xlsx, pptx...) ;
+- applique la limite de taille du format (AppConfig.get_max_size_for_format) :
+  au-delà, le contenu n'est plus conservé et toute lecture lève
+  UploadRejected (ValueError) ;
+- garde les petits fichiers en mémoire et écrit les autres dans un fichier
+  nommé sous TEMP_FOLDER/UPLOADS_FOLDER.
+
+Le fichier reçu est ensuite exposé sans nouvelle copie : chemin sur disque
+(pdf2image, LibreOffice), tampon mappé (mmap) ou flux positionnable (pypdf,
+PIL). claim_upload() le déplace dans un dossier de travail au lieu de le
+recopier.
+"""
+
+import io
+import os
+import re
+import mmap
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, Union
+
+from flask import Request
+
+from config import AppConfig
+
+logger = logging.getLogger(__name__)
+
+SNIFF_SIZE = 16
+# Champs de formulaire désignant un fichier déjà sur le serveur : envoi
+# fractionné finalisé, fichier conservé par empreinte
+UPLOAD_ID_FIELD = "upload_id"
+BLOB_FIELD = "blob"
+# Champ demandant la conservation des fichiers envoyés (réutilisables par blob=)
+KEEP_FIELD = "keep"
+# Clé de session de l'identifiant client, portée des fichiers conservés
+CLIENT_SESSION_KEY = "client_id"
+_CLIENT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Signature -> format (clés de AppConfig.get_max_size_for_format)
+SIGNATURES = (
+    (b"%PDF", "pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image"),
+    (b"\xff\xd8\xff", "image"),
+    (b"GIF87a", "image"),
+    (b"GIF89a", "image"),
+    (b"II*\x00", "image"),
+    (b"MM\x00*", "image"),
+    (b"BM", "image"),
+    (b"{\\rtf", "rtf"),
+    (b"PK\x03\x04", "zip"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "ole"),
+)
+# Conteneurs ZIP (OOXML, OpenDocument) et OLE (Office 97-2003) : le format
+# précis vient de l'extension
+CONTAINER_FORMATS = {"word", "excel", "powerpoint", "odt", "ods", "odp"}
+
+
+class UploadRejected(ValueError):
+    """Fichier refusé pendant la réception (taille maximale du format dépassée)"""
+
+
+def extension_format(filename: Optional[str]) -> Optional[str]:
+    """Format déclaré par l'extension (clés de AppConfig.SUPPORTED_FORMATS)"""
+    suffix = Path(filename or "").suffix.lower()
+    for format_type, extensions in AppConfig.SUPPORTED_FORMATS.items():
+        if suffix in extensions:
+            return format_type
+    return None
+
+
+def sniff_format(head: bytes, filename: Optional[str] = None) -> Optional[str]:
+    """Format d'après les premiers octets, l'extension départageant les conteneurs"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image"
+    for signature, format_type in SIGNATURES:
+        if head.startswith(signature):
+            if format_type in ("zip", "ole"):
+                declared = extension_format(filename)
+                return declared if declared in CONTAINER_FORMATS else format_type
+            return format_type
+    return None
+
+
+class SpooledUpload(io.RawIOBase):
+    """
+    Flux d'un fichier reçu : en mémoire jusqu'à AppConfig.UPLOAD_SPOOL_MEMORY,
+    puis dans un fichier nommé supprimé à la fermeture (sauf après claim).
+    """
+
+    def __init__(self, filename: Optional[str] = None, max_memory: int = None):
+        super().__init__()
+        self.filename = filename
+        self.max_memory = AppConfig.UPLOAD_SPOOL_MEMORY if max_memory is None else max_memory
+        self.size = 0
+        self.format: Optional[str] = None
+        self.rejected: Optional[str] = None
+        self._file = io.BytesIO()
+        self._path: Optional[Path] = None
+        self._owned = True
+        self._head = b""
+        self._sha256 = hashlib.sha256()
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def from_file(cls, path: Path, filename: str, sha256: Optional[str] = None,
+                  file_format: Optional[str] = None) -> "SpooledUpload":
+        """
+        Fichier déjà sur disque (envoi fractionné finalisé) exposé comme un
+        fichier reçu, sans copie ; il n'est ni déplacé ni supprimé.
+        """
+        upload = cls(filename)
+        upload._file = open(path, "rb")
+        upload._path = Path(path)
+        upload._owned = False
+        upload.size = os.fstat(upload._file.fileno()).st_size
+        upload._head = upload._file.read(SNIFF_SIZE)
+        upload._file.seek(0)
+        upload.format = file_format or sniff_format(upload._head, filename)
+        if sha256 is None:
+            for chunk in iter(lambda: upload._file.read(1024 * 1024), b""):
+                upload._sha256.update(chunk)
+            upload._file.seek(0)
+        else:
+            upload._digest = sha256
+        return upload
+
+    # --- écriture (analyse multipart) -----------------------------------
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        length = len(data)
+        if len(self._head) < SNIFF_SIZE:
+            self._head += bytes(data[:SNIFF_SIZE - len(self._head)])
+            self.format = sniff_format(self._head, self.filename)
+        self.size += length
+        if self.rejected:
+            return length
+
+        limit = AppConfig.get_max_size_for_format(self.format or "")
+        if self.size > limit:
+            self.rejected = f"Fichier trop volumineux (max {limit // (1024 * 1024)} MB)"
+            logger.warning(f"[upload] {self.filename} refusé : plus de {limit} octets")
+            self._discard()
+            return length
+
+        self._sha256.update(data)
+        if self._path is None and self.size > self.max_memory:
+            self._rollover()
+        return self._file.write(data)
+
+    def _rollover(self):
+        """Passage du tampon mémoire à un fichier nommé"""
+        directory = AppConfig.TEMP_FOLDER / AppConfig.UPLOADS_FOLDER
+        directory.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(dir=directory, suffix=Path(self.filename or "").suffix.lower())
+        spooled = os.fdopen(fd, "w+b")
+        spooled.write(self._file.getbuffer())
+        position = self._file.tell()
+        self._file.close()
+        spooled.seek(position)
+        self._file = spooled
+        self._path = Path(name)
+
+    def _discard(self):
+        self._file.close()
+        self._file = io.BytesIO()
+        if self._path is not None and self._owned:
+            self._path.unlink(missing_ok=True)
+        self._path = None
+
+    # --- lecture --------------------------------------------------------
+
+    def _check(self):
+        if self.rejected:
+            raise UploadRejected(self.rejected)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        self._check()
+        return self._file.read(size)
+
+    def readinto(self, buffer) -> int:
+        self._check()
+        return self._file.readinto(buffer)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def flush(self):
+        if not self._file.closed:
+            self._file.flush()
+
+    def fileno(self) -> int:
+        if self._path is None:
+            raise io.UnsupportedOperation("fichier reçu en mémoire")
+        return self._file.fileno()
+
+    @property
+    def sha256(self) -> str:
+        """Empreinte du contenu reçu (calculée pendant la réception)"""
+        if self._digest is None:
+            self._digest = self._sha256.hexdigest()
+        return self._digest
+
+    @property
+    def in_memory(self) -> bool:
+        return self._path is None
+
+    def as_path(self) -> Path:
+        """Chemin du contenu sur disque ; un fichier gardé en mémoire y est écrit une fois"""
+        self._check()
+        if self._path is None:
+            self._rollover()
+        self._file.flush()
+        return self._path
+
+    def as_buffer(self) -> Union[bytes, mmap.mmap]:
+        """Contenu sans copie : bytes partagés du tampon mémoire ou mmap en lecture seule"""
+        self._check()
+        if self._path is None:
+            return self._file.getvalue()
+        self._file.flush()
+        if self.size == 0:
+            return b""
+        return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def claim(self, directory: Path, name: str) -> Path:
+        """
+        Déplace le contenu dans `directory` sous `name` ; l'appelant en
+        devient responsable (il n'est plus supprimé à la fermeture).
+        """
+        target = Path(directory) / name
+        source = self.as_path()
+        if not self._owned:
+            # Déjà remis à un autre appelant, ou fichier conservé : lien physique, copie à défaut
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+            return target
+        try:
+            os.replace(source, target)
+        except OSError:
+            # Autre système de fichiers
+            shutil.copyfile(source, target)
+            source.unlink(missing_ok=True)
+        self._path = target
+        self._owned = False
+        return target
+
+    def close(self):
+        if self.closed:
+            return
+        self._file.close()
+        if self._path is not None and self._owned:
+            self._path.unlink(missing_ok=True)
+        super().close()
+
+
+class UploadRequest(Request):
+    """
+    Requête Flask dont les fichiers reçus sont des SpooledUpload, conservés
+    ensuite par empreinte (utils/blob_store.py).
+    Les fichiers déjà sur le serveur sont désignés par un champ du formulaire
+    et deviennent des fichiers reçus : upload_id (envoi fractionné finalisé,
+    voir managers/upload_manager.py) ou blob (empreinte SHA-256 d'un fichier
+    conservé) ; champ "files" pour plusieurs fichiers (fusion), "file" sinon.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload(filename)
+
+    def _load_form_data(self):
+        super()._load_form_data()
+        from utils.blob_store import blob_store
+        from managers.job_manager import current_job_id
+
+        # Conservation sur demande seulement : un envoi ordinaire ne laisse
+        # ni fichier ni cookie de session. Requête rejouée par une tâche :
+        # fichiers déjà conservés à l'envoi
+        replayed = current_job_id() is not None
+        if not replayed and self.form.get(KEEP_FIELD, "").lower() in ("1", "true", "on", "yes"):
+            owner = client_id()
+            for storage in self.files.values():
+                if isinstance(storage.stream, SpooledUpload):
+                    blob_store.add_upload(storage.stream, owner)
+
+        upload_ids = self.form.getlist(UPLOAD_ID_FIELD)
+        digests = self.form.getlist(BLOB_FIELD)
+        if not upload_ids and not digests:
+            return
+        owner = None if replayed else client_id(create=False)
+
+        from werkzeug.datastructures import FileStorage, ImmutableMultiDict, MultiDict
+        from werkzeug.exceptions import BadRequest
+        from managers.upload_manager import UploadError, upload_manager
+
+        files = MultiDict(self.files)
+        field = "files" if len(upload_ids) + len(digests) > 1 or "files" in files else "file"
+        stored = self.__dict__.setdefault("_stored_uploads", [])
+        for upload_id in upload_ids:
+            try:
+                upload = upload_manager.open(upload_id)
+            except UploadError as e:
+                raise BadRequest(f"{UPLOAD_ID_FIELD} {upload_id} : {e}")
+            stored.append(upload)
+            files.add(field, FileStorage(upload, filename=upload.filename, name=field))
+        for digest in digests:
+            upload = blob_store.open(digest.strip().lower(), owner) if owner else None
+            if upload is None:
+                raise BadRequest(f"{BLOB_FIELD} {digest} : fichier inconnu ou expiré, renvoyez-le")
+            stored.append(upload)
+            files.add(field, FileStorage(upload, filename=upload.filename, name=field))
+        self.__dict__["files"] = ImmutableMultiDict(files)
+
+    def close(self):
+        # Fichiers désignés par upload_id ou blob
+        for upload in self.__dict__.get("_stored_uploads", ()):
+            upload.close()
+        super().close()
+
+
+def client_id(create: bool = True) -> Optional[str]:
+    """
+    Identifiant du client, conservé dans sa session : les fichiers conservés
+    par empreinte ne sont visibles que de la session qui les a envoyés.
+    Créé à la première demande, sauf avec `create=False` (None s'il n'existe
+    pas encore : aucun cookie n'est alors posé).
+    """
+    from flask import session
+    value = session.get(CLIENT_SESSION_KEY)
+    if not _CLIENT_ID.match(value or ""):
+        if not create:
+            return None
+        value = uuid.uuid4().hex
+        session[CLIENT_SESSION_KEY] = value
+    return value
+
+
+def spooled(file) -> SpooledUpload:
+    """
+    SpooledUpload d'un FileStorage. Un fichier qui n'est pas passé par
+    UploadRequest (FileStorage construit à la main) est recopié une fois.
+    """
+    if isinstance(file.stream, SpooledUpload):
+        return file.stream
+    upload = SpooledUpload(file.filename)
+    file.stream.seek(0)
+    shutil.copyfileobj(file.stream, upload, 64 * 1024)
+    upload.seek(0)
+    file.stream = upload
+    return upload
+
+
+def upload_path(file) -> Path:
+    """Chemin sur disque du fichier reçu, sans copie s'il y est déjà"""
+    return spooled(file).as_path()
+
+
+def upload_buffer(file) -> Union[bytes, mmap.mmap]:
+    """Contenu du fichier reçu, sans copie"""
+    return spooled(file).as_buffer()
+
+
+def upload_stream(file) -> SpooledUpload:
+    """Flux positionnable du fichier reçu, rembobiné (pypdf, PIL)"""
+    upload = spooled(file)
+    upload._check()
+    upload.seek(0)
+    return upload
+
+
+def claim_upload(file, directory: Path, expected_format: Optional[str] = None) -> Path:
+    """
+    Valide le fichier reçu (non vide, taille, format attendu) et le déplace
+    dans `directory` sous un nom unique. Lève ValueError.
+    """
+    if not file or not file.filename:
+        raise ValueError("Fichier invalide")
+    upload = spooled(file)
+    upload._check()
+    if upload.size == 0:
+        raise ValueError("Fichier vide")
+    if expected_format and upload.format != expected_format:
+        raise ValueError("Fichier corrompu ou non-PDF" if expected_format == "pdf"
+                         else f"Le fichier n'est pas au format {expected_format}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return upload.claim(directory, f"{uuid.uuid4()}{Path(file.filename).suffix.lower()}")
+
+
+def save_upload(file, target: Path) -> Path:
+    """Copie le fichier reçu vers `target` (lien physique si possible)"""
+    upload = spooled(file)
+    source = upload.as_path()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+    return Path(target)
@@ -0,0 +1,136 @@
+"""
+Écriture d'archives ZIP en flux.
+
+Les entrées sont compressées au fur et à mesure qu'elles sont produites et
+l'archive est émise par morceaux : le premier octet part dès la première
+entrée et la mémoire ne dépend pas de la taille de l'archive.
+
+zipfile sait écrire dans un flux non « seekable » : il ajoute alors un
+descripteur de données après chaque entrée au lieu de revenir en arrière
+pour renseigner tailles et CRC.
+"""
+
+import os
+import zlib
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple, Union
+from urllib.parse import quote
+
+# Taille des morceaux émis
+ZIP_CHUNK_SIZE = 64 * 1024
+
+# Formats déjà compressés : les dégonfler coûte du CPU pour rien
+ALREADY_COMPRESSED = {
+    ".png", ".jpg", ".jpeg", ".webp", ".gif", ".zip", ".gz",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".mp3", ".mp4",
+}
+
+# Échantillon utilisé pour tester la compressibilité d'un contenu
+PROBE_SIZE = 64 * 1024
+# En dessous de ce gain, l'entrée est stockée sans compression
+MIN_DEFLATE_GAIN = 0.10
+
+# Une entrée : nom dans l'archive + contenu (bytes ou chemin sur disque)
+ZipEntry = Tuple[str, Union[bytes, str, Path]]
+
+
+class _ZipSink:
+    """Flux en écriture seule, non repositionnable, vidé entre deux écritures"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+    @property
+    def pending(self) -> int:
+        """Octets en attente (pas de __len__ : zipfile teste `if not self.fp`)"""
+        return len(self._buffer)
+
+
+def choose_compression(name: str, sample: bytes = b"") -> int:
+    """
+    Choisit ZIP_STORED ou ZIP_DEFLATED pour une entrée.
+    Les formats connus comme compressés sont stockés ; pour les autres
+    (PDF compris, dont les flux peuvent ne pas être compressés), un
+    échantillon est dégonflé et le gain mesuré.
+    """
+    if Path(name).suffix.lower() in ALREADY_COMPRESSED:
+        return zipfile.ZIP_STORED
+    if not sample:
+        return zipfile.ZIP_DEFLATED
+    sample = sample[:PROBE_SIZE]
+    gain = 1 - len(zlib.compress(sample, 1)) / len(sample)
+    return zipfile.ZIP_DEFLATED if gain >= MIN_DEFLATE_GAIN else zipfile.ZIP_STORED
+
+
+def _read_sample(path: Union[str, Path]) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(PROBE_SIZE)
+
+
+def iter_zip(entries: Iterable[ZipEntry], chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Générateur d'archive ZIP.
+    `entries` peut lui-même être un générateur : chaque entrée n'est
+    produite (rendue, découpée...) qu'au moment où elle est écrite.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for name, content in entries:
+            if isinstance(content, (bytes, bytearray)):
+                zf.writestr(name, content, compress_type=choose_compression(name, content))
+                if sink.pending >= chunk_size:
+                    yield sink.drain()
+                continue
+
+            size = os.path.getsize(content)
+            info = zipfile.ZipInfo.from_file(content, name)
+            info.compress_type = choose_compression(name, _read_sample(content))
+            with open(content, "rb") as src, \
+                    zf.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+                while True:
+                    block = src.read(chunk_size)
+                    if not block:
+                        break
+                    dest.write(block)
+                    if sink.pending >= chunk_size:
+                        yield sink.drain()
+            if sink.pending >= chunk_size:
+                yield sink.drain()
+    # Répertoire central écrit à la fermeture
+    yield sink.drain()
+
+
+def zip_response(chunks: Iterator[bytes], download_name: str, on_close=None):
+    """Réponse Flask diffusant une archive produite par iter_zip()"""
+    from flask import Response
+
+    try:
+        download_name.encode("ascii")
+        disposition = f'attachment; filename="{download_name}"'
+    except UnicodeEncodeError:
+        disposition = f"attachment; filename*=UTF-8''{quote(download_name)}"
+
+    response = Response(chunks, mimetype="application/zip",
+                        headers={"Content-Disposition": disposition})
+    if on_close is not None:
+        # Appelé par Werkzeug une fois le flux entièrement envoyé (ou interrompu)
+        response.call_on_close(on_close)
+    return response